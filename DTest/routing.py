@@ -1,8 +1,9 @@
 from django.urls import re_path
-from chat.consumers import ChatConsumer
+from chat.consumers import ChatConsumer, MultiplexConsumer
 from notifications.consumers import NotificationConsumer
 
 websocket_urlpatterns = [
+    re_path(r"ws/$", MultiplexConsumer.as_asgi()),
     re_path(r"ws/notifications/$", NotificationConsumer.as_asgi()),
     re_path(r"ws/chat/(?P<chat_id>\w+)/$", ChatConsumer.as_asgi()),
 ]
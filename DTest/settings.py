@@ -61,6 +61,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'users.middleware.ActorMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -120,8 +121,16 @@ ASGI_APPLICATION = "DTest.asgi.application"
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.CachedJWTAuthentication',
     ),
+    # Sliding-window limits (users.throttling), per IP for login/reset and per user otherwise
+    'DEFAULT_THROTTLE_RATES': {
+        'login': '10/min',
+        'password_reset': '5/hour',
+        'join_request': '20/hour',
+        'like': '60/min',
+        'chat_message': '60/min',
+    },
 }
 
 SIMPLE_JWT = {
@@ -180,6 +189,8 @@ EMAIL_USE_TLS = True
 EMAIL_USE_SSL = False
 EMAIL_HOST_USER = config('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD')
+# Seconds before a stuck SMTP operation fails; notifications.mailqueue sizes its lease from it
+EMAIL_TIMEOUT = config('EMAIL_TIMEOUT', default=30, cast=int)
 
 FRONTEND_URL = "http://localhost:5173"
 # Static files (CSS, JavaScript, Images)
@@ -237,6 +248,9 @@ CACHES = {
     }
 }
 
+# Insert chat messages in batches after broadcasting them (chat/writebehind.py, PostgreSQL only)
+CHAT_WRITE_BEHIND = config('CHAT_WRITE_BEHIND', default=False, cast=bool)
+
 CHANNEL_LAYERS = {
     "default": {
         "BACKEND": "channels_redis.core.RedisChannelLayer",
@@ -0,0 +1,47 @@
+"""
+daphne with permessage-deflate, for the WebSocket traffic (chat history and replay bursts).
+
+daphne does not negotiate WebSocket compression on its own. DeflateServer accepts a
+client's permessage-deflate offer through the autobahn factory daphne builds. Run it
+exactly like daphne:
+
+    python -m DTest.wsserver -b 0.0.0.0 -p 8000 DTest.asgi:application
+
+Each compressing socket keeps a zlib context. DEFLATE_MEM_LEVEL keeps it at about
+136 KB instead of zlib's default of about 384 KB, which costs little ratio on
+chat-sized frames.
+"""
+from autobahn.websocket.compress import PerMessageDeflateOffer, PerMessageDeflateOfferAccept
+from daphne.cli import CommandLineInterface
+from daphne.server import Server
+
+DEFLATE_MEM_LEVEL = 4
+
+
+def accept_deflate(offers):
+    """ perMessageCompressionAccept: the first permessage-deflate offer, or None for no compression """
+    for offer in offers:
+        if isinstance(offer, PerMessageDeflateOffer):
+            return PerMessageDeflateOfferAccept(offer, mem_level=DEFLATE_MEM_LEVEL)
+    return None
+
+
+class DeflateServer(Server):
+    def __init__(self, *args, ready_callable=None, **kwargs):
+        # run() builds ws_factory and calls ready_callable just before starting the reactor
+        self.next_ready_callable = ready_callable
+        super().__init__(*args, ready_callable=self.enable_deflate, **kwargs)
+
+    def enable_deflate(self):
+        # setProtocolOptions resets allowNullOrigin unless it is passed again; daphne sets it to True
+        self.ws_factory.setProtocolOptions(allowNullOrigin=True, perMessageCompressionAccept=accept_deflate)
+        if self.next_ready_callable:
+            self.next_ready_callable()
+
+
+class DeflateCommandLineInterface(CommandLineInterface):
+    server_class = DeflateServer
+
+
+if __name__ == "__main__":
+    DeflateCommandLineInterface.entrypoint()
@@ -1,6 +1,7 @@
 from django.contrib import admin
-from chat.models import Chat, Message, UserStatus
+from chat.models import Chat, Message, ReadWatermark, UserStatus
 
 admin.site.register(Chat)
 admin.site.register(Message)
 admin.site.register(UserStatus)
+admin.site.register(ReadWatermark)
@@ -1,70 +1,157 @@
 from channels.generic.websocket import AsyncWebsocketConsumer
+from functools import partial
 import json
-from chat.models import Chat, Message, UserStatus
-from django.utils import timezone
+import math
+from chat.db import run_db
+from chat.models import Chat, Message
+from chat.presence import presence
+from chat.protocol import ProtocolMixin, message_frame, typing_frame, with_frames
+from chat.receipts import ReadReceiptCoalescer
+from chat.replay import last_id_from_query, message_gap, message_items, replay_gap
+from chat.writebehind import message_buffer
+from django.conf import settings
 from django.contrib.auth import get_user_model
-import asyncio
+from notifications.counters import get_unread_counts, unread_count_event
+from notifications.replay import notification_gap, notification_items
+from users.throttling import ChatMessageRateThrottle
 
 User = get_user_model()
 
-async def run_sync(func, *args, **kwargs):
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, lambda: func(*args, **kwargs))
+# Close code for a socket to a chat the user does not take part in
+CLOSE_FORBIDDEN = 4403
 
 
-class ChatConsumer(AsyncWebsocketConsumer):
+def get_participant_ids(chat_id):
+    return set(Chat.participants.through.objects.filter(chat_id=chat_id).values_list("customuser_id", flat=True))
+
+
+def chat_group(chat_id):
+    return f"chat_{chat_id}"
+
+
+def create_message(chat_id, user, content, recipient_ids):
+    msg = Message(chat_id=chat_id, sender=user, content=content)
+    # Lets the unread counter signal skip the participants query
+    msg._recipient_ids = recipient_ids
+    msg.save()
+    return msg
+
+
+async def post_message(channel_layer, chat_id, user, content, recipient_ids):
+    """ Stores a message (directly or through the write-behind buffer) and broadcasts it to the chat """
+    if settings.CHAT_WRITE_BEHIND:
+        msg = await message_buffer.submit(chat_id, user, content, recipient_ids)
+    else:
+        msg = await run_db(create_message, chat_id, user, content, recipient_ids)
+    await channel_layer.group_send(
+        chat_group(chat_id),
+        with_frames(
+            {
+                "type": "chat_message",
+                "id": msg.id,
+                "message": content,
+                "sender": user.email,
+                "timestamp": msg.timestamp.isoformat(),
+                "chat_id": chat_id,
+            },
+            message_frame(chat_id, msg.id, user.id, content, msg.timestamp),
+        )
+    )
+    return msg
+
+
+def message_retry_after(user_id):
+    """ None when the user may send another message, else whole seconds to wait; shared with the HTTP API """
+    throttle = ChatMessageRateThrottle()
+    if throttle.hit(throttle.user_ident(user_id)):
+        return None
+    return math.ceil(throttle.wait())
+
+
+def rate_limited_error(chat_id, retry_after):
+    return {"type": "error", "chat_id": chat_id, "error": "Too many messages.", "retry_after": retry_after}
+
+
+def typing_event(chat_id, user):
+    return with_frames(
+        {"type": "user_typing", "user": user.email, "chat_id": chat_id},
+        typing_frame(chat_id, user.id),
+    )
+
+
+class ChatConsumer(ProtocolMixin, AsyncWebsocketConsumer):
     async def connect(self):
         self.user = self.scope["user"]
-        self.chat_id = self.scope["url_route"]["kwargs"]["chat_id"]
-        self.chat_group_name = f"chat_{self.chat_id}"
-
-        if self.user.is_authenticated:
-            await self.channel_layer.group_add(self.chat_group_name, self.channel_name)
-            await self.accept()
+        self.participant_ids = set()
+        try:
+            self.chat_id = int(self.scope["url_route"]["kwargs"]["chat_id"])
+        except ValueError:
+            await self.close(code=CLOSE_FORBIDDEN)
+            return
+        self.chat_group_name = chat_group(self.chat_id)
 
-            await self.set_user_online()
-        else:
+        if not self.user.is_authenticated:
             await self.close()
+            return
+
+        # Resolved once per connection; every message reuses it
+        participant_ids = await run_db(get_participant_ids, self.chat_id)
+        if self.user.id not in participant_ids:
+            await self.close(code=CLOSE_FORBIDDEN)
+            return
+        self.participant_ids = participant_ids
+        self.recipient_ids = participant_ids - {self.user.id}
+        self.reads = ReadReceiptCoalescer(self.channel_layer, self.user.id)
+
+        await self.channel_layer.group_add(self.chat_group_name, self.channel_name)
+        await self.accept_protocol()
+
+        await self.set_user_online()
+
+        # ws/chat/<id>/?last_id=<n>: catch up on what was missed while offline
+        last_id = last_id_from_query(self.scope)
+        if last_id is not None:
+            await replay_gap(self, partial(message_gap, self.chat_id), message_items, last_id, "chat", self.chat_id)
 
     async def disconnect(self, close_code):
-        if self.user.is_authenticated:
+        if self.user.id in self.participant_ids:
+            await self.reads.close()
             await self.set_user_offline()
             await self.channel_layer.group_discard(self.chat_group_name, self.channel_name)
 
-    async def receive(self, text_data):
-        data = json.loads(text_data)
+    async def receive(self, text_data=None, bytes_data=None):
+        data = self.decode_frame(text_data, bytes_data)
         event_type = data.get("type")
         message = data.get("message")
 
         if event_type == "ping":
-            await self.set_user_online()
+            await run_db(presence.ping, self.user.id)
             return
 
         if event_type == "typing":
-            await self.channel_layer.group_send(
-                self.chat_group_name,
-                {
-                    "type": "user_typing",
-                    "user": self.user.email,
-                }
-            )
+            await self.channel_layer.group_send(self.chat_group_name, typing_event(self.chat_id, self.user))
+            return
+
+        if event_type == "read":
+            # {"type": "read", "last_read_id": n}: everything up to n has been read
+            if isinstance(data.get("last_read_id"), int):
+                self.reads.mark(self.chat_id, data["last_read_id"])
             return
 
         if message:
-            msg = await self.create_message(message)
-            await self.channel_layer.group_send(
-                self.chat_group_name,
-                {
-                    "type": "chat_message",
-                    "message": message,
-                    "sender": self.user.email,
-                    "timestamp": msg.timestamp.isoformat(),
-                    "chat_id": self.chat_id,
-                }
-            )
+            retry_after = await run_db(message_retry_after, self.user.id)
+            if retry_after is not None:
+                error = rate_limited_error(self.chat_id, retry_after)
+                await self.send_versioned(error, error)
+                return
+            await post_message(self.channel_layer, self.chat_id, self.user, message, self.recipient_ids)
 
     async def chat_message(self, event):
+        if self.protocol:
+            await self.send_frame(event)
+            return
         await self.send(text_data=json.dumps({
+            "id": event["id"],
             "message": event["message"],
             "sender": event["sender"],
             "timestamp": event["timestamp"],
@@ -72,34 +159,173 @@ class ChatConsumer(AsyncWebsocketConsumer):
         }))
 
     async def user_typing(self, event):
+        if self.protocol:
+            await self.send_frame(event)
+            return
         await self.send(text_data=json.dumps({
             "type": "typing",
             "user": event["user"]
         }))
 
+    async def read_receipt(self, event):
+        if self.protocol:
+            await self.send_frame(event)
+            return
+        await self.send(text_data=json.dumps({
+            "type": "read",
+            "chat_id": event["chat_id"],
+            "user_id": event["user_id"],
+            "last_read_id": event["last_read_id"],
+        }))
+
     async def set_user_online(self):
-        def update_status():
-            status, _ = UserStatus.objects.get_or_create(user=self.user)
-            status.is_online = True
-            status.last_seen = timezone.now()
-            status.save()
-        await run_sync(update_status)
+        await run_db(presence.connect, self.user.id)
 
     async def set_user_offline(self):
-        def mark_offline():
-            try:
-                status = UserStatus.objects.get(user=self.user)
-                status.is_online = False
-                status.last_seen = timezone.now()
-                status.save()
-            except UserStatus.DoesNotExist:
-                pass
-        await run_sync(mark_offline)
-
-    async def create_message(self, content):
-        def save_message():
-            chat = Chat.objects.get(id=self.chat_id)
-            msg = Message(chat=chat, sender=self.user, content=content)
-            msg.save()
-            return msg
-        return await run_sync(save_message)
+        await run_db(presence.disconnect, self.user.id)
+
+
+class MultiplexConsumer(ProtocolMixin, AsyncWebsocketConsumer):
+    """
+    One authenticated socket per client for notifications and any number of chats.
+
+    The notification stream is always on. Chats are added and removed with
+    {"type": "subscribe" | "unsubscribe", "chat_id": ...}; messages and typing events
+    carry the chat_id they belong to. ws/notifications/ and ws/chat/<id>/ keep working.
+
+    Reconnecting clients pass ?last_notification_id=<n> and "last_id" in each subscribe
+    to have the gap replayed.
+    """
+    MAX_SUBSCRIPTIONS = 50
+
+    async def connect(self):
+        self.user = self.scope["user"]
+        # chat_id -> recipient ids, resolved once per subscription
+        self.chats = {}
+        if not self.user.is_authenticated:
+            await self.close()
+            return
+
+        self.user_group_name = f"user_{self.user.id}"
+        self.reads = ReadReceiptCoalescer(self.channel_layer, self.user.id)
+        await self.channel_layer.group_add(self.user_group_name, self.channel_name)
+        await self.accept_protocol()
+        await run_db(presence.connect, self.user.id)
+        counts = await run_db(get_unread_counts, self.user.id)
+        await self.unread_count(unread_count_event(counts))
+
+        last_id = last_id_from_query(self.scope, "last_notification_id")
+        if last_id is not None:
+            await replay_gap(
+                self, partial(notification_gap, self.user.id), notification_items, last_id, "notifications"
+            )
+
+    async def disconnect(self, close_code):
+        if not self.user.is_authenticated:
+            return
+        await self.reads.close()
+        for chat_id in list(self.chats):
+            await self.channel_layer.group_discard(chat_group(chat_id), self.channel_name)
+        self.chats.clear()
+        await self.channel_layer.group_discard(self.user_group_name, self.channel_name)
+        await run_db(presence.disconnect, self.user.id)
+
+    async def send_json(self, content):
+        if self.protocol:
+            await self.send_direct(content)
+        else:
+            await self.send(text_data=json.dumps(content))
+
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            data = self.decode_frame(text_data, bytes_data)
+            event_type = data.get("type")
+            chat_id = int(data["chat_id"]) if "chat_id" in data else None
+        except (ValueError, TypeError, AttributeError):
+            await self.send_json({"type": "error", "error": "Malformed frame."})
+            return
+
+        if event_type == "ping":
+            await run_db(presence.ping, self.user.id)
+        elif event_type == "subscribe" and chat_id is not None:
+            await self.subscribe(chat_id, data.get("last_id"))
+        elif event_type == "unsubscribe" and chat_id is not None:
+            if self.chats.pop(chat_id, None) is not None:
+                await self.channel_layer.group_discard(chat_group(chat_id), self.channel_name)
+            await self.send_json({"type": "unsubscribed", "chat_id": chat_id})
+        elif event_type in ("message", "typing", "read") and chat_id is not None:
+            if chat_id not in self.chats:
+                await self.send_json({"type": "error", "chat_id": chat_id, "error": "Not subscribed to this chat."})
+            elif event_type == "read":
+                if isinstance(data.get("last_read_id"), int):
+                    self.reads.mark(chat_id, data["last_read_id"])
+            elif event_type == "typing":
+                await self.channel_layer.group_send(chat_group(chat_id), typing_event(chat_id, self.user))
+            elif data.get("message"):
+                retry_after = await run_db(message_retry_after, self.user.id)
+                if retry_after is not None:
+                    await self.send_json(rate_limited_error(chat_id, retry_after))
+                else:
+                    await post_message(self.channel_layer, chat_id, self.user, data["message"], self.chats[chat_id])
+        else:
+            await self.send_json({"type": "error", "error": "Unknown frame type."})
+
+    async def subscribe(self, chat_id, last_id=None):
+        if chat_id not in self.chats:
+            if len(self.chats) >= self.MAX_SUBSCRIPTIONS:
+                await self.send_json({"type": "error", "chat_id": chat_id, "error": "Too many subscriptions."})
+                return
+            participant_ids = await run_db(get_participant_ids, chat_id)
+            if self.user.id not in participant_ids:
+                await self.send_json({"type": "error", "chat_id": chat_id, "error": "Not a participant of this chat."})
+                return
+            self.chats[chat_id] = participant_ids - {self.user.id}
+            await self.channel_layer.group_add(chat_group(chat_id), self.channel_name)
+        await self.send_json({"type": "subscribed", "chat_id": chat_id})
+        if isinstance(last_id, int):
+            await replay_gap(self, partial(message_gap, chat_id), message_items, last_id, "chat", chat_id)
+
+    async def chat_message(self, event):
+        if self.protocol:
+            await self.send_frame(event)
+            return
+        await self.send_json({
+            "type": "chat_message",
+            "chat_id": event["chat_id"],
+            "id": event["id"],
+            "message": event["message"],
+            "sender": event["sender"],
+            "timestamp": event["timestamp"],
+        })
+
+    async def user_typing(self, event):
+        if self.protocol:
+            await self.send_frame(event)
+            return
+        await self.send_json({"type": "typing", "chat_id": event["chat_id"], "user": event["user"]})
+
+    async def read_receipt(self, event):
+        if self.protocol:
+            await self.send_frame(event)
+            return
+        await self.send_json({
+            "type": "read",
+            "chat_id": event["chat_id"],
+            "user_id": event["user_id"],
+            "last_read_id": event["last_read_id"],
+        })
+
+    async def send_notification(self, event):
+        if self.protocol:
+            await self.send_frame(event)
+            return
+        await self.send_json({"type": "notification", "id": event.get("id"), "message": event["message"]})
+
+    async def unread_count(self, event):
+        if self.protocol:
+            await self.send_frame(event)
+            return
+        await self.send_json({
+            "type": "unread_count",
+            **{kind: event[kind] for kind in ("notifications", "chat") if kind in event},
+        })
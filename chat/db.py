@@ -0,0 +1,20 @@
+"""
+Bounded executor for ORM work started from WebSocket consumers.
+
+asyncio's default executor never closes database connections, and the single
+thread behind database_sync_to_async serialises every consumer in the process.
+run_db uses a fixed pool instead, so at most DB_EXECUTOR_WORKERS connections are
+open per process, and stale connections are closed around each call.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from channels.db import DatabaseSyncToAsync
+
+DB_EXECUTOR_WORKERS = 8
+
+db_executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="consumer-db")
+
+
+def run_db(func, *args, **kwargs):
+    """ Awaitable: runs func(*args, **kwargs) on db_executor """
+    return DatabaseSyncToAsync(func, thread_sensitive=False, executor=db_executor)(*args, **kwargs)
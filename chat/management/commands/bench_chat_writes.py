@@ -0,0 +1,68 @@
+import asyncio
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from chat.db import run_db
+from chat.models import Chat, Message
+from chat.writebehind import MessageWriteBuffer
+from users.models import CustomUser
+
+MODES = ("sync", "write-behind")
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures chat message write throughput with synchronous INSERTs and with the "
+        "write-behind buffer. Uses a throwaway chat that is deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=2000)
+        parser.add_argument("--senders", type=int, default=20, help="Concurrent sockets sending messages")
+        parser.add_argument("--mode", choices=MODES + ("both",), default="both")
+
+    def handle(self, *args, **options):
+        modes = MODES if options["mode"] == "both" else (options["mode"],)
+        if "write-behind" in modes and connection.vendor != "postgresql":
+            raise CommandError("write-behind needs PostgreSQL to reserve message ids")
+
+        tag = uuid.uuid4().hex[:8]
+        users = [
+            CustomUser.objects.create_user(email=f"bench-{tag}-{i}@example.com", role="Student")
+            for i in range(2)
+        ]
+        chat = Chat.objects.create()
+        chat.participants.set(users)
+        try:
+            for mode in modes:
+                elapsed = asyncio.run(self.run(mode, chat.id, users, options["messages"], options["senders"]))
+                written = Message.objects.filter(chat=chat).delete()[0]
+                self.stdout.write(
+                    f"{mode:>12}: {written} messages in {elapsed:.2f}s ({written / elapsed:.0f} msg/s)"
+                )
+        finally:
+            chat.delete()
+            CustomUser.objects.filter(id__in=[user.id for user in users]).delete()
+
+    async def run(self, mode, chat_id, users, messages, senders):
+        buffer = MessageWriteBuffer() if mode == "write-behind" else None
+
+        async def sender(index):
+            user, other = users[index % 2], users[(index + 1) % 2]
+            for n in range(index, messages, senders):
+                # Same per-message work as ChatConsumer.receive before its broadcast
+                if buffer:
+                    await buffer.submit(chat_id, user, f"bench {n}", {other.id})
+                else:
+                    message = Message(chat_id=chat_id, sender=user, content=f"bench {n}")
+                    message._recipient_ids = {other.id}
+                    await run_db(message.save)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(sender(index) for index in range(senders)))
+        if buffer:
+            await buffer.close()
+        return time.perf_counter() - started
@@ -0,0 +1,68 @@
+# Generated by Django 5.1.6 on 2026-10-18 16:32
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def seed_watermarks(apps, schema_editor):
+    """ A participant has read up to the newest message from someone else that is flagged is_read """
+    Chat = apps.get_model('chat', 'Chat')
+    Message = apps.get_model('chat', 'Message')
+    ReadWatermark = apps.get_model('chat', 'ReadWatermark')
+
+    newest_read = {}
+    for row in Message.objects.filter(is_read=True).values('chat_id', 'sender_id').annotate(last_id=models.Max('id')):
+        newest_read.setdefault(row['chat_id'], []).append((row['sender_id'], row['last_id']))
+
+    Participant = Chat.participants.through
+    watermarks = []
+    for chat_id, user_id in Participant.objects.filter(chat_id__in=newest_read).values_list('chat_id', 'customuser_id'):
+        last_read_id = max(
+            (last_id for sender_id, last_id in newest_read[chat_id] if sender_id != user_id), default=0
+        )
+        if last_read_id:
+            watermarks.append(ReadWatermark(chat_id=chat_id, user_id=user_id, last_read_id=last_read_id))
+    ReadWatermark.objects.bulk_create(watermarks, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0003_message_chat_id_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReadWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_read_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name='message',
+            name='message_chat_id_idx',
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['chat', 'id'], include=('sender',), name='message_chat_id_idx'),
+        ),
+        migrations.AddField(
+            model_name='readwatermark',
+            name='chat',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='read_watermarks', to='chat.chat'),
+        ),
+        migrations.AddField(
+            model_name='readwatermark',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='read_watermarks', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddConstraint(
+            model_name='readwatermark',
+            constraint=models.UniqueConstraint(fields=('chat', 'user'), name='read_watermark_chat_user_uniq'),
+        ),
+        migrations.RunPython(seed_watermarks, migrations.RunPython.noop),
+    ]
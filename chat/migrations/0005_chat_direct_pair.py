@@ -0,0 +1,91 @@
+# Generated by Django 5.1.6 on 2026-10-18 16:34
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def merged_watermark(Message, chat_ids, user_id, watermarks):
+    """
+    One watermark for chat_ids merged into one chat, without marking anything unread as read:
+    just below the user's first unread message (not their own) in any of the chats, or the
+    furthest watermark when everything has been read.
+    """
+    first_unread = [
+        Message.objects.filter(chat_id=chat_id, id__gt=watermarks.get(chat_id, 0))
+        .exclude(sender_id=user_id).order_by('id').values_list('id', flat=True).first()
+        for chat_id in chat_ids
+    ]
+    first_unread = [message_id for message_id in first_unread if message_id is not None]
+    if first_unread:
+        return min(first_unread) - 1
+    return max(watermarks.values(), default=0)
+
+
+def merge_direct_chats(apps, schema_editor):
+    """
+    Gives every two-person chat its pair key. Duplicate chats for the same pair are merged
+    into the oldest one: messages move over, and each user's watermarks become one that
+    keeps every message they had not read unread (merged_watermark).
+    """
+    Chat = apps.get_model('chat', 'Chat')
+    Message = apps.get_model('chat', 'Message')
+    ReadWatermark = apps.get_model('chat', 'ReadWatermark')
+    Participant = Chat.participants.through
+
+    members = {}
+    for chat_id, user_id in Participant.objects.values_list('chat_id', 'customuser_id'):
+        members.setdefault(chat_id, set()).add(user_id)
+
+    by_pair = {}
+    for chat_id, user_ids in members.items():
+        if len(user_ids) == 2:
+            by_pair.setdefault(tuple(sorted(user_ids)), []).append(chat_id)
+
+    for (low, high), chat_ids in by_pair.items():
+        keep, *duplicates = sorted(chat_ids)
+        if duplicates:
+            watermarks = {}
+            for chat_id, user_id, last_read_id in ReadWatermark.objects.filter(
+                chat_id__in=chat_ids
+            ).values_list('chat_id', 'user_id', 'last_read_id'):
+                watermarks.setdefault(user_id, {})[chat_id] = last_read_id
+            # Computed per source chat, so before the messages move
+            merged = {
+                user_id: merged_watermark(Message, chat_ids, user_id, by_chat)
+                for user_id, by_chat in watermarks.items()
+            }
+            Message.objects.filter(chat_id__in=duplicates).update(chat_id=keep)
+            ReadWatermark.objects.filter(chat_id__in=duplicates).delete()
+            for user_id, last_read_id in merged.items():
+                ReadWatermark.objects.update_or_create(
+                    chat_id=keep, user_id=user_id, defaults={'last_read_id': last_read_id}
+                )
+            Chat.objects.filter(id__in=duplicates).delete()
+        Chat.objects.filter(id=keep).update(direct_low_id=low, direct_high_id=high)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0004_read_watermark'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='direct_high',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='chat',
+            name='direct_low',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(merge_direct_chats, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='chat',
+            constraint=models.UniqueConstraint(fields=('direct_low', 'direct_high'), name='chat_direct_pair_uniq'),
+        ),
+    ]
@@ -1,10 +1,59 @@
+from django.contrib.auth import get_user_model
 from django.db import models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.conf import settings
 from django.utils import timezone
 
+
+class ChatQuerySet(models.QuerySet):
+    def for_inbox(self, user):
+        """
+        The user's chats annotated with last_message_id, activity (the same, 0 for empty
+        chats, to order by) and unread_count, with participants and their profiles
+        prefetched. Each annotation is an index probe per chat on Message's (chat, id) index.
+        """
+        last_message = Message.objects.filter(chat=OuterRef('pk')).order_by('-id').values('id')[:1]
+        read_up_to = ReadWatermark.objects.filter(chat=OuterRef('pk'), user=user).values('last_read_id')
+        unread = Message.objects.filter(
+            chat=OuterRef('pk'), id__gt=OuterRef('read_up_to')
+        ).exclude(sender=user).order_by().values('chat').annotate(count=Count('id')).values('count')
+
+        return self.filter(participants=user).annotate(
+            last_message_id=Subquery(last_message),
+            activity=Coalesce(Subquery(last_message), 0),
+            read_up_to=Coalesce(Subquery(read_up_to), 0),
+        ).annotate(
+            unread_count=Coalesce(Subquery(unread), 0),
+        ).prefetch_related(
+            models.Prefetch(
+                'participants',
+                queryset=get_user_model().objects.select_related(
+                    'student_profile', 'supervisor_profile', 'dean_office_profile'
+                ),
+            ),
+        )
+
+
 class Chat(models.Model):
     participants = models.ManyToManyField(settings.AUTH_USER_MODEL, related_name='chat_participants')
     created_at = models.DateTimeField(auto_now_add=True)
+    # Direct (1:1) chats carry their pair as (lower user id, higher user id), unique together
+    direct_low = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL,
+                                   related_name='+', db_index=False)
+    direct_high = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL,
+                                    related_name='+', db_index=False)
+
+    objects = ChatQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['direct_low', 'direct_high'], name='chat_direct_pair_uniq'),
+        ]
+
+    @staticmethod
+    def direct_pair(user_id, other_id):
+        return min(user_id, other_id), max(user_id, other_id)
 
     def __str__(self):
         return f"Chat {self.id} | {' & '.join([p.email for p in self.participants.all()])}"
@@ -14,13 +63,39 @@ class Message(models.Model):
     chat = models.ForeignKey(Chat, related_name='messages', on_delete=models.CASCADE)
     sender = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     content = models.TextField()
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Not auto_now_add: write-behind stores the timestamp the message was broadcast with
+    timestamp = models.DateTimeField(default=timezone.now)
+    # Legacy flag, no longer written: read state lives in ReadWatermark
     is_read = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['chat', 'timestamp', 'id'], name='message_chat_ts_id_idx'),
+            # Reconnect replay and unread counts walk id ranges within one chat;
+            # sender is carried so "not my own messages" stays index-only
+            models.Index(fields=['chat', 'id'], include=['sender'], name='message_chat_id_idx'),
+        ]
+
     def __str__(self):
         return f"Message from {self.sender.email} in Chat {self.chat.id}"
 
 
+class ReadWatermark(models.Model):
+    """ Everything in the chat up to last_read_id has been read by the user """
+    chat = models.ForeignKey(Chat, related_name='read_watermarks', on_delete=models.CASCADE)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='read_watermarks', on_delete=models.CASCADE)
+    last_read_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['chat', 'user'], name='read_watermark_chat_user_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.email} read chat {self.chat_id} up to {self.last_read_id}"
+
+
 class UserStatus(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='status')
     is_online = models.BooleanField(default=False)
@@ -0,0 +1,9 @@
+from rest_framework.pagination import CursorPagination
+
+
+class InboxCursorPagination(CursorPagination):
+    """ Most recently active chats first; activity is the chat's newest message id """
+    page_size = 30
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-activity', '-id')
@@ -0,0 +1,154 @@
+"""
+Presence kept in the cache instead of a UserStatus write per connect and ping.
+
+Each user has a connection counter with a TTL: connects increment it, disconnects
+decrement it, pings refresh the TTL. Several tabs therefore keep a user online until
+the last one closes, and a crashed worker's connections simply expire. last_seen is
+kept in the cache as well and written to UserStatus in batches, with a single upsert.
+The first unwritten last_seen arms a timer that flushes FLUSH_INTERVAL seconds later,
+so a quiet period does not leave the database behind, and whatever is still
+buffered at interpreter exit is written by an atexit hook.
+
+Works with any Django cache backend: Redis in production, locmem in tests.
+"""
+import atexit
+import logging
+import threading
+import time
+from datetime import datetime
+
+from django.core.cache import caches
+from django.db import close_old_connections
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+PRESENCE_TTL = 60  # seconds without a ping before a connection counts as gone
+LAST_SEEN_TTL = 60 * 60 * 24 * 7
+FLUSH_INTERVAL = 30
+
+
+class PresenceService:
+    def __init__(self, cache_alias="default", flush_interval=FLUSH_INTERVAL):
+        self.cache_alias = cache_alias
+        self.flush_interval = flush_interval
+        self._dirty = {}
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._timer = None
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    @staticmethod
+    def connections_key(user_id):
+        return f"presence:connections:{user_id}"
+
+    @staticmethod
+    def last_seen_key(user_id):
+        return f"presence:last_seen:{user_id}"
+
+    def connect(self, user_id):
+        key = self.connections_key(user_id)
+        self.cache.add(key, 0, timeout=PRESENCE_TTL)
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            # Expired between add and incr
+            self.cache.set(key, 1, timeout=PRESENCE_TTL)
+        self.cache.touch(key, PRESENCE_TTL)
+        self._seen(user_id)
+
+    def ping(self, user_id):
+        key = self.connections_key(user_id)
+        if not self.cache.touch(key, PRESENCE_TTL):
+            self.cache.set(key, 1, timeout=PRESENCE_TTL)
+        self._seen(user_id)
+
+    def disconnect(self, user_id):
+        key = self.connections_key(user_id)
+        try:
+            if self.cache.decr(key) <= 0:
+                self.cache.delete(key)
+        except ValueError:
+            pass
+        self._seen(user_id)
+
+    def _seen(self, user_id):
+        now = timezone.now()
+        self.cache.set(self.last_seen_key(user_id), now.isoformat(), timeout=LAST_SEEN_TTL)
+        with self._lock:
+            self._dirty[user_id] = now
+            if self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self._flush_on_timer)
+                self._timer.daemon = True
+                self._timer.start()
+        self.flush(force=False)
+
+    def _flush_on_timer(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Presence flush failed")
+        finally:
+            close_old_connections()
+
+    def get_many(self, user_ids):
+        """
+        Returns {user_id: {"is_online": bool, "last_seen": datetime or None}} for the users that
+        have any presence information, with one cache round trip and at most one query.
+        """
+        from chat.models import UserStatus
+
+        keys = {}
+        for user_id in user_ids:
+            keys[self.connections_key(user_id)] = ("connections", user_id)
+            keys[self.last_seen_key(user_id)] = ("last_seen", user_id)
+        cached = self.cache.get_many(keys)
+
+        result = {}
+        for key, value in cached.items():
+            kind, user_id = keys[key]
+            entry = result.setdefault(user_id, {"is_online": False, "last_seen": None})
+            if kind == "connections":
+                entry["is_online"] = value > 0
+            else:
+                entry["last_seen"] = datetime.fromisoformat(value)
+
+        missing = [user_id for user_id in user_ids if result.get(user_id, {}).get("last_seen") is None]
+        if missing:
+            for user_id, last_seen in UserStatus.objects.filter(user_id__in=missing).values_list(
+                "user_id", "last_seen"
+            ):
+                result.setdefault(user_id, {"is_online": False, "last_seen": None})["last_seen"] = last_seen
+        return result
+
+    def flush(self, force=True):
+        """ Writes buffered last_seen values to UserStatus in one upsert """
+        from chat.models import UserStatus
+
+        with self._lock:
+            if not self._dirty or (not force and time.monotonic() - self._last_flush < self.flush_interval):
+                return 0
+            dirty, self._dirty = self._dirty, {}
+            self._last_flush = time.monotonic()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+        online = self.get_many(list(dirty))
+        UserStatus.objects.bulk_create(
+            [
+                UserStatus(user_id=user_id, last_seen=last_seen, is_online=online.get(user_id, {}).get("is_online", False))
+                for user_id, last_seen in dirty.items()
+            ],
+            update_conflicts=True,
+            unique_fields=["user"],
+            update_fields=["is_online", "last_seen"],
+        )
+        return len(dirty)
+
+
+presence = PresenceService()
+atexit.register(presence.flush)
@@ -0,0 +1,191 @@
+"""
+Compact WebSocket protocol (v2), chosen through the WebSocket subprotocol header.
+
+Clients that offer "dtest.v2.msgpack" or "dtest.v2.json" get short frames in which
+users are referenced by id and times are epoch milliseconds:
+
+    {"t": "msg", "c": chat_id, "id": message_id, "s": sender_id, "m": text, "ts": ms}
+    {"t": "typing", "c": chat_id, "s": user_id}
+    {"t": "ntf", "id": notification_id, "m": text, "ts": ms}
+    {"t": "unread", "n": notifications, "c": chat}    (a counter that did not change is left out)
+
+Frames are encoded once, when the group event is built, in each v2 encoding some
+socket currently uses (protocol_usage). Consumers then send those bytes unchanged
+to each socket in the group. When an encoding is missing, e.g. right after the first
+socket of its kind connected, the event carries the frame itself and the consumer
+encodes it. Clients that offer no subprotocol keep the original JSON messages.
+"""
+import json
+import logging
+import time
+
+import msgpack
+from django.core.cache import caches
+
+from chat.db import run_db
+
+try:
+    import orjson
+except ImportError:  # optional: a faster JSON encoder
+    orjson = None
+
+V2_JSON = "dtest.v2.json"
+V2_MSGPACK = "dtest.v2.msgpack"
+# Server preference when a client offers both
+SUBPROTOCOLS = (V2_MSGPACK, V2_JSON)
+USAGE_TTL = 60 * 60 * 24  # a worker that dies without disconnecting only costs unneeded encoding
+USAGE_REFRESH = 5  # seconds a process reuses its view of protocol_usage
+
+logger = logging.getLogger(__name__)
+
+
+def negotiate(scope):
+    """ Returns the subprotocol to accept, or None for the original protocol """
+    offered = scope.get("subprotocols") or []
+    for subprotocol in SUBPROTOCOLS:
+        if subprotocol in offered:
+            return subprotocol
+    return None
+
+
+def dumps_json(frame):
+    if orjson is not None:
+        return orjson.dumps(frame).decode()
+    return json.dumps(frame, separators=(",", ":"), ensure_ascii=False)
+
+
+def encode_as(protocol, frame):
+    return msgpack.packb(frame) if protocol == V2_MSGPACK else dumps_json(frame)
+
+
+class ProtocolUsage:
+    """ How many sockets use each v2 encoding, counted in the cache across all workers """
+
+    def __init__(self, cache_alias="default", refresh=USAGE_REFRESH):
+        self.cache_alias = cache_alias
+        self.refresh = refresh
+        self._in_use = SUBPROTOCOLS
+        self._checked_at = None
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    @staticmethod
+    def key(protocol):
+        return f"ws_protocol:{protocol}"
+
+    def connected(self, protocol):
+        key = self.key(protocol)
+        self.cache.add(key, 0, timeout=USAGE_TTL)
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            # Expired between add and incr
+            self.cache.set(key, 1, timeout=USAGE_TTL)
+        self.cache.touch(key, USAGE_TTL)
+
+    def disconnected(self, protocol):
+        key = self.key(protocol)
+        try:
+            if self.cache.decr(key) <= 0:
+                self.cache.delete(key)
+        except ValueError:
+            pass
+
+    def in_use(self):
+        """ The encodings with sockets, as of at most `refresh` seconds ago; all of them if the cache fails """
+        now = time.monotonic()
+        if self._checked_at is None or now - self._checked_at >= self.refresh:
+            try:
+                counts = self.cache.get_many([self.key(protocol) for protocol in SUBPROTOCOLS])
+                self._in_use = tuple(protocol for protocol in SUBPROTOCOLS if counts.get(self.key(protocol), 0) > 0)
+            except Exception:
+                logger.exception("Protocol usage cache unavailable")
+                self._in_use = SUBPROTOCOLS
+            self._checked_at = now
+        return self._in_use
+
+
+protocol_usage = ProtocolUsage()
+
+
+def with_frames(event, frame):
+    """ Attaches the v2 frame, pre-encoded in the encodings in use, to a channel-layer event """
+    protocols = protocol_usage.in_use()
+    event["frames"] = {protocol: encode_as(protocol, frame) for protocol in protocols}
+    if len(protocols) < len(SUBPROTOCOLS):
+        event["frame"] = frame
+    return event
+
+
+def epoch_ms(moment):
+    return int(moment.timestamp() * 1000)
+
+
+def message_frame(chat_id, message_id, sender_id, content, timestamp):
+    return {"t": "msg", "c": chat_id, "id": message_id, "s": sender_id, "m": content, "ts": epoch_ms(timestamp)}
+
+
+def typing_frame(chat_id, user_id):
+    return {"t": "typing", "c": chat_id, "s": user_id}
+
+
+def notification_frame(notification_id, message, timestamp):
+    return {"t": "ntf", "id": notification_id, "m": message, "ts": epoch_ms(timestamp)}
+
+
+def unread_frame(notifications, chat):
+    """ A counter passed as None did not change and is left out """
+    frame = {"t": "unread"}
+    if notifications is not None:
+        frame["n"] = notifications
+    if chat is not None:
+        frame["c"] = chat
+    return frame
+
+
+class ProtocolMixin:
+    """ For AsyncWebsocketConsumer: negotiated accept, decoding client frames and sending encoded ones """
+    protocol = None
+
+    async def accept_protocol(self):
+        self.protocol = negotiate(self.scope)
+        await self.accept(subprotocol=self.protocol)
+        if self.protocol:
+            await run_db(protocol_usage.connected, self.protocol)
+
+    async def websocket_disconnect(self, message):
+        if self.protocol:
+            await run_db(protocol_usage.disconnected, self.protocol)
+            self.protocol = None
+        await super().websocket_disconnect(message)
+
+    def decode_frame(self, text_data=None, bytes_data=None):
+        if bytes_data is not None:
+            return msgpack.unpackb(bytes_data)
+        return json.loads(text_data)
+
+    async def send_encoded(self, data):
+        if isinstance(data, bytes):
+            await self.send(bytes_data=data)
+        else:
+            await self.send(text_data=data)
+
+    async def send_frame(self, event):
+        """ Sends the frame encoded once for the whole group by the event's producer, or encodes it here """
+        data = event["frames"].get(self.protocol)
+        if data is None:
+            data = encode_as(self.protocol, event["frame"])
+        await self.send_encoded(data)
+
+    async def send_direct(self, frame):
+        """ Encodes a frame meant for this socket only, e.g. a reply to a subscribe """
+        await self.send_encoded(encode_as(self.protocol, frame))
+
+    async def send_versioned(self, v1, v2):
+        """ Sends a per-socket message in whichever protocol was negotiated """
+        if self.protocol:
+            await self.send_direct(v2)
+        else:
+            await self.send(text_data=json.dumps(v1))
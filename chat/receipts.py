@@ -0,0 +1,120 @@
+"""
+Read state as one watermark per (chat, user) instead of a flag per message.
+
+mark_read_up_to() moves the watermark forward only. It counts the newly read
+messages with one range count over the (chat, id) index, which carries sender,
+and takes that many off the unread counter. Other participants get one
+"read_receipt" event per move, however many messages it covers.
+"""
+import asyncio
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.db.models import Subquery, OuterRef
+from django.db.models.functions import Coalesce
+
+from chat.db import run_db
+from chat.models import Message, ReadWatermark
+from chat.protocol import with_frames
+from notifications import counters
+
+READ_RECEIPT_DELAY = 0.25  # seconds a socket collects read frames before writing
+
+
+def mark_read_up_to(chat_id, user_id, message_id):
+    """
+    Marks everything in the chat up to message_id as read by the user. Returns the new
+    watermark, or None when it did not move (already read, or no such message).
+    """
+    # Never beyond a message that exists, so later messages cannot be pre-read
+    last_id = (
+        Message.objects.filter(chat_id=chat_id, id__lte=message_id)
+        .order_by("-id").values_list("id", flat=True).first()
+    )
+    if last_id is None:
+        return None
+
+    with transaction.atomic():
+        watermark, _ = ReadWatermark.objects.select_for_update().get_or_create(chat_id=chat_id, user_id=user_id)
+        if last_id <= watermark.last_read_id:
+            return None
+
+        newly_read = (
+            Message.objects.filter(chat_id=chat_id, id__gt=watermark.last_read_id, id__lte=last_id)
+            .exclude(sender_id=user_id)
+            .count()
+        )
+        watermark.last_read_id = last_id
+        watermark.save(update_fields=["last_read_id", "updated_at"])
+        if newly_read:
+            counters.decrement(counters.CHAT, [user_id], newly_read)
+    return last_id
+
+
+def read_watermarks(chat_id):
+    """ {user_id: last_read_id} for the chat's participants that have read anything """
+    return dict(ReadWatermark.objects.filter(chat_id=chat_id).values_list("user_id", "last_read_id"))
+
+
+def unread_messages(user_id):
+    """ Messages from others past the user's watermark in each of their chats """
+    read_up_to = ReadWatermark.objects.filter(chat_id=OuterRef("chat_id"), user_id=user_id).values("last_read_id")
+    return Message.objects.filter(chat__participants=user_id).exclude(sender_id=user_id).filter(
+        id__gt=Coalesce(Subquery(read_up_to), 0)
+    )
+
+
+def read_receipt_event(chat_id, user_id, last_read_id):
+    return with_frames(
+        {"type": "read_receipt", "chat_id": chat_id, "user_id": user_id, "last_read_id": last_read_id},
+        {"t": "read", "c": chat_id, "s": user_id, "id": last_read_id},
+    )
+
+
+def broadcast_read_receipt(chat_id, user_id, last_read_id):
+    """ For sync code: sends the receipt to the chat once the transaction commits """
+    def send():
+        channel_layer = get_channel_layer()
+        if channel_layer is not None:
+            async_to_sync(channel_layer.group_send)(
+                f"chat_{chat_id}", read_receipt_event(chat_id, user_id, last_read_id)
+            )
+    transaction.on_commit(send)
+
+
+class ReadReceiptCoalescer:
+    """ Per socket: a burst of read frames becomes one watermark write and one receipt per chat """
+
+    def __init__(self, channel_layer, user_id, delay=READ_RECEIPT_DELAY):
+        self.channel_layer = channel_layer
+        self.user_id = user_id
+        self.delay = delay
+        self.pending = {}
+        self.task = None
+
+    def mark(self, chat_id, message_id):
+        self.pending[chat_id] = max(message_id, self.pending.get(chat_id, 0))
+        if self.task is None:
+            self.task = asyncio.get_running_loop().create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.delay)
+        self.task = None
+        await self.flush()
+
+    async def flush(self):
+        pending, self.pending = self.pending, {}
+        for chat_id, message_id in pending.items():
+            last_read_id = await run_db(mark_read_up_to, chat_id, self.user_id, message_id)
+            if last_read_id is not None:
+                await self.channel_layer.group_send(
+                    f"chat_{chat_id}", read_receipt_event(chat_id, self.user_id, last_read_id)
+                )
+
+    async def close(self):
+        """ Writes what is still pending, e.g. when the socket disconnects """
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        await self.flush()
@@ -0,0 +1,79 @@
+"""
+Replays what a socket missed while it was disconnected.
+
+The client passes the last id it has seen and gets everything after it in
+REPLAY_BATCH-sized frames. Each batch is one indexed range query, id > cursor,
+LIMIT REPLAY_BATCH. A "replay_done" frame ends the replay. Its complete flag is
+false when more than REPLAY_LIMIT rows were missing; the client then loads the
+rest over REST. Live events may arrive while the replay runs, so clients drop ids
+they already have.
+"""
+from urllib.parse import parse_qs
+
+from chat.db import run_db
+from chat.models import Message
+from chat.protocol import message_frame
+
+REPLAY_BATCH = 100
+REPLAY_LIMIT = 1000
+
+
+def last_id_from_query(scope, name="last_id"):
+    """ Reads ?last_id=<n> from the socket URL; None when absent or invalid """
+    values = parse_qs(scope.get("query_string", b"").decode()).get(name)
+    try:
+        return int(values[0]) if values else None
+    except ValueError:
+        return None
+
+
+def message_gap(chat_id, after_id, limit):
+    return list(
+        Message.objects.filter(chat_id=chat_id, id__gt=after_id)
+        .order_by("id")
+        .values("id", "chat_id", "sender_id", "sender__email", "content", "timestamp")[:limit]
+    )
+
+
+def message_items(rows, protocol):
+    if protocol:
+        return [
+            message_frame(row["chat_id"], row["id"], row["sender_id"], row["content"], row["timestamp"])
+            for row in rows
+        ]
+    return [
+        {
+            "id": row["id"],
+            "message": row["content"],
+            "sender": row["sender__email"],
+            "timestamp": row["timestamp"].isoformat(),
+            "chat_id": row["chat_id"],
+        }
+        for row in rows
+    ]
+
+
+async def replay_gap(consumer, fetch, to_items, after_id, stream, chat_id=None):
+    """
+    Sends rows after after_id to a ProtocolMixin consumer. fetch(after_id, limit) returns
+    rows in id order and to_items(rows, protocol) turns them into frame items.
+    """
+    sent = 0
+    complete = False
+    while sent < REPLAY_LIMIT:
+        rows = await run_db(fetch, after_id, REPLAY_BATCH)
+        if rows:
+            after_id = rows[-1]["id"]
+            sent += len(rows)
+            items = to_items(rows, consumer.protocol)
+            await consumer.send_versioned(
+                {"type": "replay", "stream": stream, "chat_id": chat_id, "items": items},
+                {"t": "replay", "c": chat_id, "i": items},
+            )
+        if len(rows) < REPLAY_BATCH:
+            complete = True
+            break
+    await consumer.send_versioned(
+        {"type": "replay_done", "stream": stream, "chat_id": chat_id, "last_id": after_id, "complete": complete},
+        {"t": "replay_done", "c": chat_id, "id": after_id, "ok": complete},
+    )
@@ -37,13 +37,59 @@ class UserSerializer(serializers.ModelSerializer):
         return None
 
 
+def read_by_others(message, read_up_to):
+    """ is_read as before: someone other than the sender has read the message """
+    return any(
+        user_id != message.sender_id and last_read_id >= message.id for user_id, last_read_id in read_up_to.items()
+    )
+
+
 class MessageSerializer(serializers.ModelSerializer):
     sender = UserSerializer(read_only=True)
+    is_read = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Message
+        fields = ['id', 'sender', 'content', 'timestamp', 'is_read']
+
+    def get_is_read(self, obj):
+        return read_by_others(obj, self.context.get("read_up_to", {}))
+
+
+class MessageCompactSerializer(serializers.ModelSerializer):
+    """ Message with the sender as an id; sender details go into a per-page users map """
+    sender = serializers.IntegerField(source='sender_id', read_only=True)
+    is_read = serializers.SerializerMethodField()
 
     class Meta:
         model = Message
         fields = ['id', 'sender', 'content', 'timestamp', 'is_read']
 
+    def get_is_read(self, obj):
+        return read_by_others(obj, self.context.get("read_up_to", {}))
+
+
+class InboxChatSerializer(serializers.ModelSerializer):
+    """ Chat for the inbox; expects Chat.objects.for_inbox() and a {id: Message} "last_messages" context """
+    participants = UserSerializer(many=True, read_only=True)
+    last_message = serializers.SerializerMethodField()
+    unread_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Chat
+        fields = ['id', 'participants', 'created_at', 'last_message', 'unread_count']
+
+    def get_last_message(self, obj):
+        message = self.context["last_messages"].get(obj.last_message_id)
+        if message is None:
+            return None
+        return {
+            "id": message.id,
+            "sender": message.sender_id,
+            "content": message.content[:200],
+            "timestamp": message.timestamp,
+        }
+
 
 class ChatSerializer(serializers.ModelSerializer):
     participants = UserSerializer(many=True)
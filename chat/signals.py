@@ -0,0 +1,17 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from chat.models import Chat, Message
+from notifications import counters
+
+
+@receiver(post_save, sender=Message)
+def count_unread_message(sender, instance, created, **kwargs):
+    """ A new message is unread for every participant except the sender """
+    if created:
+        recipients = getattr(instance, "_recipient_ids", None)
+        if recipients is None:
+            recipients = Chat.participants.through.objects.filter(chat_id=instance.chat_id).exclude(
+                customuser_id=instance.sender_id
+            ).values_list("customuser_id", flat=True)
+        counters.increment(counters.CHAT, recipients)
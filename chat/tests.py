@@ -1,3 +1,667 @@
-from django.test import TestCase
+import asyncio
+import json
+import threading
+from importlib import import_module
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import msgpack
+from asgiref.sync import async_to_sync, sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from autobahn.websocket.compress import PerMessageDeflateOffer
+from channels.layers import get_channel_layer
+from daphne.ws_protocol import WebSocketFactory
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from chat.consumers import ChatConsumer, MultiplexConsumer, CLOSE_FORBIDDEN
+from chat.models import Chat, Message, ReadWatermark, UserStatus
+from chat.presence import PresenceService, presence
+from chat.protocol import V2_JSON, V2_MSGPACK, protocol_usage, typing_frame, with_frames
+from chat.receipts import ReadReceiptCoalescer, mark_read_up_to
+from chat.writebehind import MessageWriteBuffer, reserve_message_id
+from DTest.wsserver import DeflateServer
+from notifications import counters
+from users.models import CustomUser
+
+
+def make_user(email, role="Student"):
+    return CustomUser.objects.create_user(email=email, password="pass12345", role=role)
+
+
+class MessageHistoryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = make_user("student@example.com")
+        cls.supervisor = make_user("super.visor@example.com", role="Supervisor")
+        cls.chat = Chat.objects.create()
+        cls.chat.participants.set([cls.student, cls.supervisor])
+        cls.messages = [
+            Message.objects.create(chat=cls.chat, sender=cls.student if i % 2 else cls.supervisor, content=f"m{i}")
+            for i in range(9)
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.student)
+        self.url = f"/api/chats/{self.chat.id}/history/"
+
+    def test_pages_backwards_and_forwards(self):
+        latest = self.client.get(self.url, {"limit": 4}).data
+        self.assertEqual([m["content"] for m in latest["messages"]], ["m5", "m6", "m7", "m8"])
+        self.assertTrue(latest["has_more"])
+
+        older = self.client.get(self.url, {"limit": 4, "before": latest["messages"][0]["id"]}).data
+        self.assertEqual([m["content"] for m in older["messages"]], ["m1", "m2", "m3", "m4"])
+
+        newer = self.client.get(self.url, {"limit": 3, "after": self.messages[5].id}).data
+        self.assertEqual([m["content"] for m in newer["messages"]], ["m6", "m7", "m8"])
+        self.assertFalse(newer["has_more"])
+
+    def test_senders_are_deduplicated(self):
+        data = self.client.get(self.url).data
+        self.assertEqual(len(data["messages"]), 9)
+        self.assertEqual(set(data["users"]), {self.student.id, self.supervisor.id})
+        self.assertEqual(data["messages"][0]["sender"], self.supervisor.id)
+
+    def test_query_count_does_not_depend_on_history_length(self):
+        # chat, page, read watermarks, senders
+        with self.assertNumQueries(4):
+            self.client.get(self.url, {"limit": 2})
+        for i in range(20):
+            Message.objects.create(chat=self.chat, sender=self.student, content=f"more{i}")
+        with self.assertNumQueries(4):
+            self.client.get(self.url, {"limit": 50})
+
+    def test_only_participants(self):
+        self.client.force_authenticate(make_user("outsider@example.com"))
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+
+class PresenceTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user("student@example.com")
+        cls.other = make_user("other@example.com")
+        cls.never_seen = make_user("never@example.com")
+
+    def setUp(self):
+        cache.clear()
+        self.presence = PresenceService()
+        self.addCleanup(self.presence.flush)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_user_stays_online_until_last_tab_closes(self):
+        self.presence.connect(self.other.id)
+        self.presence.connect(self.other.id)
+        self.presence.disconnect(self.other.id)
+        self.assertTrue(self.presence.get_many([self.other.id])[self.other.id]["is_online"])
+
+        self.presence.disconnect(self.other.id)
+        self.assertFalse(self.presence.get_many([self.other.id])[self.other.id]["is_online"])
+
+    def test_pings_do_not_write_to_the_database(self):
+        self.presence.connect(self.other.id)
+        with self.assertNumQueries(0):
+            for _ in range(5):
+                self.presence.ping(self.other.id)
+        self.assertFalse(UserStatus.objects.exists())
+
+    def test_flush_upserts_buffered_last_seen(self):
+        UserStatus.objects.create(user=self.user, is_online=False)
+        self.presence.connect(self.user.id)
+        self.presence.connect(self.other.id)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.presence.flush(), 2)
+        statuses = dict(UserStatus.objects.values_list("user_id", "is_online"))
+        self.assertEqual(statuses, {self.user.id: True, self.other.id: True})
+        self.assertEqual(self.presence.flush(), 0)
+
+    def test_timer_flushes_without_further_events(self):
+        service = PresenceService(flush_interval=0.01)
+        with mock.patch.object(service, "flush") as flush:
+            service.connect(self.other.id)
+            service._timer.join(timeout=5)
+        flush.assert_called_with()
+
+    def test_bulk_endpoint(self):
+        self.presence.connect(self.other.id)
+        response = self.client.get(f"/api/presence/?ids={self.other.id},{self.never_seen.id}")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data[self.other.id]["is_online"])
+        self.assertEqual(response.data[self.never_seen.id], {"is_online": False, "last_seen": None})
+
+        self.assertEqual(self.client.get("/api/presence/?ids=1,x").status_code, 400)
+        self.assertEqual(self.client.get(f"/api/users/{self.never_seen.id}/status/").status_code, 404)
+
+
+def run_db_in_test_thread(func, *args, **kwargs):
+    return sync_to_async(func)(*args, **kwargs)
+
+
+# run_db uses its own threads and connections, which cannot see the test transaction
+@mock.patch("chat.consumers.run_db", run_db_in_test_thread)
+@mock.patch("chat.replay.run_db", run_db_in_test_thread)
+class ChatConsumerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = make_user("student@example.com")
+        cls.supervisor = make_user("super.visor@example.com", role="Supervisor")
+        cls.outsider = make_user("outsider@example.com")
+        cls.chat = Chat.objects.create()
+        cls.chat.participants.set([cls.student, cls.supervisor])
+
+    def setUp(self):
+        cache.clear()
+        # Write buffered last_seen inside the test transaction rather than from the timer thread
+        self.addCleanup(presence.flush)
+
+    def communicator(self, user, query_string=b""):
+        return ApplicationCommunicator(ChatConsumer.as_asgi(), {
+            "type": "websocket",
+            "path": f"/ws/chat/{self.chat.id}/",
+            "query_string": query_string,
+            "user": user,
+            "url_route": {"kwargs": {"chat_id": str(self.chat.id)}},
+        })
+
+    @mock.patch("chat.replay.REPLAY_BATCH", 2)
+    @mock.patch("chat.replay.REPLAY_LIMIT", 4)
+    def test_reconnect_replays_the_gap_in_batches(self):
+        messages = [Message.objects.create(chat=self.chat, sender=self.supervisor, content=f"m{i}") for i in range(6)]
+
+        async def reconnect(last_id):
+            communicator = self.communicator(self.student, f"last_id={last_id}".encode())
+            await communicator.send_input({"type": "websocket.connect"})
+            await communicator.receive_output()
+            frames = []
+            while not frames or frames[-1]["type"] != "replay_done":
+                frames.append(json.loads((await communicator.receive_output())["text"]))
+            await communicator.send_input({"type": "websocket.disconnect", "code": 1000})
+            await communicator.wait()
+            return frames
+
+        frames = async_to_sync(reconnect)(messages[3].id)
+        self.assertEqual([[item["message"] for item in frame["items"]] for frame in frames[:-1]], [["m4", "m5"]])
+        self.assertEqual(frames[-1]["last_id"], messages[5].id)
+        self.assertTrue(frames[-1]["complete"])
+
+        frames = async_to_sync(reconnect)(0)
+        self.assertEqual([len(frame["items"]) for frame in frames[:-1]], [2, 2])
+        self.assertEqual(frames[-1]["last_id"], messages[3].id)
+        self.assertFalse(frames[-1]["complete"])
+
+    def test_non_participant_is_rejected(self):
+        async def connect():
+            communicator = self.communicator(self.outsider)
+            await communicator.send_input({"type": "websocket.connect"})
+            return await communicator.receive_output()
+
+        self.assertEqual(async_to_sync(connect)(), {"type": "websocket.close", "code": CLOSE_FORBIDDEN})
+
+    def test_acl_is_loaded_once_and_a_message_is_a_single_insert(self):
+        async def chat_session():
+            communicator = self.communicator(self.student)
+            await communicator.send_input({"type": "websocket.connect"})
+            self.assertEqual((await communicator.receive_output())["type"], "websocket.accept")
+            events = []
+            for text in ("hello", "again"):
+                await communicator.send_input({"type": "websocket.receive", "text": json.dumps({"message": text})})
+                events.append(json.loads((await communicator.receive_output())["text"]))
+            await communicator.send_input({"type": "websocket.disconnect", "code": 1000})
+            await communicator.wait()
+            return events
+
+        counters.get_unread_counts(self.supervisor.id)  # cached, so the messages move the counter
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            events = async_to_sync(chat_session)()
+
+        self.assertEqual([event["message"] for event in events], ["hello", "again"])
+        self.assertEqual(counters.get_unread_count(counters.CHAT, self.supervisor.id), 2)
+        # Presence flushes to UserStatus on its own schedule; the counter push adds no queries
+        sql = [query["sql"] for query in queries if "chat_userstatus" not in query["sql"]]
+        self.assertEqual(len(sql), 3)
+        self.assertIn("chat_chat_participants", sql[0])
+        self.assertTrue(all(statement.startswith('INSERT INTO "chat_message"') for statement in sql[1:]))
+
+    @override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, "DEFAULT_THROTTLE_RATES": {"chat_message": "1/min"}})
+    def test_messages_over_the_rate_are_rejected(self):
+        async def chat_session():
+            communicator = self.communicator(self.student)
+            await communicator.send_input({"type": "websocket.connect"})
+            await communicator.receive_output()
+            replies = []
+            for text in ("hello", "spam"):
+                await communicator.send_input({"type": "websocket.receive", "text": json.dumps({"message": text})})
+                replies.append(json.loads((await communicator.receive_output())["text"]))
+            await communicator.send_input({"type": "websocket.disconnect", "code": 1000})
+            await communicator.wait()
+            return replies
+
+        replies = async_to_sync(chat_session)()
+        self.assertEqual(replies[0]["message"], "hello")
+        self.assertEqual(replies[1]["error"], "Too many messages.")
+        self.assertGreater(replies[1]["retry_after"], 0)
+        self.assertEqual(list(Message.objects.values_list("content", flat=True)), ["hello"])
+
+        # The HTTP API draws from the same budget
+        client = APIClient()
+        client.force_authenticate(self.student)
+        self.assertEqual(client.post(f"/api/chats/{self.chat.id}/messages/", {"content": "x"}).status_code, 429)
+
+
+def allocate_test_id(ids=iter(range(10_000, 1_000_000))):
+    # SQLite has no sequence to reserve from; explicit ids work the same way
+    return next(ids)
+
+
+@skipUnless(connection.vendor == "postgresql", "reserves ids from the PostgreSQL Message sequence")
+@mock.patch("chat.writebehind.run_db", run_db_in_test_thread)
+class ReserveMessageIdTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = make_user("student@example.com")
+        cls.supervisor = make_user("super.visor@example.com", role="Supervisor")
+        cls.chat = Chat.objects.create()
+        cls.chat.participants.set([cls.student, cls.supervisor])
+
+    def test_buffered_and_direct_messages_take_ids_in_arrival_order(self):
+        buffer = MessageWriteBuffer(flush_interval=60)
+
+        async def interleave():
+            buffered = await buffer.submit(self.chat.id, self.student, "buffered", {self.supervisor.id})
+            direct = await sync_to_async(Message.objects.create)(chat=self.chat, sender=self.supervisor, content="direct")
+            later = await buffer.submit(self.chat.id, self.student, "later", {self.supervisor.id})
+            await buffer.flush()
+            return [buffered.id, direct.id, later.id]
+
+        ids = async_to_sync(interleave)()
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(
+            list(Message.objects.order_by("id").values_list("content", flat=True)), ["buffered", "direct", "later"]
+        )
+        self.assertEqual(reserve_message_id(), ids[-1] + 1)
+
+
+@mock.patch("chat.writebehind.run_db", run_db_in_test_thread)
+class MessageWriteBufferTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = make_user("student@example.com")
+        cls.supervisor = make_user("super.visor@example.com", role="Supervisor")
+        cls.chat = Chat.objects.create()
+        cls.chat.participants.set([cls.student, cls.supervisor])
+
+    def setUp(self):
+        cache.clear()
+
+    def submit_all(self, buffer, count, flush=True):
+        async def submit():
+            messages = [
+                await buffer.submit(self.chat.id, self.student, f"m{i}", {self.supervisor.id}) for i in range(count)
+            ]
+            if flush:
+                await buffer.flush()
+            return messages
+        return async_to_sync(submit)()
+
+    def test_messages_are_broadcast_with_ids_and_written_in_one_insert(self):
+        buffer = MessageWriteBuffer(allocate_id=allocate_test_id, flush_interval=60)
+        with CaptureQueriesContext(connection) as queries:
+            messages = self.submit_all(buffer, 5)
+
+        ids = [message.id for message in messages]
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(list(Message.objects.order_by("id").values_list("id", flat=True)), ids)
+        self.assertEqual([query["sql"][:6] for query in queries], ["INSERT"])
+        self.assertEqual(counters.get_unread_count(counters.CHAT, self.supervisor.id), 5)
+        # Stored with the timestamp it was broadcast with
+        stored = dict(Message.objects.values_list("id", "timestamp"))
+        self.assertEqual({message.id: message.timestamp for message in messages}, stored)
+
+    def test_full_batch_flushes_without_waiting_for_the_timer(self):
+        buffer = MessageWriteBuffer(allocate_id=allocate_test_id, max_batch=3, flush_interval=60)
+
+        async def submit_and_yield():
+            for i in range(4):
+                await buffer.submit(self.chat.id, self.student, f"m{i}", {self.supervisor.id})
+            await asyncio.sleep(0)
+            count = await sync_to_async(Message.objects.count)()
+            await buffer.flush()
+            return count
+
+        self.assertEqual(async_to_sync(submit_and_yield)(), 3)
+        self.assertEqual(Message.objects.count(), 4)
+
+    def test_overflow_and_closed_buffer_write_synchronously(self):
+        buffer = MessageWriteBuffer(allocate_id=allocate_test_id, max_pending=2, flush_interval=60)
+        self.submit_all(buffer, 3, flush=False)
+        self.assertEqual(Message.objects.count(), 1)
+
+        buffer.flush_sync()
+        self.assertEqual(Message.objects.count(), 3)
+        self.submit_all(buffer, 1, flush=False)
+        self.assertEqual(Message.objects.count(), 4)
+
+
+    def test_flush_sync_writes_unstarted_batches_and_waits_for_running_ones(self):
+        buffer = MessageWriteBuffer(allocate_id=allocate_test_id, flush_interval=60)
+        message = Message(id=allocate_test_id(), chat=self.chat, sender=self.student, content="queued")
+        message._recipient_ids = {self.supervisor.id}
+        key = object()
+        buffer._unstarted[key] = [message]
+        buffer._running = 1
+
+        def finish_running_batch():
+            with buffer._lock:
+                buffer._running -= 1
+                buffer._idle.notify_all()
+
+        threading.Timer(0.05, finish_running_batch).start()
+        self.assertTrue(buffer.flush_sync(timeout=5))
+        self.assertEqual(Message.objects.get().content, "queued")
+        # The executor reaching the batch later does not write it twice
+        buffer._write_batch(key)
+        self.assertEqual(Message.objects.count(), 1)
+
+        buffer._running = 1
+        with self.assertLogs("chat.writebehind", "ERROR"):
+            self.assertFalse(buffer.flush_sync(timeout=0.01))
+
+
+@mock.patch("chat.consumers.run_db", run_db_in_test_thread)
+class MultiplexConsumerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = make_user("student@example.com")
+        cls.supervisor = make_user("super.visor@example.com", role="Supervisor")
+        cls.outsider = make_user("outsider@example.com")
+        cls.chats = []
+        for other in (cls.supervisor, cls.outsider):
+            chat = Chat.objects.create()
+            chat.participants.set([cls.student, other])
+            cls.chats.append(chat)
+        cls.foreign_chat = Chat.objects.create()
+        cls.foreign_chat.participants.set([cls.supervisor, cls.outsider])
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(presence.flush)
+
+    def test_one_socket_carries_notifications_and_several_chats(self):
+        async def session():
+            communicator = ApplicationCommunicator(MultiplexConsumer.as_asgi(), {
+                "type": "websocket", "path": "/ws/", "user": self.student,
+            })
+
+            async def send(frame):
+                await communicator.send_input({"type": "websocket.receive", "text": json.dumps(frame)})
+
+            async def receive():
+                return json.loads((await communicator.receive_output())["text"])
+
+            await communicator.send_input({"type": "websocket.connect"})
+            self.assertEqual((await communicator.receive_output())["type"], "websocket.accept")
+            self.assertEqual(await receive(), {"type": "unread_count", "notifications": 0, "chat": 0})
+
+            for chat in self.chats:
+                await send({"type": "subscribe", "chat_id": chat.id})
+                self.assertEqual(await receive(), {"type": "subscribed", "chat_id": chat.id})
+            await send({"type": "subscribe", "chat_id": self.foreign_chat.id})
+            self.assertEqual((await receive())["type"], "error")
+
+            await send({"type": "message", "chat_id": self.chats[1].id, "message": "hello"})
+            message = await receive()
+
+            await send({"type": "unsubscribe", "chat_id": self.chats[0].id})
+            self.assertEqual(await receive(), {"type": "unsubscribed", "chat_id": self.chats[0].id})
+            channel_layer = get_channel_layer()
+            await channel_layer.group_send(
+                f"chat_{self.chats[0].id}", {"type": "user_typing", "user": "x", "chat_id": self.chats[0].id}
+            )
+            await channel_layer.group_send(
+                f"user_{self.student.id}", {"type": "send_notification", "id": 7, "message": "Team approved"}
+            )
+            notification = await receive()
+
+            await communicator.send_input({"type": "websocket.disconnect", "code": 1000})
+            await communicator.wait()
+            return message, notification
+
+        message, notification = async_to_sync(session)()
+        self.assertEqual(message["type"], "chat_message")
+        self.assertEqual(message["chat_id"], self.chats[1].id)
+        self.assertEqual(message["message"], "hello")
+        # The typing event for the unsubscribed chat never arrived
+        self.assertEqual(notification, {"type": "notification", "id": 7, "message": "Team approved"})
+
+    def test_compact_protocol_is_negotiated_and_references_senders_by_id(self):
+        async def session():
+            communicator = ApplicationCommunicator(MultiplexConsumer.as_asgi(), {
+                "type": "websocket", "path": "/ws/", "user": self.student,
+                "subprotocols": ["dtest.v2.json", "dtest.v2.msgpack"],
+            })
+            await communicator.send_input({"type": "websocket.connect"})
+            accept = await communicator.receive_output()
+            unread = msgpack.unpackb((await communicator.receive_output())["bytes"])
+
+            frames = []
+            for frame in ({"type": "subscribe", "chat_id": self.chats[0].id},
+                          {"type": "message", "chat_id": self.chats[0].id, "message": "hi"}):
+                await communicator.send_input({"type": "websocket.receive", "bytes": msgpack.packb(frame)})
+                frames.append(msgpack.unpackb((await communicator.receive_output())["bytes"]))
+
+            await communicator.send_input({"type": "websocket.disconnect", "code": 1000})
+            await communicator.wait()
+            return accept, unread, frames
+
+        accept, unread, (subscribed, message) = async_to_sync(session)()
+        self.assertEqual(accept["subprotocol"], "dtest.v2.msgpack")
+        self.assertEqual(unread, {"t": "unread", "n": 0, "c": 0})
+        self.assertEqual(subscribed, {"type": "subscribed", "chat_id": self.chats[0].id})
+        stored = Message.objects.get()
+        self.assertEqual(message, {
+            "t": "msg", "c": self.chats[0].id, "id": stored.id, "s": self.student.id, "m": "hi",
+            "ts": message["ts"],
+        })
+
+
+class ProtocolUsageTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.object(protocol_usage, "refresh", 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_frames_are_encoded_only_in_the_encodings_sockets_use(self):
+        event = with_frames({"type": "typing"}, typing_frame(1, 2))
+        self.assertEqual(event["frames"], {})
+        self.assertEqual(event["frame"], {"t": "typing", "c": 1, "s": 2})
+
+        protocol_usage.connected(V2_MSGPACK)
+        event = with_frames({"type": "typing"}, typing_frame(1, 2))
+        self.assertEqual(list(event["frames"]), [V2_MSGPACK])
+        self.assertIn("frame", event)
+
+        protocol_usage.connected(V2_JSON)
+        self.assertNotIn("frame", with_frames({"type": "typing"}, typing_frame(1, 2)))
+
+        protocol_usage.disconnected(V2_MSGPACK)
+        protocol_usage.disconnected(V2_JSON)
+        self.assertEqual(with_frames({"type": "typing"}, typing_frame(1, 2))["frames"], {})
+
+
+class DeflateServerTests(SimpleTestCase):
+    def test_daphne_factory_accepts_permessage_deflate(self):
+        server = DeflateServer(application=None, endpoints=["tcp:port=0"])
+        server.ws_factory = WebSocketFactory(server, server="daphne")
+        server.ready_callable()
+
+        self.assertTrue(server.ws_factory.allowNullOrigin)
+        accept = server.ws_factory.perMessageCompressionAccept([PerMessageDeflateOffer()])
+        self.assertEqual(accept.get_extension_string(), "permessage-deflate")
+        self.assertIsNone(server.ws_factory.perMessageCompressionAccept([]))
+
+
+class ReadWatermarkTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = make_user("student@example.com")
+        cls.supervisor = make_user("super.visor@example.com", role="Supervisor")
+        cls.chat = Chat.objects.create()
+        cls.chat.participants.set([cls.student, cls.supervisor])
+        cls.messages = [
+            Message.objects.create(chat=cls.chat, sender=cls.supervisor if i < 5 else cls.student, content=f"m{i}")
+            for i in range(7)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.student)
+        self.url = f"/api/chats/{self.chat.id}/read/"
+
+    def test_read_up_to_marks_a_range_in_one_call(self):
+        self.assertEqual(counters.get_unread_count(counters.CHAT, self.student.id), 5)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url, {"last_read_id": self.messages[2].id})
+        self.assertEqual(response.data["last_read_id"], self.messages[2].id)
+        self.assertEqual(counters.get_unread_count(counters.CHAT, self.student.id), 2)
+        self.assertEqual(counters.count_from_db(counters.CHAT, self.student.id), 2)
+
+        # The watermark never moves back
+        self.client.post(self.url, {"last_read_id": self.messages[0].id})
+        self.assertEqual(self.client.get(self.url).data["read_up_to"], {self.student.id: self.messages[2].id})
+
+    def test_is_read_is_derived_from_the_other_participants_watermark(self):
+        mark_read_up_to(self.chat.id, self.supervisor.id, self.messages[5].id)
+        messages = self.client.get(f"/api/chats/{self.chat.id}/history/").data["messages"]
+        self.assertEqual([m["is_read"] for m in messages], [False] * 5 + [True, False])
+
+    def test_receipts_are_coalesced_per_socket(self):
+        channel_layer = get_channel_layer()
+        coalescer = ReadReceiptCoalescer(channel_layer, self.student.id, delay=60)
+
+        async def read_burst():
+            channel = await channel_layer.new_channel()
+            await channel_layer.group_add(f"chat_{self.chat.id}", channel)
+            for message in self.messages[:4]:
+                coalescer.mark(self.chat.id, message.id)
+            await coalescer.close()
+            receipt = await channel_layer.receive(channel)
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(channel_layer.receive(channel), 0.05)
+            return receipt
+
+        with mock.patch("chat.receipts.run_db", run_db_in_test_thread):
+            receipt = async_to_sync(read_burst)()
+        self.assertEqual(receipt["last_read_id"], self.messages[3].id)
+        self.assertEqual(ReadWatermark.objects.get(user=self.student).last_read_id, self.messages[3].id)
+
+
+class StartChatTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = make_user("student@example.com")
+        cls.supervisor = make_user("super.visor@example.com", role="Supervisor")
+
+    def start(self, user, other):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client.post("/api/chats/start/", {"user_id": other.id})
+
+    def test_pair_maps_to_one_chat_from_either_side(self):
+        created = self.start(self.student, self.supervisor)
+        self.assertEqual(created.status_code, 201)
+
+        again = self.start(self.supervisor, self.student)
+        self.assertEqual(again.status_code, 200)
+        self.assertEqual(again.data["id"], created.data["id"])
+        self.assertEqual(Chat.objects.count(), 1)
+        self.assertEqual(
+            {p["id"] for p in again.data["participants"]}, {self.student.id, self.supervisor.id}
+        )
+
+    def test_existing_chat_is_found_by_the_pair_key(self):
+        chat = Chat.objects.create(direct_low=self.student, direct_high=self.supervisor)
+        chat.participants.set([self.student, self.supervisor])
+        # Other chats shared by the same users do not matter
+        for _ in range(3):
+            Chat.objects.create().participants.set([self.student, self.supervisor])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.start(self.student, self.supervisor)
+        self.assertEqual(response.data["id"], chat.id)
+        self.assertEqual(sum('"direct_low_id"' in query["sql"] for query in queries), 1)
+
+
+    def test_merging_duplicate_chats_keeps_unread_messages_unread(self):
+        merge_direct_chats = import_module("chat.migrations.0005_chat_direct_pair").merge_direct_chats
+        older, newer = Chat.objects.create(), Chat.objects.create()
+        for chat in (older, newer):
+            chat.participants.set([self.student, self.supervisor])
+        read, unread = [Message.objects.create(chat=older, sender=self.supervisor, content=c) for c in "ab"]
+        later = [Message.objects.create(chat=newer, sender=self.supervisor, content=c) for c in "cd"]
+        ReadWatermark.objects.create(chat=older, user=self.student, last_read_id=read.id)
+        ReadWatermark.objects.create(chat=newer, user=self.student, last_read_id=later[-1].id)
+
+        merge_direct_chats(django_apps, None)
+
+        self.assertEqual(list(Chat.objects.values_list("id", flat=True)), [older.id])
+        watermark = ReadWatermark.objects.get(user=self.student)
+        self.assertEqual((watermark.chat_id, watermark.last_read_id), (older.id, unread.id - 1))
+
+
+class ChatInboxTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = make_user("student@example.com")
+        cls.others = [make_user(f"other{i}@example.com") for i in range(4)]
+        cls.chats = []
+        for other in cls.others:
+            chat = Chat.objects.create()
+            chat.participants.set([cls.student, other])
+            cls.chats.append(chat)
+        # Activity order: chats[2], chats[0], chats[1]; chats[3] has no messages
+        for chat, sender, content in [
+            (cls.chats[1], cls.others[1], "b1"),
+            (cls.chats[0], cls.others[0], "a1"),
+            (cls.chats[0], cls.others[0], "a2"),
+            (cls.chats[2], cls.student, "c1"),
+        ]:
+            Message.objects.create(chat=chat, sender=sender, content=content)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.student)
+
+    def test_chats_by_activity_with_preview_and_unread_count(self):
+        mark_read_up_to(self.chats[0].id, self.student.id, Message.objects.get(content="a1").id)
+        results = self.client.get("/api/chats/inbox/").data["results"]
+
+        self.assertEqual([chat["id"] for chat in results], [self.chats[i].id for i in (2, 0, 1, 3)])
+        self.assertEqual([chat["last_message"] and chat["last_message"]["content"] for chat in results],
+                         ["c1", "a2", "b1", None])
+        self.assertEqual([chat["unread_count"] for chat in results], [0, 1, 1, 0])
+        self.assertEqual({p["id"] for p in results[0]["participants"]}, {self.student.id, self.others[2].id})
+
+    def test_keyset_pages_with_a_fixed_query_count(self):
+        with self.assertNumQueries(3):
+            first = self.client.get("/api/chats/inbox/?page_size=2").data
+        for i in range(10):
+            chat = Chat.objects.create()
+            chat.participants.set([self.student, make_user(f"extra{i}@example.com")])
+            Message.objects.create(chat=chat, sender=self.student, content="x")
+        with self.assertNumQueries(3):
+            self.client.get("/api/chats/inbox/?page_size=20")
+
+        second = self.client.get(first["next"]).data
+        self.assertEqual([chat["id"] for chat in first["results"] + second["results"]],
+                         [self.chats[i].id for i in (2, 0, 1, 3)])
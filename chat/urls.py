@@ -1,14 +1,18 @@
 from django.urls import path
 from chat.views import (
-    ChatListView, ChatDetailView, MessageListCreateView,
-    MarkMessageReadView, UserStatusView, start_or_get_chat
+    ChatListView, ChatInboxView, ChatDetailView, MessageListCreateView,
+    MessageHistoryView, MarkMessageReadView, ChatReadView, UserStatusView, PresenceView, start_or_get_chat
 )
 
 urlpatterns = [
     path("chats/", ChatListView.as_view()),
+    path("chats/inbox/", ChatInboxView.as_view()),
     path("chats/<int:chat_id>/", ChatDetailView.as_view()),
     path("chats/<int:chat_id>/messages/", MessageListCreateView.as_view()),
+    path("chats/<int:chat_id>/history/", MessageHistoryView.as_view()),
+    path("chats/<int:chat_id>/read/", ChatReadView.as_view()),
     path("messages/<int:id>/read/", MarkMessageReadView.as_view()),
     path("users/<int:user_id>/status/", UserStatusView.as_view()),
+    path("presence/", PresenceView.as_view()),
     path("chats/start/", start_or_get_chat),
 ]
@@ -2,13 +2,20 @@ from rest_framework import generics, status
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from chat.models import Chat, Message, UserStatus
+from chat.models import Chat, Message
 from users.models import CustomUser
 from rest_framework.decorators import api_view, permission_classes
-from chat.serializers import ChatSerializer, MessageSerializer, UserStatusSerializer
+from chat.pagination import InboxCursorPagination
+from chat.serializers import (
+    ChatSerializer, InboxChatSerializer, MessageSerializer, MessageCompactSerializer, UserSerializer,
+    UserStatusSerializer
+)
+from django.db import transaction
+from django.db.models import Q
 from django.shortcuts import get_object_or_404
-from datetime import timedelta
-from django.utils import timezone
+from chat.presence import presence
+from chat.receipts import broadcast_read_receipt, mark_read_up_to, read_watermarks
+from users.throttling import ChatMessageRateThrottle
 
 class ChatListView(generics.ListAPIView):
     serializer_class = ChatSerializer
@@ -18,6 +25,27 @@ class ChatListView(generics.ListAPIView):
         return Chat.objects.filter(participants=self.request.user)
 
 
+class ChatInboxView(generics.ListAPIView):
+    """
+    The user's chats by latest activity, each with its last message preview, the user's
+    unread count and the participants. Three queries per page however many chats there are.
+    """
+    serializer_class = InboxChatSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = InboxCursorPagination
+
+    def get_queryset(self):
+        return Chat.objects.for_inbox(self.request.user)
+
+    def get_serializer(self, page, *args, **kwargs):
+        last_message_ids = [chat.last_message_id for chat in page if chat.last_message_id]
+        kwargs["context"] = {
+            **self.get_serializer_context(),
+            "last_messages": Message.objects.in_bulk(last_message_ids),
+        }
+        return super().get_serializer(page, *args, **kwargs)
+
+
 class ChatDetailView(generics.RetrieveAPIView):
     serializer_class = ChatSerializer
     permission_classes = [IsAuthenticated]
@@ -34,39 +62,140 @@ class MessageListCreateView(generics.ListCreateAPIView):
     def get_queryset(self):
         chat_id = self.kwargs['chat_id']
         chat = get_object_or_404(Chat, id=chat_id, participants=self.request.user)
-        return Message.objects.filter(chat=chat)
+        return Message.objects.filter(chat=chat).select_related('sender').order_by('timestamp', 'id')
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context["read_up_to"] = read_watermarks(self.kwargs['chat_id'])
+        return context
+
+    def get_throttles(self):
+        # Only sending counts against the message rate
+        if self.request.method == "POST":
+            return [ChatMessageRateThrottle()]
+        return super().get_throttles()
 
     def perform_create(self, serializer):
         chat = get_object_or_404(Chat, id=self.kwargs['chat_id'], participants=self.request.user)
         serializer.save(sender=self.request.user, chat=chat)
 
 
+class MessageHistoryView(APIView):
+    """
+    Keyset-paginated chat history over the (chat, timestamp, id) index.
+    ?before=<message id> pages back, ?after=<message id> pages forward, neither returns the latest page.
+    Messages come oldest first; each sender appears once in the "users" map.
+    """
+    permission_classes = [IsAuthenticated]
+    default_limit = 50
+    max_limit = 200
+
+    def get(self, request, chat_id):
+        chat = get_object_or_404(Chat, id=chat_id, participants=request.user)
+        try:
+            limit = min(int(request.query_params.get("limit", self.default_limit)), self.max_limit)
+            before = request.query_params.get("before")
+            after = request.query_params.get("after")
+            before = int(before) if before is not None else None
+            after = int(after) if after is not None else None
+        except ValueError:
+            return Response({"error": "limit, before and after must be integers."}, status=status.HTTP_400_BAD_REQUEST)
+        limit = max(limit, 1)
+
+        messages = Message.objects.filter(chat=chat)
+        if after is not None:
+            anchor = get_object_or_404(Message, id=after, chat=chat)
+            messages = messages.filter(
+                Q(timestamp__gt=anchor.timestamp) | Q(timestamp=anchor.timestamp, id__gt=anchor.id)
+            ).order_by('timestamp', 'id')
+        else:
+            if before is not None:
+                anchor = get_object_or_404(Message, id=before, chat=chat)
+                messages = messages.filter(
+                    Q(timestamp__lt=anchor.timestamp) | Q(timestamp=anchor.timestamp, id__lt=anchor.id)
+                )
+            messages = messages.order_by('-timestamp', '-id')
+
+        page = list(messages[:limit + 1])
+        has_more = len(page) > limit
+        page = page[:limit]
+        if after is None:
+            page.reverse()
+
+        sender_ids = {message.sender_id for message in page}
+        senders = CustomUser.objects.filter(id__in=sender_ids).select_related(
+            'student_profile', 'supervisor_profile', 'dean_office_profile'
+        )
+        return Response({
+            "messages": MessageCompactSerializer(page, many=True, context={"read_up_to": read_watermarks(chat.id)}).data,
+            "users": {user.id: UserSerializer(user).data for user in senders},
+            "has_more": has_more,
+        })
+
+
 class MarkMessageReadView(APIView):
+    """ Kept for older clients: marks the chat read up to this message """
     permission_classes = [IsAuthenticated]
 
     def patch(self, request, id):
         msg = get_object_or_404(Message, id=id, chat__participants=request.user)
-        msg.is_read = True
-        msg.save()
+        last_read_id = mark_read_up_to(msg.chat_id, request.user.id, msg.id)
+        if last_read_id is not None:
+            broadcast_read_receipt(msg.chat_id, request.user.id, last_read_id)
         return Response({"status": "marked as read"})
 
 
+class ChatReadView(APIView):
+    """
+    GET: every participant's read watermark, {"read_up_to": {user_id: message_id}}.
+    POST {"last_read_id": n}: marks everything up to message n as read in one call.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, chat_id):
+        chat = get_object_or_404(Chat, id=chat_id, participants=request.user)
+        return Response({"chat_id": chat.id, "read_up_to": read_watermarks(chat.id)})
+
+    def post(self, request, chat_id):
+        chat = get_object_or_404(Chat, id=chat_id, participants=request.user)
+        try:
+            message_id = int(request.data.get("last_read_id"))
+        except (TypeError, ValueError):
+            return Response({"error": "last_read_id must be a message id."}, status=status.HTTP_400_BAD_REQUEST)
+
+        last_read_id = mark_read_up_to(chat.id, request.user.id, message_id)
+        if last_read_id is not None:
+            broadcast_read_receipt(chat.id, request.user.id, last_read_id)
+        return Response({"chat_id": chat.id, "last_read_id": read_watermarks(chat.id).get(request.user.id, 0)})
+
+
 class UserStatusView(APIView):
     def get(self, request, user_id):
-        status = get_object_or_404(UserStatus, user__id=user_id)
-        serializer = UserStatusSerializer(status)
-        data = serializer.data
-
-        now = timezone.now()
-        last_seen = status.last_seen
+        info = presence.get_many([user_id]).get(user_id)
+        if info is None:
+            return Response({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(UserStatusSerializer(info).data)
 
-        # Если прошло больше 60 секунд с момента последнего пинга
-        if now - last_seen > timedelta(seconds=60):
-            data["is_online"] = False
-        else:
-            data["is_online"] = True
 
-        return Response(data)
+class PresenceView(APIView):
+    """ Bulk presence for chat lists: ?ids=1,2,3 -> {"1": {"is_online": ..., "last_seen": ...}, ...} """
+    permission_classes = [IsAuthenticated]
+    max_ids = 200
+
+    def get(self, request):
+        try:
+            user_ids = [int(user_id) for user_id in request.query_params.get("ids", "").split(",") if user_id.strip()]
+        except ValueError:
+            return Response({"error": "ids must be a comma-separated list of user ids."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if len(user_ids) > self.max_ids:
+            return Response({"error": f"At most {self.max_ids} ids per request."}, status=status.HTTP_400_BAD_REQUEST)
+
+        found = presence.get_many(user_ids)
+        return Response({
+            user_id: UserStatusSerializer(found.get(user_id, {"is_online": False, "last_seen": None})).data
+            for user_id in user_ids
+        })
 
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
@@ -82,17 +211,13 @@ def start_or_get_chat(request):
 
     current_user = request.user
 
-    # Поиск существующего чата с этими двумя участниками
-    existing_chats = Chat.objects.filter(participants=current_user).filter(participants=target_user)
-    for chat in existing_chats:
-        if chat.participants.count() == 2:
-            serializer = ChatSerializer(chat)
-            return Response(serializer.data, status=status.HTTP_200_OK)
-
-    # Чата нет — создаём новый
-    new_chat = Chat.objects.create()
-    new_chat.participants.set([current_user, target_user])
-    new_chat.save()
+    # One indexed lookup on the pair key; a concurrent request creating the same
+    # chat hits the unique constraint and get_or_create returns the winner's row
+    low, high = Chat.direct_pair(current_user.id, target_user.id)
+    with transaction.atomic():
+        chat, created = Chat.objects.get_or_create(direct_low_id=low, direct_high_id=high)
+        if created:
+            chat.participants.set([current_user, target_user])
 
-    serializer = ChatSerializer(new_chat)
-    return Response(serializer.data, status=status.HTTP_201_CREATED)
\ No newline at end of file
+    serializer = ChatSerializer(chat)
+    return Response(serializer.data, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
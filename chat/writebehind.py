@@ -0,0 +1,176 @@
+"""
+Optional write-behind for chat messages, enabled with CHAT_WRITE_BEHIND.
+
+A message takes its primary key from the Message sequence with one nextval when
+it arrives, before it is broadcast, so ids follow arrival order across processes
+and interleave correctly with messages inserted directly. Replay (id > last_id)
+and read watermarks rely on that. The message is broadcast straight away and inserted later together with other
+messages: the buffer flushes with one bulk_create after FLUSH_INTERVAL seconds or
+MAX_BATCH messages, whichever comes first. The row is stored with the timestamp it
+was broadcast with.
+
+Messages fall back to a synchronous INSERT when MAX_PENDING messages are already
+waiting or once the buffer is closed. At exit an atexit hook writes the rows still
+buffered, or handed to a batch that has not started, and waits up to
+EXIT_TIMEOUT for batches being written; only a hard kill can lose the last
+FLUSH_INTERVAL.
+Id reservation needs PostgreSQL.
+"""
+import asyncio
+import atexit
+import logging
+import threading
+from collections import Counter, defaultdict
+
+from django.db import connection
+from django.utils import timezone
+
+from chat.db import run_db
+from chat.models import Message
+from notifications import counters
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH = 200
+FLUSH_INTERVAL = 0.005  # seconds
+MAX_PENDING = 5000
+EXIT_TIMEOUT = 10  # seconds flush_sync waits for batches already being written
+
+
+def reserve_message_id():
+    """ Takes the next id from the Message id sequence without inserting a row """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT nextval(pg_get_serial_sequence(%s, 'id'))", [Message._meta.db_table])
+        return cursor.fetchone()[0]
+
+
+def write_messages(messages):
+    """
+    Inserts buffered messages with one query. bulk_create skips post_save, so the
+    recipients' unread counters are bumped here, one call per distinct delta.
+    """
+    try:
+        Message.objects.bulk_create(messages)
+    except Exception:
+        # One bad row must not lose the batch; save() also fires the unread signal
+        logger.exception("Bulk insert of %s message(s) failed, writing them one by one", len(messages))
+        for message in messages:
+            try:
+                message.save(force_insert=True)
+            except Exception:
+                logger.exception("Lost chat message %s in chat %s", message.id, message.chat_id)
+        return
+
+    unread = Counter(user_id for message in messages for user_id in message._recipient_ids)
+    by_delta = defaultdict(list)
+    for user_id, delta in unread.items():
+        by_delta[delta].append(user_id)
+    for delta, user_ids in by_delta.items():
+        counters.increment(counters.CHAT, user_ids, delta)
+
+
+class MessageWriteBuffer:
+    def __init__(self, allocate_id=reserve_message_id, max_batch=MAX_BATCH, flush_interval=FLUSH_INTERVAL,
+                 max_pending=MAX_PENDING):
+        self.allocate_id = allocate_id
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.closed = False
+        self._pending = []
+        self._in_flight = 0
+        self._tasks = set()
+        self._timer = None
+        # The atexit hook reads _pending and _unstarted from outside the event loop
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._unstarted = {}
+        self._running = 0
+
+    async def submit(self, chat_id, sender, content, recipient_ids):
+        """ Returns the message with its id and timestamp set; the row may not exist yet """
+        message = Message(chat_id=chat_id, sender=sender, content=content, timestamp=timezone.now())
+        message._recipient_ids = recipient_ids
+
+        if self.closed or len(self._pending) + self._in_flight >= self.max_pending:
+            await run_db(message.save)
+            return message
+
+        message.id = await run_db(self.allocate_id)
+        with self._lock:
+            self._pending.append(message)
+            pending = len(self._pending)
+        if pending >= self.max_batch:
+            self._start_flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.flush_interval, self._start_flush)
+        return message
+
+    def _start_flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return
+        self._in_flight += len(batch)
+        task = asyncio.get_running_loop().create_task(self._write(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _write(self, batch):
+        key = object()
+        with self._lock:
+            self._unstarted[key] = batch
+        try:
+            await run_db(self._write_batch, key)
+        finally:
+            self._in_flight -= len(batch)
+
+    def _write_batch(self, key):
+        """ On the db executor; a batch flush_sync has already written is skipped """
+        with self._lock:
+            batch = self._unstarted.pop(key, None)
+            if batch is None:
+                return
+            self._running += 1
+        try:
+            write_messages(batch)
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._idle.notify_all()
+
+    async def flush(self):
+        """ Writes everything buffered so far and waits for in-flight batches """
+        self._start_flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks)
+
+    async def close(self):
+        self.closed = True
+        await self.flush()
+
+    def flush_sync(self, timeout=EXIT_TIMEOUT):
+        """
+        Last resort at interpreter exit, when the event loop is gone: writes what has not
+        started and waits for the batches being written. Returns False if they did not finish.
+        """
+        self.closed = True
+        with self._lock:
+            batches = [self._pending, *self._unstarted.values()]
+            self._pending = []
+            self._unstarted.clear()
+        for batch in batches:
+            if batch:
+                write_messages(batch)
+        with self._lock:
+            finished = self._idle.wait_for(lambda: self._running == 0, timeout)
+        if not finished:
+            logger.error("Chat message batches were still being written at exit")
+        return finished
+
+
+message_buffer = MessageWriteBuffer()
+atexit.register(message_buffer.flush_sync)
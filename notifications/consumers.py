@@ -1,12 +1,18 @@
 import json
+from functools import partial
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
 from django.contrib.auth import get_user_model
 from notifications.models import Notification
+from chat.protocol import ProtocolMixin
+from chat.replay import last_id_from_query, replay_gap
+from notifications.counters import get_unread_counts, unread_count_event
+from notifications.replay import notification_gap, notification_items
 
 User = get_user_model()
 
 
-class NotificationConsumer(AsyncWebsocketConsumer):
+class NotificationConsumer(ProtocolMixin, AsyncWebsocketConsumer):
     """ WebSocket Consumer to handle real-time notifications """
 
     async def connect(self):
@@ -15,7 +21,16 @@ class NotificationConsumer(AsyncWebsocketConsumer):
         if self.user.is_authenticated:
             self.group_name = f"user_{self.user.id}"
             await self.channel_layer.group_add(self.group_name, self.channel_name)
-            await self.accept()
+            await self.accept_protocol()
+            counts = await database_sync_to_async(get_unread_counts)(self.user.id)
+            await self.unread_count(unread_count_event(counts))
+
+            # ?last_id=<n>: replay notifications created while the socket was down
+            last_id = last_id_from_query(self.scope)
+            if last_id is not None:
+                await replay_gap(
+                    self, partial(notification_gap, self.user.id), notification_items, last_id, "notifications"
+                )
         else:
             await self.close()
 
@@ -30,5 +45,19 @@ class NotificationConsumer(AsyncWebsocketConsumer):
 
     async def send_notification(self, event):
         """ Send a real-time notification to the user """
+        if self.protocol:
+            await self.send_frame(event)
+            return
         message = event["message"]
-        await self.send(text_data=json.dumps({"message": message}))
\ No newline at end of file
+        await self.send(text_data=json.dumps({"id": event.get("id"), "message": message}))
+
+    async def unread_count(self, event):
+        """ Pushes badge counters so the client does not have to poll """
+        if self.protocol:
+            await self.send_frame(event)
+            return
+        # A push after a single counter change carries only that counter
+        await self.send(text_data=json.dumps({
+            "type": "unread_count",
+            **{kind: event[kind] for kind in ("notifications", "chat") if kind in event},
+        }))
@@ -0,0 +1,139 @@
+"""
+Unread counters for notifications and chat messages, kept in the default cache.
+
+Counters are filled from the database on first read and then moved with incr/decr
+as rows are created or read. They expire after COUNTER_TIMEOUT, so every counter is
+reconciled against the database periodically, and a missing key always falls back
+to a fresh count. Cache or channel-layer failures never fail the calling request.
+
+A counter change is pushed to the user with the value incr returned, and only
+for that counter; the event leaves the other one out. The push runs on
+push_executor, so neither a query nor a channel-layer round trip is added to the
+message or read-receipt path.
+"""
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.core.cache import cache
+from django.db import transaction
+
+from chat.protocol import unread_frame, with_frames
+
+logger = logging.getLogger(__name__)
+
+NOTIFICATIONS = "notifications"
+CHAT = "chat"
+COUNTER_TIMEOUT = 300
+
+push_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="unread-push")
+
+
+def counter_key(kind, user_id):
+    return f"unread:{kind}:{user_id}"
+
+
+def count_from_db(kind, user_id):
+    if kind == NOTIFICATIONS:
+        from notifications.models import Notification
+        return Notification.objects.filter(user_id=user_id, is_read=False).count()
+    from chat.receipts import unread_messages
+    return unread_messages(user_id).count()
+
+
+def get_unread_counts(user_id):
+    """ Returns {"notifications": n, "chat": m}, counting in the database only on a cache miss """
+    keys = {kind: counter_key(kind, user_id) for kind in (NOTIFICATIONS, CHAT)}
+    try:
+        cached = cache.get_many(keys.values())
+    except Exception:
+        logger.exception("Unread counter cache unavailable")
+        cached = {}
+
+    counts = {}
+    for kind, key in keys.items():
+        if key in cached:
+            counts[kind] = max(cached[key], 0)
+            continue
+        counts[kind] = count_from_db(kind, user_id)
+        try:
+            cache.add(key, counts[kind], timeout=COUNTER_TIMEOUT)
+        except Exception:
+            logger.exception("Unread counter cache unavailable")
+    return counts
+
+
+def get_unread_count(kind, user_id):
+    return get_unread_counts(user_id)[kind]
+
+
+def _apply(kind, user_ids, delta, push):
+    values = {}
+    for user_id in user_ids:
+        key = counter_key(kind, user_id)
+        try:
+            value = cache.incr(key, delta)
+        except ValueError:
+            # Not cached: the next read counts from the database
+            continue
+        except Exception:
+            logger.exception("Unread counter cache unavailable")
+            return
+        if value < 0:
+            cache.delete(key)
+            continue
+        values[user_id] = value
+    if push and values:
+        events = {user_id: unread_count_event({kind: value}) for user_id, value in values.items()}
+        push_executor.submit(send_unread_events, events)
+
+
+def increment(kind, user_ids, delta=1, push=True):
+    """ Bumps the counters once the surrounding transaction commits """
+    user_ids = list(user_ids)
+    if user_ids:
+        transaction.on_commit(lambda: _apply(kind, user_ids, delta, push))
+
+
+def decrement(kind, user_ids, delta=1, push=True):
+    increment(kind, user_ids, -delta, push)
+
+
+def reset(kind, user_id):
+    """ Drops a counter after a bulk change; it is recounted on the next read """
+    def drop():
+        try:
+            cache.delete(counter_key(kind, user_id))
+        except Exception:
+            logger.exception("Unread counter cache unavailable")
+        push_unread_counts([user_id])
+    transaction.on_commit(drop)
+
+
+def unread_count_event(counts):
+    """ counts may hold only the counter that changed """
+    return with_frames({"type": "unread_count", **counts}, unread_frame(counts.get(NOTIFICATIONS), counts.get(CHAT)))
+
+
+def push_unread_counts(user_ids):
+    """ Sends the full current counts to each user, e.g. after a reset or from the dispatcher """
+    send_unread_events({user_id: unread_count_event(get_unread_counts(user_id)) for user_id in user_ids})
+
+
+def send_unread_events(events):
+    """ Sends {user_id: event} to the users' notification sockets, all in one event loop hop """
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+
+    async def send_all():
+        await asyncio.gather(
+            *(channel_layer.group_send(f"user_{user_id}", event) for user_id, event in events.items())
+        )
+
+    try:
+        async_to_sync(send_all)()
+    except Exception:
+        logger.exception("Failed to push unread counts to %s user(s)", len(events))
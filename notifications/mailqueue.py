@@ -0,0 +1,147 @@
+"""
+Outbound email queue, so requests do not wait on SMTP.
+
+queue_email() stores an OutboundEmail row, in the caller's transaction. The
+send_queued_email worker claims batches the same way the notification outbox does
+(SELECT ... FOR UPDATE SKIP LOCKED plus a lease, so several workers can run) and
+sends each batch over one connection from the configured EMAIL_BACKEND: one TLS
+handshake per batch instead of one per email. A failed email is retried with
+exponential backoff up to MAX_ATTEMPTS times; the error is kept on the row.
+
+Every SMTP operation is bounded by EMAIL_TIMEOUT. Before each send the worker
+extends the lease on the rest of its batch whenever less than send_allowance()
+is left, so a slow server never lets a second worker claim, and resend, emails
+that are still being sent. The body of an email, e.g. a live password reset
+link, is cleared once it has been sent or has used up its attempts.
+"""
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Case, F, Q, Value, When
+from django.utils import timezone
+
+from .models import OutboundEmail
+from .outbox import retry_at
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 50
+POLL_INTERVAL = 2  # seconds between polls when the queue is empty
+LEASE = timedelta(minutes=2)  # claimed rows are hidden from other workers for this long
+DEFAULT_EMAIL_TIMEOUT = 30  # seconds, when settings.EMAIL_TIMEOUT is not set
+MAX_ATTEMPTS = 8
+MAX_BACKOFF = 60 * 60  # seconds
+
+
+def queue_email(subject, body, to, from_email=None):
+    """ Queues an email for the worker; returns the OutboundEmail row """
+    return OutboundEmail.objects.create(
+        subject=subject,
+        body=body,
+        from_email=from_email or settings.EMAIL_HOST_USER,
+        to=list(to),
+    )
+
+
+def email_timeout():
+    return getattr(settings, "EMAIL_TIMEOUT", None) or DEFAULT_EMAIL_TIMEOUT
+
+
+def send_allowance():
+    """ The longest one email can take: a send, then closing and reopening the connection after a failure """
+    return timedelta(seconds=3 * email_timeout())
+
+
+def extend_lease(email_ids):
+    """ Hides email_ids from other workers for at least another LEASE; returns the new expiry """
+    lease_until = timezone.now() + max(LEASE, 2 * send_allowance())
+    OutboundEmail.objects.filter(id__in=email_ids, sent_at__isnull=True).update(next_attempt_at=lease_until)
+    return lease_until
+
+
+def claim_batch(batch_size=BATCH_SIZE):
+    now = timezone.now()
+    with transaction.atomic():
+        batch = list(
+            OutboundEmail.objects.select_for_update(skip_locked=True)
+            .filter(sent_at__isnull=True, attempts__lt=MAX_ATTEMPTS)
+            .filter(Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now))
+            .order_by("id")[:batch_size]
+        )
+        if batch:
+            OutboundEmail.objects.filter(id__in=[email.id for email in batch]).update(next_attempt_at=now + LEASE)
+    return batch
+
+
+def send_batch(batch_size=BATCH_SIZE):
+    """ Sends one batch over a single connection; returns how many emails were claimed """
+    # Taken before claiming, so it never overestimates the lease claim_batch sets
+    lease_until = timezone.now() + LEASE
+    batch = claim_batch(batch_size)
+    if not batch:
+        return 0
+
+    sent, failed = [], []
+    connection = get_connection(timeout=email_timeout())
+    try:
+        connection.open()
+        for index, email in enumerate(batch):
+            if timezone.now() + send_allowance() > lease_until:
+                lease_until = extend_lease([email.id for email in batch[index:]])
+            message = EmailMessage(email.subject, email.body, email.from_email, email.to, connection=connection)
+            try:
+                message.send()
+            except Exception as e:
+                failed.append((email, e))
+                # The connection may be broken; start the rest of the batch on a fresh one
+                connection.close()
+                connection.open()
+            else:
+                sent.append(email.id)
+    except Exception as e:
+        # Could not (re)connect: the rest of the batch waits for the retry
+        done = set(sent) | {email.id for email, _ in failed}
+        failed.extend((email, e) for email in batch if email.id not in done)
+    finally:
+        connection.close()
+
+    if sent:
+        OutboundEmail.objects.filter(id__in=sent).update(sent_at=timezone.now(), body="")
+    if failed:
+        logger.warning("Failed to send %s email(s), will retry: %s", len(failed), failed[0][1])
+        mark_failed(failed)
+    return len(batch)
+
+
+def mark_failed(failures):
+    """ Schedules a retry with exponential backoff, in one UPDATE for the whole batch """
+    errors = {email.id: str(error) for email, error in failures}
+    if len(set(errors.values())) == 1:
+        # Usually the whole batch failed the same way, e.g. the SMTP server is down
+        last_error = Value(next(iter(errors.values())))
+    else:
+        last_error = Case(*(When(id=email_id, then=Value(error)) for email_id, error in errors.items()))
+    OutboundEmail.objects.filter(id__in=errors).update(
+        attempts=F("attempts") + 1,
+        next_attempt_at=retry_at("attempts", timezone.now(), 60, MAX_BACKOFF, MAX_ATTEMPTS),
+        last_error=last_error,
+    )
+    exhausted = [email.id for email, _ in failures if email.attempts + 1 >= MAX_ATTEMPTS]
+    if exhausted:
+        OutboundEmail.objects.filter(id__in=exhausted).update(body="")
+        logger.error("Giving up on %s email(s) after %s attempts: %s", len(exhausted), MAX_ATTEMPTS, exhausted)
+
+
+def send_forever(batch_size=BATCH_SIZE, poll_interval=POLL_INTERVAL):
+    while True:
+        try:
+            claimed = send_batch(batch_size)
+        except Exception:
+            logger.exception("Email worker iteration failed")
+            claimed = 0
+        if claimed < batch_size:
+            time.sleep(poll_interval)
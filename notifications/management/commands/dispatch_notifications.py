@@ -0,0 +1,17 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from notifications.outbox import BATCH_SIZE, POLL_INTERVAL, dispatch_forever
+
+
+class Command(BaseCommand):
+    help = "Drains the notification outbox to the channel layer (run as a separate process)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+        parser.add_argument("--poll-interval", type=float, default=POLL_INTERVAL)
+
+    def handle(self, *args, **options):
+        self.stdout.write("Dispatching notifications...")
+        asyncio.run(dispatch_forever(options["batch_size"], options["poll_interval"]))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from notifications.mailqueue import BATCH_SIZE, POLL_INTERVAL, send_batch, send_forever
+
+
+class Command(BaseCommand):
+    help = "Sends queued outbound email over reused connections (run as a separate process)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+        parser.add_argument("--poll-interval", type=float, default=POLL_INTERVAL)
+        parser.add_argument("--once", action="store_true", help="Send what is due and exit")
+
+    def handle(self, *args, **options):
+        if options["once"]:
+            total = 0
+            while claimed := send_batch(options["batch_size"]):
+                total += claimed
+            self.stdout.write(f"Processed {total} email(s).")
+            return
+        self.stdout.write("Sending queued email...")
+        send_forever(options["batch_size"], options["poll_interval"])
@@ -3,7 +3,7 @@ from channels.middleware import BaseMiddleware
 from channels.db import database_sync_to_async
 from django.contrib.auth.models import AnonymousUser
 from rest_framework_simplejwt.tokens import UntypedToken
-from rest_framework_simplejwt.authentication import JWTAuthentication
+from users.authentication import CachedJWTAuthentication
 from jwt import decode as jwt_decode
 from django.conf import settings
 from django.contrib.auth import get_user_model
@@ -13,7 +13,7 @@ User = get_user_model()
 @database_sync_to_async
 def get_user(validated_token):
     try:
-        jwt_auth = JWTAuthentication()
+        jwt_auth = CachedJWTAuthentication()
         user = jwt_auth.get_user(validated_token)
         return user
     except Exception:
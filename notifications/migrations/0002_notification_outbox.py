@@ -0,0 +1,41 @@
+# Generated by Django 5.1.6 on 2026-10-18 16:19
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def mark_existing_delivered(apps, schema_editor):
+    """ Notifications created before the outbox were already pushed inline """
+    Notification = apps.get_model('notifications', 'Notification')
+    Notification.objects.filter(delivered_at__isnull=True).update(delivered_at=models.F('timestamp'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='delivered_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='delivery_attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='next_attempt_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(mark_existing_delivered, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('delivered_at__isnull', True)), fields=['id'], name='notification_outbox_idx'),
+        ),
+    ]
@@ -7,6 +7,37 @@ class Notification(models.Model):
     message = models.TextField()
     is_read = models.BooleanField(default=False)
     timestamp = models.DateTimeField(auto_now_add=True)
+    # Outbox state: rows are written with the state change and pushed over WebSocket by dispatch_notifications
+    delivered_at = models.DateTimeField(null=True, blank=True)
+    delivery_attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['id'], condition=models.Q(delivered_at__isnull=True), name='notification_outbox_idx'),
+            # Feed pages and since=<id> deltas walk (user, id); is_read is carried for index-only unread counts
+            models.Index(fields=['user', 'id'], include=['is_read'], name='notification_user_feed_idx'),
+        ]
+
+    def __str__(self):
+        return f"Notification for {self.user.email}: {self.message}"
+
+class OutboundEmail(models.Model):
+    """ Email queued by notifications.mailqueue and sent by the send_queued_email worker """
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255, blank=True)
+    to = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['id'], condition=models.Q(sent_at__isnull=True), name='outbound_email_queue_idx'),
+        ]
 
     def __str__(self):
-        return f"Notification for {self.user.email}: {self.message}"
\ No newline at end of file
+        return f"{self.subject} → {', '.join(self.to)}"
@@ -0,0 +1,117 @@
+import asyncio
+import logging
+from datetime import timedelta
+
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.db.models import Case, F, Q, Value, When
+from django.utils import timezone
+
+from chat.protocol import notification_frame, with_frames
+
+from . import counters
+from .models import Notification
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 200
+POLL_INTERVAL = 0.5  # seconds between polls when the outbox is empty
+LEASE = timedelta(seconds=30)  # claimed rows are hidden from other dispatchers for this long
+MAX_ATTEMPTS = 10
+MAX_BACKOFF = 300  # seconds
+
+
+def claim_batch(batch_size=BATCH_SIZE):
+    """
+    Claims up to batch_size undelivered notifications by pushing next_attempt_at past the lease,
+    so several dispatchers can run side by side without sending the same row twice.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        batch = list(
+            Notification.objects.select_for_update(skip_locked=True)
+            .filter(delivered_at__isnull=True, delivery_attempts__lt=MAX_ATTEMPTS)
+            .filter(Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now))
+            .order_by("id")
+            .values("id", "user_id", "message", "timestamp")[:batch_size]
+        )
+        if batch:
+            Notification.objects.filter(id__in=[row["id"] for row in batch]).update(next_attempt_at=now + LEASE)
+    return batch
+
+
+def mark_delivered(notification_ids):
+    Notification.objects.filter(id__in=notification_ids).update(delivered_at=timezone.now())
+
+
+def retry_at(attempts_field, now, base_delay, max_backoff, max_attempts):
+    """ now + min(base_delay * 2 ** attempts, max_backoff), as one CASE over the attempts column """
+    return Case(
+        *(
+            When(**{attempts_field: attempts}, then=Value(now + timedelta(seconds=min(base_delay * 2 ** attempts, max_backoff))))
+            for attempts in range(max_attempts)
+        ),
+        default=Value(now + timedelta(seconds=max_backoff)),
+    )
+
+
+def mark_failed(notification_ids):
+    """ Schedules a retry with exponential backoff, in one UPDATE for the whole batch """
+    Notification.objects.filter(id__in=notification_ids).update(
+        delivery_attempts=F("delivery_attempts") + 1,
+        next_attempt_at=retry_at("delivery_attempts", timezone.now(), 1, MAX_BACKOFF, MAX_ATTEMPTS),
+    )
+    # claim_batch skips these from now on
+    exhausted = list(
+        Notification.objects.filter(id__in=notification_ids, delivery_attempts__gte=MAX_ATTEMPTS).values_list("id", flat=True)
+    )
+    if exhausted:
+        logger.error("Giving up on %s notification(s) after %s attempts: %s", len(exhausted), MAX_ATTEMPTS, exhausted)
+
+
+def notification_event(row):
+    return with_frames(
+        {
+            "type": "send_notification",
+            "id": row["id"],
+            "message": row["message"],
+            "timestamp": row["timestamp"].isoformat(),
+        },
+        notification_frame(row["id"], row["message"], row["timestamp"]),
+    )
+
+
+async def dispatch_batch(channel_layer, batch_size=BATCH_SIZE):
+    """ Pushes one batch to the channel layer; returns how many rows were claimed """
+    batch = await database_sync_to_async(claim_batch)(batch_size)
+    if not batch:
+        return 0
+
+    results = await asyncio.gather(
+        *(channel_layer.group_send(f"user_{row['user_id']}", notification_event(row)) for row in batch),
+        return_exceptions=True,
+    )
+    delivered = [row["id"] for row, result in zip(batch, results) if not isinstance(result, Exception)]
+    errors = [(row["id"], result) for row, result in zip(batch, results) if isinstance(result, Exception)]
+
+    if delivered:
+        await database_sync_to_async(mark_delivered)(delivered)
+        delivered_users = {row["user_id"] for row, result in zip(batch, results) if not isinstance(result, Exception)}
+        await database_sync_to_async(counters.push_unread_counts)(delivered_users)
+    if errors:
+        logger.warning("Failed to push %s notification(s), will retry: %s", len(errors), errors[0][1])
+        await database_sync_to_async(mark_failed)([notification_id for notification_id, _ in errors])
+    return len(batch)
+
+
+async def dispatch_forever(batch_size=BATCH_SIZE, poll_interval=POLL_INTERVAL):
+    channel_layer = get_channel_layer()
+    while True:
+        try:
+            claimed = await dispatch_batch(channel_layer, batch_size)
+        except Exception:
+            logger.exception("Notification dispatcher iteration failed")
+            claimed = 0
+        if claimed < batch_size:
+            await asyncio.sleep(poll_interval)
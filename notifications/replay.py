@@ -0,0 +1,17 @@
+from chat.protocol import notification_frame
+
+from .models import Notification
+
+
+def notification_gap(user_id, after_id, limit):
+    return list(
+        Notification.objects.filter(user_id=user_id, id__gt=after_id)
+        .order_by("id")
+        .values("id", "message", "timestamp")[:limit]
+    )
+
+
+def notification_items(rows, protocol):
+    if protocol:
+        return [notification_frame(row["id"], row["message"], row["timestamp"]) for row in rows]
+    return [{"id": row["id"], "message": row["message"], "timestamp": row["timestamp"].isoformat()} for row in rows]
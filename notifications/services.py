@@ -0,0 +1,26 @@
+from . import counters
+from .models import Notification
+
+
+def notify_many(users, message):
+    """
+    Stores one notification per user with a single bulk insert.
+
+    The rows are the outbox: they commit or roll back together with the caller's
+    transaction, and the dispatch_notifications process pushes them over WebSocket.
+    """
+    users = list(users)
+    if not users:
+        return []
+
+    notifications = Notification.objects.bulk_create(
+        [Notification(user=user, message=message) for user in users]
+    )
+    # The outbox dispatcher pushes the new counts together with the notifications
+    counters.increment(counters.NOTIFICATIONS, [user.id for user in users], push=False)
+    return notifications
+
+
+def send_notification(user, message):
+    """ Sends a notification to a user (DB + WebSocket) """
+    return notify_many([user], message)[0]
@@ -1,3 +1,271 @@
+import json
+from datetime import timedelta
+from unittest import mock
+
+from asgiref.sync import async_to_sync, sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from channels.layers import get_channel_layer
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail import EmailMessage, get_connection
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from chat.models import Chat, Message
+from notifications import counters
+from notifications.consumers import NotificationConsumer
+from notifications.mailqueue import queue_email, send_allowance, send_batch
+from notifications.models import Notification, OutboundEmail
+from notifications.outbox import dispatch_batch, mark_failed, MAX_ATTEMPTS, MAX_BACKOFF
+from notifications.services import notify_many
+from users.models import CustomUser
+
+
+class NotifyManyTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            CustomUser.objects.create_user(email=f"student_{i}@example.com", password="pass12345", role="Student")
+            for i in range(5)
+        ]
+
+    def test_single_insert_left_for_the_dispatcher(self):
+        with self.assertNumQueries(1):
+            notify_many(self.users, "Team is full")
+        self.assertEqual(Notification.objects.filter(message="Team is full", delivered_at__isnull=True).count(), 5)
+
+
+# database_sync_to_async closes "old" connections, which would end the test transaction
+@mock.patch("notifications.outbox.database_sync_to_async", sync_to_async)
+class OutboxDispatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            CustomUser.objects.create_user(email=f"student_{i}@example.com", password="pass12345", role="Student")
+            for i in range(3)
+        ]
+
+    def subscribe(self, channel_layer):
+        channels = {}
+        for user in self.users:
+            channel = async_to_sync(channel_layer.new_channel)()
+            async_to_sync(channel_layer.group_add)(f"user_{user.id}", channel)
+            channels[user.id] = channel
+        return channels
+
+    def test_dispatch_pushes_and_marks_delivered(self):
+        notifications = notify_many(self.users, "hello")
+        channel_layer = get_channel_layer()
+        channels = self.subscribe(channel_layer)
+
+        self.assertEqual(async_to_sync(dispatch_batch)(channel_layer), 3)
+
+        for notification in notifications:
+            event = async_to_sync(channel_layer.receive)(channels[notification.user_id])
+            self.assertEqual(event["id"], notification.id)
+            self.assertEqual(event["message"], "hello")
+        self.assertFalse(Notification.objects.filter(delivered_at__isnull=True).exists())
+        self.assertEqual(async_to_sync(dispatch_batch)(channel_layer), 0)
+
+    def test_failed_push_is_retried_later(self):
+        notify_many(self.users[:1], "hello")
+        channel_layer = mock.Mock()
+        channel_layer.group_send = mock.AsyncMock(side_effect=ConnectionError("redis down"))
+
+        self.assertEqual(async_to_sync(dispatch_batch)(channel_layer), 1)
+
+        notification = Notification.objects.get()
+        self.assertIsNone(notification.delivered_at)
+        self.assertEqual(notification.delivery_attempts, 1)
+        self.assertIsNotNone(notification.next_attempt_at)
+        # Backed off: not claimed again straight away
+        self.assertEqual(async_to_sync(dispatch_batch)(channel_layer), 0)
+
+        Notification.objects.update(next_attempt_at=None, delivery_attempts=MAX_ATTEMPTS)
+        self.assertEqual(async_to_sync(dispatch_batch)(channel_layer), 0)
+
+    def test_mark_failed_backs_off_per_row_in_one_update(self):
+        notifications = notify_many(self.users, "hello")
+        for notification, attempts in zip(notifications, [0, 3, MAX_ATTEMPTS - 1]):
+            Notification.objects.filter(id=notification.id).update(delivery_attempts=attempts)
+
+        before = timezone.now()
+        with self.assertNumQueries(2), self.assertLogs("notifications.outbox", "ERROR") as logs:
+            mark_failed([notification.id for notification in notifications])
+
+        rows = Notification.objects.filter(id__in=[notification.id for notification in notifications]).order_by("id")
+        self.assertEqual([row.delivery_attempts for row in rows], [1, 4, MAX_ATTEMPTS])
+        delays = [round((row.next_attempt_at - before).total_seconds()) for row in rows]
+        self.assertEqual(delays, [1, 8, min(2 ** (MAX_ATTEMPTS - 1), MAX_BACKOFF)])
+        self.assertIn(str(notifications[2].id), logs.output[0])
+
+
+class NotificationFeedTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(email="student@example.com", password="pass12345", role="Student")
+        cls.other = CustomUser.objects.create_user(email="other@example.com", password="pass12345", role="Student")
+        cls.notifications = [notify_many([cls.user, cls.other], f"n{i}")[0] for i in range(7)]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_cursor_pages_newest_first(self):
+        first = self.client.get("/api/notifications/feed/?page_size=4").data
+        second = self.client.get(first["next"]).data
+        ids = [n["id"] for n in first["results"] + second["results"]]
+        self.assertEqual(ids, [n.id for n in reversed(self.notifications)])
+        self.assertIsNone(second["next"])
+
+    def test_since_returns_only_the_gap(self):
+        since = self.notifications[4].id
+        data = self.client.get(f"/api/notifications/feed/?since={since}").data
+        self.assertEqual([n["message"] for n in data["results"]], ["n5", "n6"])
+        self.assertEqual(data["last_id"], self.notifications[6].id)
+        self.assertFalse(data["has_more"])
+
+        data = self.client.get(f"/api/notifications/feed/?since={data['last_id']}").data
+        self.assertEqual(data["results"], [])
+        self.assertEqual(data["last_id"], self.notifications[6].id)
+
+    def test_since_must_be_an_id(self):
+        self.assertEqual(self.client.get("/api/notifications/feed/?since=abc").status_code, 400)
+
+
+class UnreadCounterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(email="student@example.com", password="pass12345", role="Student")
+        cls.other = CustomUser.objects.create_user(email="other@example.com", password="pass12345", role="Student")
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def unread(self):
+        return self.client.get("/api/notifications/unread/").data
+
+    def test_notification_counter_follows_create_and_read_without_counting(self):
+        notify_many([self.user], "first")
+        self.assertEqual(self.unread()["unread_count"], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            notify_many([self.user, self.other], "second")
+        with self.assertNumQueries(0):
+            self.assertEqual(counters.get_unread_count(counters.NOTIFICATIONS, self.user.id), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch("/api/notifications/mark-all-as-read/")
+        self.assertEqual(self.unread()["unread_count"], 0)
+
+    def test_chat_counter_follows_messages_and_read_receipts(self):
+        chat = Chat.objects.create()
+        chat.participants.set([self.user, self.other])
+        self.assertEqual(self.unread()["chat_unread_count"], 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            message = Message.objects.create(chat=chat, sender=self.other, content="hi")
+            Message.objects.create(chat=chat, sender=self.user, content="hello")
+        self.assertEqual(counters.get_unread_count(counters.CHAT, self.user.id), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f"/api/messages/{message.id}/read/")
+        self.assertEqual(self.unread()["chat_unread_count"], 0)
+
+
+@mock.patch("notifications.consumers.database_sync_to_async", sync_to_async)
+@mock.patch("chat.replay.run_db", lambda func, *args: sync_to_async(func)(*args))
+class NotificationReplayTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(email="student@example.com", password="pass12345", role="Student")
+        cls.other = CustomUser.objects.create_user(email="other@example.com", password="pass12345", role="Student")
+        cls.notifications = [notify_many([cls.user, cls.other], f"n{i}")[0] for i in range(4)]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_reconnect_with_last_id_replays_only_the_gap(self):
+        async def reconnect():
+            communicator = ApplicationCommunicator(NotificationConsumer.as_asgi(), {
+                "type": "websocket",
+                "path": "/ws/notifications/",
+                "query_string": f"last_id={self.notifications[1].id}".encode(),
+                "user": self.user,
+            })
+            await communicator.send_input({"type": "websocket.connect"})
+            await communicator.receive_output()
+            frames = [json.loads((await communicator.receive_output())["text"]) for _ in range(3)]
+            await communicator.send_input({"type": "websocket.disconnect", "code": 1000})
+            await communicator.wait()
+            return frames
+
+        unread, replay, done = async_to_sync(reconnect)()
+        self.assertEqual(unread["type"], "unread_count")
+        self.assertEqual([item["message"] for item in replay["items"]], ["n2", "n3"])
+        self.assertEqual(done, {
+            "type": "replay_done", "stream": "notifications", "chat_id": None,
+            "last_id": self.notifications[3].id, "complete": True,
+        })
+
+
+class OutboundEmailQueueTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_password_reset_is_queued_and_sent_by_the_worker(self):
+        user = CustomUser.objects.create_user(email="student@example.com", password="pass12345", role="Student")
+        response = APIClient().post("/api/users/forgot-password/", {"email": user.email})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mail.outbox, [])
+
+        self.assertEqual(send_batch(), 1)
+        self.assertEqual(mail.outbox[0].to, [user.email])
+        self.assertIn("/reset-password/", mail.outbox[0].body)
+        sent = OutboundEmail.objects.get()
+        self.assertIsNotNone(sent.sent_at)
+        # The reset link does not outlive the send
+        self.assertEqual(sent.body, "")
+        self.assertEqual(send_batch(), 0)
+
+    def test_lease_is_extended_while_the_batch_is_being_sent(self):
+        emails = [queue_email("Digest", f"body {i}", [f"user{i}@example.com"]) for i in range(3)]
+        real_send = EmailMessage.send
+        leased = []
+
+        def send(message, *args, **kwargs):
+            leased.append(OutboundEmail.objects.get(body=message.body).next_attempt_at - timezone.now())
+            return real_send(message, *args, **kwargs)
+
+        # A lease shorter than one send: every email renews it before it is sent
+        with mock.patch("notifications.mailqueue.LEASE", timedelta(seconds=1)), \
+                mock.patch.object(EmailMessage, "send", send):
+            self.assertEqual(send_batch(), 3)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertTrue(all(remaining > send_allowance() for remaining in leased))
+        self.assertFalse(OutboundEmail.objects.filter(id__in=[email.id for email in emails], sent_at=None).exists())
+
+    def test_batch_shares_one_connection_and_failures_back_off(self):
+        emails = [queue_email("Digest", f"body {i}", [f"user{i}@example.com"]) for i in range(3)]
+        real_send = EmailMessage.send
+
+        def send(message, *args, **kwargs):
+            if message.body == "body 1":
+                raise ConnectionError("refused")
+            return real_send(message, *args, **kwargs)
+
+        with mock.patch("notifications.mailqueue.get_connection", wraps=get_connection) as connections, \
+                mock.patch.object(EmailMessage, "send", send):
+            self.assertEqual(send_batch(), 3)
+        self.assertEqual(connections.call_count, 1)
+        self.assertEqual([message.body for message in mail.outbox], ["body 0", "body 2"])
 
-# Create your tests here.
+        failed = OutboundEmail.objects.get(id=emails[1].id)
+        self.assertIsNone(failed.sent_at)
+        self.assertEqual(failed.attempts, 1)
+        self.assertEqual(failed.last_error, "refused")
+        # Not due again until its backoff has passed
+        self.assertEqual(send_batch(), 0)
@@ -1,12 +1,14 @@
 from django.urls import path
 from .views import (
     NotificationListView,
+    NotificationFeedView,
     NotificationUnreadCountView,
     DeleteNotification, MarkAllAsRead,
 )
 
 urlpatterns = [
     path('', NotificationListView.as_view(), name='notification-list'),
+    path('feed/', NotificationFeedView.as_view(), name='notification-feed'),
     path('unread/', NotificationUnreadCountView.as_view(), name='unread'),
     path('mark-all-as-read/', MarkAllAsRead.as_view(), name='mark-all-as-read'),
     path('<int:pk>/', DeleteNotification.as_view(), name='delete-notification'),
@@ -1,10 +1,12 @@
 from rest_framework import status
-from rest_framework.generics import DestroyAPIView
+from rest_framework.generics import DestroyAPIView, ListAPIView
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from .models import Notification
 from .serializers import NotificationSerializer
+from .pagination import NotificationCursorPagination
+from . import counters
 from django.shortcuts import get_object_or_404
 
 
@@ -17,12 +19,46 @@ class NotificationListView(APIView):
         return Response(serializer.data)
 
 
+class NotificationFeedView(ListAPIView):
+    """
+    Cursor-paginated feed, newest first.
+    With ?since=<id> returns only notifications newer than id, oldest first, in batches
+    of at most max_page_size; keep calling with the returned last_id while has_more is true.
+    """
+    permission_classes = [IsAuthenticated]
+    serializer_class = NotificationSerializer
+    pagination_class = NotificationCursorPagination
+
+    def get_queryset(self):
+        return Notification.objects.filter(user=self.request.user)
+
+    def list(self, request, *args, **kwargs):
+        since = request.query_params.get("since")
+        if since is None:
+            return super().list(request, *args, **kwargs)
+
+        try:
+            since = int(since)
+        except ValueError:
+            return Response({"error": "since must be a notification id."}, status=status.HTTP_400_BAD_REQUEST)
+
+        limit = self.paginator.max_page_size
+        notifications = list(self.get_queryset().filter(id__gt=since).order_by("id")[:limit + 1])
+        has_more = len(notifications) > limit
+        notifications = notifications[:limit]
+        return Response({
+            "results": NotificationSerializer(notifications, many=True).data,
+            "last_id": notifications[-1].id if notifications else since,
+            "has_more": has_more,
+        })
+
+
 class NotificationUnreadCountView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        count = Notification.objects.filter(user=request.user, is_read=False).count()
-        return Response({"unread_count": count})
+        counts = counters.get_unread_counts(request.user.id)
+        return Response({"unread_count": counts[counters.NOTIFICATIONS], "chat_unread_count": counts[counters.CHAT]})
 
 
 class MarkAllAsRead(APIView):
@@ -30,6 +66,7 @@ class MarkAllAsRead(APIView):
 
     def patch(self, request):
         Notification.objects.filter(user=request.user, is_read=False).update(is_read=True)
+        counters.reset(counters.NOTIFICATIONS, request.user.id)
         return Response({"status": "all marked as read"})
 
 
@@ -40,4 +77,6 @@ class DeleteNotification(DestroyAPIView):
     def delete(self, request, pk):
         notif = get_object_or_404(Notification, pk=pk, user=request.user)
         notif.delete()
+        if not notif.is_read:
+            counters.decrement(counters.NOTIFICATIONS, [request.user.id])
         return Response({"status": "deleted"}, status=status.HTTP_204_NO_CONTENT)
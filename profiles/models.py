@@ -48,8 +48,10 @@ class StudentProfile(models.Model):
 
     def update_profile_completion(self):
         required_fields = [self.first_name, self.last_name, self.specialization, self.gpa]
-        self.user.is_profile_completed = all(required_fields) and self.skills.exists()
-        self.user.save()
+        completed = all(required_fields) and self.skills.exists()
+        if self.user.is_profile_completed != completed:
+            self.user.is_profile_completed = completed
+            self.user.save(update_fields=["is_profile_completed"])
 
     def save(self, *args, **kwargs):
         if not self.pk and StudentProfile.objects.filter(user=self.user).exists():
@@ -81,8 +83,10 @@ class SupervisorProfile(models.Model):
     def update_profile_completion(self):
         """ Check if profile is completed and update the user field """
         required_fields = [self.first_name, self.last_name, self.degree]
-        self.user.is_profile_completed = all(required_fields) and self.skills.exists()
-        self.user.save()
+        completed = all(required_fields) and self.skills.exists()
+        if self.user.is_profile_completed != completed:
+            self.user.is_profile_completed = completed
+            self.user.save(update_fields=["is_profile_completed"])
 
     def save(self, *args, **kwargs):
         if not self.pk and SupervisorProfile.objects.filter(user=self.user).exists():
@@ -109,8 +113,10 @@ class DeanOfficeProfile(models.Model):
     def update_profile_completion(self):
         """ Check if profile is completed and update the user field """
         required_fields = [self.first_name, self.last_name, self.job_role]
-        self.user.is_profile_completed = all(required_fields)
-        self.user.save()
+        completed = all(required_fields)
+        if self.user.is_profile_completed != completed:
+            self.user.is_profile_completed = completed
+            self.user.save(update_fields=["is_profile_completed"])
 
     def save(self, *args, **kwargs):
         if not self.pk and DeanOfficeProfile.objects.filter(user=self.user).exists():
@@ -45,7 +45,7 @@ class SupervisorProfileSerializer(serializers.ModelSerializer):
     def get_projects(self, obj):
         from teams.models import Team
         from teams.serializers import TeamSerializer  # 👈 Lazy import to avoid circular
-        teams = Team.objects.filter(supervisor=obj)
+        teams = Team.objects.filter(supervisor=obj).for_listing()
         return TeamSerializer(teams, many=True).data
 
     def validate_skill_ids(self, value):
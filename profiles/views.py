@@ -7,6 +7,7 @@ from rest_framework.views import APIView
 
 from teams.models import Team
 from teams.serializers import TeamSerializer
+from users.actor import get_actor
 from .models import StudentProfile, SupervisorProfile, DeanOfficeProfile, Skill
 from .serializers import (
     StudentProfileSerializer,
@@ -46,13 +47,13 @@ class ProfileCompletionView(generics.RetrieveUpdateAPIView):
 
     def get_object(self):
         """ Return the appropriate profile based on user role """
-        user = self.request.user
-        if user.role == "Student":
-            return user.student_profile
-        elif user.role == "Supervisor":
-            return user.supervisor_profile
-        elif user.role == "Dean Office":
-            return user.dean_office_profile
+        actor = get_actor(self.request)
+        if actor.role == "Student":
+            return actor.student
+        elif actor.role == "Supervisor":
+            return actor.supervisor
+        elif actor.role == "Dean Office":
+            return actor.dean_office
         return Response({"error": "Invalid role"}, status=status.HTTP_400_BAD_REQUEST)
 
     def update(self, request, *args, **kwargs):
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Team, JoinRequest, SupervisorRequest, Membership
+from .models import Team, JoinRequest, SupervisorRequest, Membership, ExportJob
 
 
 @admin.register(Team)
@@ -32,3 +32,10 @@ class MembershipAdmin(admin.ModelAdmin):
     list_filter = ('team',)
     search_fields = ('student__user__email', 'team__thesis_topic__title')
     ordering = ('-joined_at',)
+
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'format', 'status', 'requested_by', 'created_at', 'finished_at')
+    list_filter = ('status', 'format')
+    ordering = ('-created_at',)
@@ -0,0 +1,167 @@
+import hashlib
+import logging
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .models import ExportJob
+from .utils.export_csv import write_approved_teams_csv
+from .utils.export_excel import iter_approved_teams, write_approved_teams_xlsx, XLSX_CONTENT_TYPE
+
+logger = logging.getLogger(__name__)
+
+# format -> (writer(fileobj), content type). New formats (e.g. PDF) only need an entry here
+# and in ExportJob.FORMAT_CHOICES.
+EXPORT_FORMATS = {
+    "xlsx": (write_approved_teams_xlsx, XLSX_CONTENT_TYPE),
+    "csv": (write_approved_teams_csv, "text/csv"),
+}
+EXPORT_MAX_WORKERS = 2
+# A queued or running job not updated for this long is presumed lost (e.g. the process restarted)
+EXPORT_JOB_LEASE = timedelta(minutes=10)
+HEARTBEAT_INTERVAL = 60  # seconds between updated_at refreshes of a running job
+
+export_executor = ThreadPoolExecutor(max_workers=EXPORT_MAX_WORKERS, thread_name_prefix="team-export")
+
+
+class ExportJobLost(Exception):
+    """ The job stopped being ours, e.g. it was failed as stale while still running """
+
+
+def fingerprint_team(digest, team, members):
+    supervisor = team.supervisor
+    thesis = team.thesis_topic
+    digest.update(repr((
+        team.id, thesis.title, thesis.title_kz, thesis.title_ru,
+        (supervisor.last_name, supervisor.first_name, supervisor.degree) if supervisor else None,
+        members,
+    )).encode())
+
+
+def approved_teams_fingerprint(export_format):
+    """ sha256 over exactly the data the export writes, so unchanged data maps to the same file """
+    digest = hashlib.sha256(export_format.encode())
+    for team, members in iter_approved_teams():
+        fingerprint_team(digest, team, members)
+    return digest.hexdigest()
+
+
+def artifact_name(content_hash, export_format):
+    return f"exports/approved_teams_{content_hash}.{export_format}"
+
+
+def request_export(user, export_format):
+    """
+    Returns an ExportJob for the current approved-team set: an already finished one when the
+    file for this content hash exists, an in-flight one for the same hash, or a newly queued one.
+    """
+    content_hash = approved_teams_fingerprint(export_format)
+    name = artifact_name(content_hash, export_format)
+
+    if default_storage.exists(name):
+        return ExportJob.objects.create(
+            requested_by=user, format=export_format, content_hash=content_hash,
+            status="done", file=name, finished_at=timezone.now(),
+        )
+
+    in_flight = ExportJob.objects.filter(
+        format=export_format, content_hash=content_hash, status__in=["queued", "running"]
+    )
+    stale_before = timezone.now() - EXPORT_JOB_LEASE
+    stale = in_flight.filter(updated_at__lt=stale_before).update(
+        status="failed", error="Export was interrupted.", finished_at=timezone.now()
+    )
+    if stale:
+        logger.warning("Failed %s stale export job(s) for %s", stale, content_hash)
+    job = in_flight.first()
+    if job:
+        return job
+
+    job = ExportJob.objects.create(requested_by=user, format=export_format, content_hash=content_hash)
+    transaction.on_commit(lambda: enqueue_export_job(job.id))
+    return job
+
+
+def enqueue_export_job(job_id):
+    export_executor.submit(run_export_job, job_id)
+
+
+def heartbeat(job_id):
+    """ Refreshes updated_at so the job is not taken for lost; raises ExportJobLost when it no longer runs """
+    if not ExportJob.objects.filter(pk=job_id, status="running").update(updated_at=timezone.now()):
+        raise ExportJobLost(f"Export job {job_id} is no longer running")
+
+
+def fingerprinted_teams(job_id, digest):
+    """ iter_approved_teams(), hashing each team as the writer reads it and sending heartbeats """
+    last_beat = time.monotonic()
+    for team, members in iter_approved_teams():
+        fingerprint_team(digest, team, members)
+        if time.monotonic() - last_beat >= HEARTBEAT_INTERVAL:
+            heartbeat(job_id)
+            last_beat = time.monotonic()
+        yield team, members
+
+
+def store_artifact(export_format, writer):
+    """
+    Writes the file under a temporary name and renames it into place when complete, so
+    default_storage.exists(name) never sees a partly written file. The name comes from the
+    hash of the rows actually written; writer(fileobj, digest) feeds them into digest.
+    Returns that content hash.
+    """
+    directory = default_storage.path(os.path.dirname(artifact_name("", export_format)))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".partial-")
+    try:
+        digest = hashlib.sha256(export_format.encode())
+        with os.fdopen(fd, "w+b") as tmp:
+            writer(tmp, digest)
+        content_hash = digest.hexdigest()
+        if settings.FILE_UPLOAD_PERMISSIONS is not None:
+            os.chmod(tmp_path, settings.FILE_UPLOAD_PERMISSIONS)
+        os.replace(tmp_path, default_storage.path(artifact_name(content_hash, export_format)))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return content_hash
+
+
+def run_export_job(job_id):
+    """ Worker entry point: builds the file and stores it under MEDIA_ROOT keyed by content hash """
+    close_old_connections()
+    try:
+        if not ExportJob.objects.filter(pk=job_id, status="queued").update(status="running", updated_at=timezone.now()):
+            return
+        export_format = ExportJob.objects.values_list("format", flat=True).get(pk=job_id)
+        write, _ = EXPORT_FORMATS[export_format]
+        content_hash = store_artifact(
+            export_format, lambda fileobj, digest: write(fileobj, fingerprinted_teams(job_id, digest))
+        )
+        name = artifact_name(content_hash, export_format)
+
+        # The data may have changed since the request; the job takes the hash of what was written
+        now = timezone.now()
+        done = ExportJob.objects.filter(pk=job_id, status="running").update(
+            file=name, content_hash=content_hash, status="done", finished_at=now, updated_at=now,
+        )
+        if not done:
+            logger.warning("Export job %s finished after it was given up; %s is kept for reuse", job_id, name)
+    except ExportJobLost:
+        logger.warning("Export job %s was given up while running; stopped", job_id)
+    except Exception as e:
+        logger.exception("Export job %s failed", job_id)
+        now = timezone.now()
+        ExportJob.objects.filter(pk=job_id, status="running").update(
+            status="failed", error=str(e), finished_at=now, updated_at=now
+        )
+    finally:
+        close_old_connections()
@@ -0,0 +1,21 @@
+# Generated by Django 5.1.6 on 2026-10-18 16:15
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0004_alter_studentprofile_specialization'),
+        ('teams', '0007_alter_team_status'),
+        ('topics', '0002_thesistopic_title_kz_thesistopic_title_ru'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='team',
+            index=models.Index(fields=['status', 'id'], name='team_status_id_idx'),
+        ),
+    ]
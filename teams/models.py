@@ -1,8 +1,41 @@
 from django.db import models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.conf import settings
 from profiles.models import StudentProfile, SupervisorProfile, Skill
 from topics.models import ThesisTopic
 
+MAX_TEAM_MEMBERS = 4
+MIN_COVERED_SKILLS = 4
+
+
+class TeamQuerySet(models.QuerySet):
+    def for_listing(self):
+        """ Eager-loads everything TeamSerializer touches, so a page of teams costs a fixed number of queries """
+        return self.select_related(
+            'thesis_topic',
+            'supervisor__user',
+        ).prefetch_related(
+            models.Prefetch(
+                'members',
+                queryset=StudentProfile.objects.select_related('user').prefetch_related('skills'),
+            ),
+            'thesis_topic__required_skills',
+        )
+
+    def with_covered_skill_count(self):
+        """ Annotates covered_skill_count: required topic skills that at least one member has """
+        covered = Skill.objects.filter(
+            thesis_topics=OuterRef('thesis_topic_id'),
+            studentprofile__teams=OuterRef('pk'),
+        ).order_by().values('thesis_topics').annotate(
+            count=Count('id', distinct=True)
+        ).values('count')
+        return self.annotate(covered_skill_count=Coalesce(Subquery(covered), 0))
+
+    def meeting_skill_threshold(self):
+        return self.with_covered_skill_count().filter(covered_skill_count__gte=MIN_COVERED_SKILLS)
+
 
 class Membership(models.Model):
     student = models.ForeignKey(StudentProfile, on_delete=models.CASCADE)
@@ -31,11 +64,22 @@ class Team(models.Model):
         default="pending"
     )
 
+    objects = TeamQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id'], name='team_status_id_idx'),
+        ]
+
+    def covered_skill_count(self):
+        """ Number of the topic's required skills covered by the members, counted in a single query """
+        return Team.objects.with_covered_skill_count().filter(pk=self.pk).values_list(
+            'covered_skill_count', flat=True
+        ).get()
+
     def has_required_skills(self):
         """ Checks if the team collectively meets at least 4 required skills """
-        team_skills = set(skill.name for student in self.members.all() for skill in student.skills.all())
-        required_skills = set(skill.name for skill in self.thesis_topic.required_skills.all())
-        return len(team_skills.intersection(required_skills)) >= 4
+        return self.covered_skill_count() >= MIN_COVERED_SKILLS
 
     def apply_to_supervisor(self):
         if not self.has_required_skills():
@@ -114,3 +158,24 @@ class Like(models.Model):
 
     def __str__(self):
         return f"{self.user.email} likes {self.team.thesis_topic}"
+
+
+class ExportJob(models.Model):
+    """ Background export of the approved teams; finished files are shared by content hash """
+    FORMAT_CHOICES = [('xlsx', 'Excel'), ('csv', 'CSV')]
+    STATUS_CHOICES = [('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')]
+
+    requested_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='export_jobs')
+    format = models.CharField(max_length=10, choices=FORMAT_CHOICES, default='xlsx')
+    content_hash = models.CharField(max_length=64, db_index=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    file = models.FileField(upload_to='exports/', blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Refreshed on every status change and by the running worker's heartbeat; an in-flight job
+    # not refreshed for EXPORT_JOB_LEASE is presumed lost
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Export {self.id} ({self.format}, {self.status})"
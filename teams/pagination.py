@@ -0,0 +1,9 @@
+from rest_framework.pagination import CursorPagination
+
+
+class TeamCursorPagination(CursorPagination):
+    """ Keyset pagination over team ids, stable while new teams are being created """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = '-id'
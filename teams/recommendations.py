@@ -0,0 +1,159 @@
+import heapq
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+
+from django.db.models import Count
+
+from topics.models import ThesisTopic
+from .models import Team, MAX_TEAM_MEMBERS
+
+RequiredSkill = ThesisTopic.required_skills.through
+
+
+@dataclass
+class TeamEntry:
+    skills: frozenset
+    status: str
+    member_count: int
+    has_supervisor: bool
+
+    def open_for_students(self):
+        return self.status == "open" and self.member_count < MAX_TEAM_MEMBERS
+
+    def open_for_supervisors(self):
+        return not self.has_supervisor and self.status != "rejected"
+
+
+class TeamSkillIndex:
+    """
+    In-memory skill -> team inverted index used to rank teams by skill overlap.
+
+    The index is built lazily from the database and then kept current by the
+    signal handlers in teams.signals, which refresh single teams after commit.
+    Every process owns its own copy, so it is also rebuilt every
+    REBUILD_INTERVAL seconds to pick up changes made by other workers. A rebuild
+    reads the database without holding the index lock and swaps the result in;
+    one thread rebuilds while the others keep ranking with the old index.
+    """
+    REBUILD_INTERVAL = 300
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._rebuild_lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._postings = {}
+            self._teams = {}
+            self._built_at = None
+
+    def _is_stale(self):
+        return self._built_at is None or time.monotonic() - self._built_at > self.REBUILD_INTERVAL
+
+    def _ensure_built(self):
+        if not self._is_stale():
+            return
+        if self._built_at is None:
+            # Nothing to serve yet: wait for whichever thread builds it first
+            with self._rebuild_lock:
+                if self._built_at is None:
+                    self.rebuild()
+        elif self._rebuild_lock.acquire(blocking=False):
+            try:
+                if self._is_stale():
+                    self.rebuild()
+            finally:
+                self._rebuild_lock.release()
+
+    def rebuild(self):
+        skills = {}
+        for team_id, skill_id in RequiredSkill.objects.filter(
+            thesistopic__team__isnull=False
+        ).values_list("thesistopic__team__id", "skill_id"):
+            skills.setdefault(team_id, set()).add(skill_id)
+
+        teams = {}
+        for team_id, status, supervisor_id, member_count in Team.objects.annotate(
+            member_count=Count("members")
+        ).values_list("id", "status", "supervisor_id", "member_count"):
+            teams[team_id] = TeamEntry(
+                skills=frozenset(skills.get(team_id, ())),
+                status=status,
+                member_count=member_count,
+                has_supervisor=supervisor_id is not None,
+            )
+
+        postings = {}
+        for team_id, entry in teams.items():
+            for skill_id in entry.skills:
+                postings.setdefault(skill_id, set()).add(team_id)
+
+        with self._lock:
+            self._teams = teams
+            self._postings = postings
+            self._built_at = time.monotonic()
+
+    def refresh_team(self, team_id):
+        """ Re-reads one team from the database; idempotent, so duplicate signals are harmless """
+        with self._lock:
+            if self._built_at is None:
+                return
+
+        row = Team.objects.filter(id=team_id).annotate(
+            member_count=Count("members")
+        ).values("status", "supervisor_id", "member_count", "thesis_topic_id").first()
+        entry = None
+        if row is not None:
+            skill_ids = RequiredSkill.objects.filter(
+                thesistopic_id=row["thesis_topic_id"]
+            ).values_list("skill_id", flat=True)
+            entry = TeamEntry(
+                skills=frozenset(skill_ids),
+                status=row["status"],
+                member_count=row["member_count"],
+                has_supervisor=row["supervisor_id"] is not None,
+            )
+
+        with self._lock:
+            self._drop(team_id)
+            if entry is not None:
+                self._teams[team_id] = entry
+                for skill_id in entry.skills:
+                    self._postings.setdefault(skill_id, set()).add(team_id)
+
+    def remove_skill(self, skill_id):
+        with self._lock:
+            for team_id in self._postings.pop(skill_id, ()):
+                entry = self._teams[team_id]
+                entry.skills = entry.skills - {skill_id}
+
+    def _drop(self, team_id):
+        entry = self._teams.pop(team_id, None)
+        if entry is None:
+            return
+        for skill_id in entry.skills:
+            posting = self._postings.get(skill_id)
+            if posting is not None:
+                posting.discard(team_id)
+                if not posting:
+                    del self._postings[skill_id]
+
+    def top_teams(self, skill_ids, limit, for_supervisor=False):
+        """ Returns up to `limit` (team_id, score) pairs, best overlap first, ties by newest team """
+        self._ensure_built()
+        with self._lock:
+            scores = Counter()
+            for skill_id in set(skill_ids):
+                scores.update(self._postings.get(skill_id, ()))
+
+            if for_supervisor:
+                eligible = (item for item in scores.items() if self._teams[item[0]].open_for_supervisors())
+            else:
+                eligible = (item for item in scores.items() if self._teams[item[0]].open_for_students())
+            return heapq.nlargest(limit, eligible, key=lambda item: (item[1], item[0]))
+
+
+team_skill_index = TeamSkillIndex()
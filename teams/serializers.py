@@ -1,10 +1,11 @@
 from rest_framework import serializers
 
 from topics.serializers import ThesisTopicSerializer
-from .models import Team, JoinRequest, SupervisorRequest, Like
+from .models import Team, JoinRequest, SupervisorRequest, Like, ExportJob
 from profiles.models import SupervisorProfile
 from profiles.serializers import StudentProfileSerializer, SupervisorShortSerializer
 from profiles.serializers import SupervisorProfileSerializer
+from users.actor import get_actor
 
 class TeamSerializer(serializers.ModelSerializer):
     members = StudentProfileSerializer(many=True, read_only=True)
@@ -24,9 +25,9 @@ class TeamSerializer(serializers.ModelSerializer):
         return [skill.name for skill in obj.thesis_topic.required_skills.all()]
 
     def validate(self, data):
-        user = self.context['request'].user
-        if hasattr(user, 'student_profile'):
-            if user.student_profile.teams.filter(status="open").exists():
+        student = get_actor(self.context['request']).student
+        if student is not None:
+            if student.teams.filter(status="open").exists():
                 raise serializers.ValidationError("You can only apply to 1 team at a time.")
         return data
 
@@ -55,4 +56,16 @@ class LikeSerializer(serializers.ModelSerializer):
     class Meta:
         model = Like
         fields = ['id', 'team', 'user', 'created_at']
-        read_only_fields = ['user']
\ No newline at end of file
+        read_only_fields = ['user']
+
+class ExportJobSerializer(serializers.ModelSerializer):
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ExportJob
+        fields = ['id', 'format', 'status', 'content_hash', 'error', 'created_at', 'finished_at', 'download_url']
+
+    def get_download_url(self, obj):
+        if obj.status != "done":
+            return None
+        return f"/api/teams/export-jobs/{obj.id}/download/"
@@ -0,0 +1,58 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from profiles.models import Skill
+from topics.models import ThesisTopic
+from .models import Team, Membership
+from .recommendations import team_skill_index
+
+
+def refresh_teams_on_commit(team_ids):
+    team_ids = list(team_ids)
+    transaction.on_commit(lambda: [team_skill_index.refresh_team(team_id) for team_id in team_ids])
+
+
+@receiver(post_save, sender=Team)
+@receiver(post_delete, sender=Team)
+def team_changed(sender, instance, **kwargs):
+    refresh_teams_on_commit([instance.id])
+
+
+@receiver(post_save, sender=Membership)
+@receiver(post_delete, sender=Membership)
+def membership_changed(sender, instance, **kwargs):
+    refresh_teams_on_commit([instance.team_id])
+
+
+@receiver(m2m_changed, sender=Team.members.through)
+def team_members_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        refresh_teams_on_commit([instance.id])
+    elif pk_set:
+        refresh_teams_on_commit(pk_set)
+    else:
+        transaction.on_commit(team_skill_index.reset)
+
+
+@receiver(m2m_changed, sender=ThesisTopic.required_skills.through)
+def required_skills_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """ Topic skills changed: re-index the team working on the topic(s) """
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        topic_ids = [instance.id]
+    elif pk_set:
+        topic_ids = pk_set
+    else:
+        transaction.on_commit(team_skill_index.reset)
+        return
+    refresh_teams_on_commit(Team.objects.filter(thesis_topic_id__in=topic_ids).values_list("id", flat=True))
+
+
+@receiver(post_delete, sender=Skill)
+def skill_deleted(sender, instance, **kwargs):
+    skill_id = instance.id
+    transaction.on_commit(lambda: team_skill_index.remove_skill(skill_id))
@@ -1,3 +1,421 @@
-from django.test import TestCase
+import io
+import os
+import shutil
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+import openpyxl
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.response import Response
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from profiles.models import Skill, StudentProfile
+from teams.exports import EXPORT_JOB_LEASE, ExportJobLost, approved_teams_fingerprint, heartbeat, run_export_job
+from teams.models import Team, ExportJob
+from teams.recommendations import team_skill_index
+from teams.views import atomic_response
+from topics.models import ThesisTopic
+from users.models import CustomUser
+
+
+def make_student(email, skills):
+    user = CustomUser.objects.create_user(email=email, password="pass12345", role="Student")
+    profile = user.student_profile
+    profile.skills.set(skills)
+    return profile
+
+
+def make_team(index, supervisor, skills):
+    owner = make_student(f"owner_{index}@example.com", skills)
+    topic = ThesisTopic.objects.create(title=f"Topic {index}", description="...")
+    topic.required_skills.set(skills)
+    team = Team.objects.create(thesis_topic=topic, owner=owner.user, supervisor=supervisor, status="open")
+    team.members.add(owner)
+    for n in range(2):
+        team.members.add(make_student(f"member_{index}_{n}@example.com", skills))
+    return team
+
+
+class TeamListQueryCountTests(TestCase):
+    MAX_LISTING_QUERIES = 5
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.skills = [Skill.objects.create(name=f"Skill {i}") for i in range(4)]
+        supervisor_user = CustomUser.objects.create_user(
+            email="super.visor@example.com", password="pass12345", role="Supervisor"
+        )
+        cls.supervisor = supervisor_user.supervisor_profile
+
+    def list_teams(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = APIClient().get("/api/teams/")
+        self.assertEqual(response.status_code, 200)
+        return response, len(ctx)
+
+    def test_query_count_does_not_grow_with_teams(self):
+        make_team(0, self.supervisor, self.skills)
+        make_team(1, None, self.skills)
+        _, few = self.list_teams()
+
+        for index in range(2, 8):
+            make_team(index, self.supervisor, self.skills)
+        response, many = self.list_teams()
+
+        self.assertEqual(len(response.data), 8)
+        self.assertEqual(few, many)
+        self.assertLessEqual(many, self.MAX_LISTING_QUERIES)
+
+    def test_response_shape(self):
+        team = make_team(0, self.supervisor, self.skills)
+        response, _ = self.list_teams()
+
+        item = response.data[0]
+        self.assertEqual(item["id"], team.id)
+        self.assertEqual(item["supervisor"]["id"], self.supervisor.user_id)
+        self.assertEqual(len(item["members"]), 3)
+        self.assertEqual(len(item["members"][0]["skills"]), 4)
+        self.assertTrue(item["members"][0]["user_email"].endswith("@example.com"))
+        self.assertEqual(sorted(item["required_skills"]), sorted(s.name for s in self.skills))
+
+
+class TeamCatalogueTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.skills = [Skill.objects.create(name=f"Skill {i}") for i in range(4)]
+        supervisor_user = CustomUser.objects.create_user(
+            email="super.visor@example.com", password="pass12345", role="Supervisor"
+        )
+        cls.supervisor = supervisor_user.supervisor_profile
+        cls.teams = [make_team(i, cls.supervisor if i % 2 else None, cls.skills[: 2 + i % 3]) for i in range(5)]
+
+    def get(self, query=""):
+        response = APIClient().get(f"/api/teams/catalogue/{query}")
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_cursor_walks_every_team_once(self):
+        seen = []
+        data = self.get("?page_size=2")
+        while True:
+            seen.extend(item["id"] for item in data["results"])
+            if not data["next"]:
+                break
+            response = APIClient().get(data["next"])
+            data = response.data
+        self.assertEqual(seen, sorted((t.id for t in self.teams), reverse=True))
+
+    def test_filters(self):
+        with_supervisor = self.get("?has_supervisor=true")["results"]
+        self.assertEqual({item["id"] for item in with_supervisor}, {t.id for t in self.teams if t.supervisor})
+
+        skill_ids = f"{self.skills[2].id},{self.skills[3].id}"
+        by_skills = self.get(f"?skills={skill_ids}")["results"]
+        self.assertEqual({item["id"] for item in by_skills}, {self.teams[2].id})
+
+        self.teams[0].members.add(make_student("extra@example.com", []))
+        free = self.get("?free_slots=true")["results"]
+        self.assertNotIn(self.teams[0].id, {item["id"] for item in free})
+        self.assertEqual(len(free), 4)
+
+    def test_invalid_filter_is_rejected(self):
+        response = APIClient().get("/api/teams/catalogue/?skills=abc")
+        self.assertEqual(response.status_code, 400)
+
+
+class TeamRecommendationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.skills = [Skill.objects.create(name=f"Skill {i}") for i in range(5)]
+        cls.best = make_team(0, None, cls.skills[:3])
+        cls.partial = make_team(1, None, cls.skills[2:4])
+        cls.unrelated = make_team(2, None, cls.skills[4:])
+        cls.student = make_student("looking_student@example.com", cls.skills[:3])
+        supervisor_user = CustomUser.objects.create_user(
+            email="super.visor@example.com", password="pass12345", role="Supervisor"
+        )
+        supervisor_user.supervisor_profile.skills.set(cls.skills[3:])
+        cls.supervisor = supervisor_user.supervisor_profile
+
+    def setUp(self):
+        team_skill_index.reset()
+
+    def recommended(self, user, path="/api/teams/recommended/"):
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return [(item["id"], item["match_score"]) for item in response.data]
+
+    def test_student_ranking(self):
+        self.assertEqual(
+            self.recommended(self.student.user),
+            [(self.best.id, 3), (self.partial.id, 1)],
+        )
+
+    def test_supervisor_ranking_skips_supervised_teams(self):
+        path = "/api/teams/recommended/supervisor/"
+        self.assertEqual(
+            self.recommended(self.supervisor.user, path),
+            [(self.unrelated.id, 1), (self.partial.id, 1)],
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.unrelated.supervisor = self.supervisor
+            self.unrelated.save()
+        self.assertEqual(self.recommended(self.supervisor.user, path), [(self.partial.id, 1)])
+
+    def test_index_follows_topic_and_membership_changes(self):
+        self.recommended(self.student.user)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.partial.thesis_topic.required_skills.add(*self.skills[:2])
+        self.assertEqual(
+            self.recommended(self.student.user),
+            [(self.partial.id, 3), (self.best.id, 3)],
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.partial.members.add(make_student("fourth@example.com", []))
+        self.assertEqual(self.recommended(self.student.user), [(self.best.id, 3)])
+
+
+    def test_stale_index_is_served_while_another_thread_rebuilds(self):
+        skill_ids = [skill.id for skill in self.skills[:3]]
+        expected = team_skill_index.top_teams(skill_ids, 10)
+        team_skill_index._built_at -= team_skill_index.REBUILD_INTERVAL + 1
+
+        with team_skill_index._rebuild_lock, self.assertNumQueries(0):
+            self.assertEqual(team_skill_index.top_teams(skill_ids, 10), expected)
+        with self.assertNumQueries(2):
+            team_skill_index.top_teams(skill_ids, 10)
+
+
+class CoveredSkillCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.skills = [Skill.objects.create(name=f"Skill {i}") for i in range(6)]
+        cls.ready = make_team(0, None, cls.skills[:4])
+        cls.short = make_team(1, None, cls.skills[:2])
+        cls.short.thesis_topic.required_skills.set(cls.skills)
+
+    def test_counts_distinct_required_skills_covered_by_members(self):
+        counts = dict(Team.objects.with_covered_skill_count().values_list("id", "covered_skill_count"))
+        self.assertEqual(counts, {self.ready.id: 4, self.short.id: 2})
+
+    def test_has_required_skills_is_a_single_query(self):
+        with self.assertNumQueries(1):
+            self.assertTrue(self.ready.has_required_skills())
+        self.assertFalse(self.short.has_required_skills())
+
+    def test_threshold_filter(self):
+        self.assertEqual(list(Team.objects.meeting_skill_threshold()), [self.ready])
+        response = APIClient().get("/api/teams/catalogue/?meets_skill_threshold=true")
+        self.assertEqual([item["id"] for item in response.data["results"]], [self.ready.id])
+
+
+class ExportApprovedTeamsExcelTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        skills = [Skill.objects.create(name=f"Skill {i}") for i in range(2)]
+        supervisor_user = CustomUser.objects.create_user(
+            email="super.visor@example.com", password="pass12345", role="Supervisor"
+        )
+        cls.teams = [make_team(i, supervisor_user.supervisor_profile, skills) for i in range(3)]
+        Team.objects.filter(id__in=[cls.teams[0].id, cls.teams[2].id]).update(status="team_approved")
+        cls.dean = CustomUser.objects.create_user(email="dean-office@example.com", password="pass12345",
+                                                  role="Dean Office")
+
+    def export(self):
+        client = APIClient()
+        client.force_authenticate(self.dean)
+        response = client.get("/api/teams/export-excel/")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return openpyxl.load_workbook(io.BytesIO(b"".join(response.streaming_content)))
+
+    def test_rows_and_merged_cells(self):
+        ws = self.export()["Approved Teams"]
+        rows = list(ws.iter_rows(values_only=True))
+
+        self.assertEqual(len(rows), 1 + 2 * 3)
+        self.assertEqual([row[0] for row in rows[1:]], list(range(1, 7)))
+        self.assertTrue(rows[1][2].endswith("Англ: Topic 0"))
+        self.assertTrue(rows[4][2].endswith("Англ: Topic 2"))
+        self.assertEqual(sorted(str(r) for r in ws.merged_cells.ranges), ["C2:C4", "C5:C7", "D2:D4", "D5:D7"])
+
+    def test_query_count_does_not_grow_with_teams(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.export()
+        Team.objects.update(status="team_approved")
+        with CaptureQueriesContext(connection) as more:
+            self.export()
+        self.assertEqual(len(ctx), len(more))
+
+
+@mock.patch("teams.exports.close_old_connections")
+class ExportJobTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        skills = [Skill.objects.create(name=f"Skill {i}") for i in range(2)]
+        supervisor_user = CustomUser.objects.create_user(
+            email="super.visor@example.com", password="pass12345", role="Supervisor"
+        )
+        cls.team = make_team(0, supervisor_user.supervisor_profile, skills)
+        cls.team.status = "team_approved"
+        cls.team.save()
+        cls.dean = CustomUser.objects.create_user(email="dean-office@example.com", password="pass12345",
+                                                  role="Dean Office")
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.client = APIClient()
+        self.client.force_authenticate(self.dean)
+
+    def request_export(self, export_format="xlsx"):
+        with mock.patch("teams.exports.enqueue_export_job", side_effect=run_export_job):
+            with self.captureOnCommitCallbacks(execute=True):
+                return self.client.post("/api/teams/export-jobs/", {"format": export_format})
+
+    def test_job_runs_and_file_is_reused_for_unchanged_data(self, _):
+        response = self.request_export()
+        self.assertEqual(response.status_code, 202)
+        job = ExportJob.objects.get(pk=response.data["id"])
+        self.assertEqual(job.status, "done")
+
+        download = self.client.get(f"/api/teams/export-jobs/{job.id}/download/")
+        self.assertEqual(download.status_code, 200)
+        ws = openpyxl.load_workbook(io.BytesIO(b"".join(download.streaming_content)))["Approved Teams"]
+        self.assertEqual(ws.max_row, 4)
+
+        again = self.request_export()
+        self.assertEqual(again.status_code, 200)
+        self.assertEqual(again.data["content_hash"], job.content_hash)
+
+        StudentProfile.objects.filter(user=self.team.owner).update(last_name="Renamed")
+        changed = self.request_export()
+        self.assertEqual(changed.status_code, 202)
+        self.assertNotEqual(changed.data["content_hash"], job.content_hash)
+
+    def test_csv_format_and_validation(self, _):
+        response = self.request_export("csv")
+        job = ExportJob.objects.get(pk=response.data["id"])
+        content = b"".join(self.client.get(f"/api/teams/export-jobs/{job.id}/download/").streaming_content)
+        self.assertEqual(len(content.decode("utf-8-sig").strip().splitlines()), 4)
+
+        self.assertEqual(self.client.post("/api/teams/export-jobs/", {"format": "doc"}).status_code, 400)
+
+    def test_stale_in_flight_job_is_failed_and_replaced(self, _):
+        with mock.patch("teams.exports.enqueue_export_job"):
+            with self.captureOnCommitCallbacks(execute=True):
+                lost = self.client.post("/api/teams/export-jobs/", {"format": "xlsx"}).data["id"]
+                self.assertEqual(self.client.post("/api/teams/export-jobs/", {"format": "xlsx"}).data["id"], lost)
+        ExportJob.objects.filter(pk=lost).update(updated_at=timezone.now() - EXPORT_JOB_LEASE)
+
+        response = self.request_export()
+        self.assertNotEqual(response.data["id"], lost)
+        self.assertEqual(ExportJob.objects.get(pk=response.data["id"]).status, "done")
+        self.assertEqual(ExportJob.objects.get(pk=lost).status, "failed")
+        # Only the finished artifact is left, no partial file
+        self.assertEqual(len(os.listdir(os.path.join(settings.MEDIA_ROOT, "exports"))), 1)
+
+
+    def test_file_is_named_after_the_data_it_was_written_from(self, _):
+        with mock.patch("teams.exports.enqueue_export_job"):
+            with self.captureOnCommitCallbacks(execute=True):
+                job_id = self.client.post("/api/teams/export-jobs/", {"format": "csv"}).data["id"]
+        requested_hash = ExportJob.objects.get(pk=job_id).content_hash
+        StudentProfile.objects.filter(user=self.team.owner).update(last_name="Renamed")
+
+        run_export_job(job_id)
+        job = ExportJob.objects.get(pk=job_id)
+        self.assertEqual(job.status, "done")
+        self.assertNotEqual(job.content_hash, requested_hash)
+        self.assertEqual(job.content_hash, approved_teams_fingerprint("csv"))
+        self.assertIn("Renamed", job.file.read().decode("utf-8-sig"))
+        job.file.close()
+
+    def test_a_job_given_up_while_running_is_not_marked_done(self, _):
+        with mock.patch("teams.exports.enqueue_export_job"):
+            with self.captureOnCommitCallbacks(execute=True):
+                job_id = self.client.post("/api/teams/export-jobs/", {"format": "csv"}).data["id"]
+        ExportJob.objects.filter(pk=job_id).update(status="failed")
+
+        run_export_job(job_id)
+        self.assertEqual(ExportJob.objects.get(pk=job_id).status, "failed")
+        with self.assertRaises(ExportJobLost):
+            heartbeat(job_id)
+
+
+class AtomicResponseTests(TestCase):
+    def test_error_response_rolls_back_earlier_writes(self):
+        @atomic_response
+        def handler(status_code):
+            Skill.objects.create(name=f"Skill {status_code}")
+            return Response(status=status_code)
+
+        handler(400)
+        handler(200)
+        self.assertEqual(list(Skill.objects.values_list("name", flat=True)), ["Skill 200"])
+
+
+class ActorPermissionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        skills = [Skill.objects.create(name="Skill")]
+        cls.supervisor = CustomUser.objects.create_user(
+            email="super.visor@example.com", password="pass12345", role="Supervisor"
+        )
+        cls.team = make_team(0, None, skills)
+
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}")
+        return client
+
+    def setUp(self):
+        cache.clear()
+
+    def test_role_and_team_come_from_the_request_actor(self):
+        client = self.client_for(self.team.owner)
+        client.get("/api/teams/my-supervisor-request/")
+
+        # The cached user carries the profile; the team is one query, then the view's own
+        with self.assertNumQueries(2):
+            response = client.get("/api/teams/my-supervisor-request/")
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.data, {"detail": "No supervisor request found."})
+
+    def test_role_permissions_keep_the_error_body(self):
+        response = self.client_for(self.supervisor).post("/api/teams/leave/")
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.data, {"error": "Only students can do this."})
+
+        self.assertEqual(APIClient().post("/api/teams/leave/").status_code, 401)
+        self.assertEqual(self.client_for(self.team.owner).get("/api/teams/export-jobs/1/").status_code, 403)
+
+    def test_supervisor_permission_needs_the_role_and_the_profile(self):
+        CustomUser.objects.filter(pk=self.supervisor.pk).update(role="Student")
+        self.supervisor.refresh_from_db()
+        response = self.client_for(self.supervisor).post(f"/api/teams/{self.team.id}/approve/")
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.data, {"error": "Only supervisors can do this."})
+
+    def test_team_owner_permission(self):
+        member = self.team.members.exclude(user=self.team.owner).first()
+        response = self.client_for(member.user).post(f"/api/teams/{self.team.id}/join-requests/{member.pk}/reject/")
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.data, {"error": "Only the team owner can do this."})
+
+        response = self.client_for(self.team.owner).post(f"/api/teams/{self.team.id}/join-requests/{member.pk}/reject/")
+        self.assertEqual(response.status_code, 404)
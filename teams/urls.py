@@ -1,15 +1,19 @@
 from django.urls import path
-from .views import TeamCreateView, TeamListView, TeamDetailView, \
+from .views import TeamCreateView, TeamListView, TeamCatalogueView, TeamDetailView, \
     MyTeamView, JoinTeamView, AcceptJoinRequestView, RejectJoinRequestView, MyJoinRequestView, \
     MyJoinRequestsView, MyTeamJoinRequestsView, CreateSupervisorRequestView, IncomingSupervisorRequestsView, \
     AcceptSupervisorRequestView, RejectSupervisorRequestView, CancelSupervisorRequestView, SupervisorProjectsView, \
     MySupervisorRequestView, LikedProjectsView, LikeToggleView, LeaveTeamView, RemoveTeamMemberView, \
     SupervisorDeleteTeamView, ApproveTeamView, ApprovedTeamsForDeanView, ExportApprovedTeamsExcelView, \
-    ReturnTeamWithCommentView
+    ReturnTeamWithCommentView, StudentRecommendedTeamsView, SupervisorRecommendedTeamsView, ExportJobCreateView, \
+    ExportJobDetailView, ExportJobDownloadView
 
 urlpatterns = [
     path('create/', TeamCreateView.as_view(), name='create-team'),
     path('', TeamListView.as_view(), name='list-teams'),
+    path('catalogue/', TeamCatalogueView.as_view(), name='team-catalogue'),
+    path('recommended/', StudentRecommendedTeamsView.as_view(), name='recommended-teams'),
+    path('recommended/supervisor/', SupervisorRecommendedTeamsView.as_view(), name='supervisor-recommended-teams'),
     path('<int:pk>/', TeamDetailView.as_view(), name='team-detail'),
     path('my-team-join-requests/', MyTeamJoinRequestsView.as_view(), name='my-team-join-requests'),
     path('<int:pk>/join-requests/<int:student_id>/accept/', AcceptJoinRequestView.as_view(),
@@ -37,5 +41,8 @@ urlpatterns = [
     path('<int:pk>/approve/', ApproveTeamView.as_view(), name='approve-team'),
     path('approved/', ApprovedTeamsForDeanView.as_view(), name='approved-teams'),
     path('export-excel/', ExportApprovedTeamsExcelView.as_view(), name='export-approved-teams-excel'),
+    path('export-jobs/', ExportJobCreateView.as_view(), name='export-job-create'),
+    path('export-jobs/<int:pk>/', ExportJobDetailView.as_view(), name='export-job-detail'),
+    path('export-jobs/<int:pk>/download/', ExportJobDownloadView.as_view(), name='export-job-download'),
     path('<int:pk>/return-comment/', ReturnTeamWithCommentView.as_view(), name='return_team_with_comment'),
 ]
@@ -0,0 +1,21 @@
+import codecs
+import csv
+
+from teams.utils.export_excel import iter_approved_teams
+
+
+def write_approved_teams_csv(fileobj, teams=None):
+    """ Same rows as the Excel export, one line per student, written as UTF-8 with BOM for Excel """
+    fileobj.write(codecs.BOM_UTF8)
+    writer = csv.writer(codecs.getwriter("utf-8")(fileobj))
+    writer.writerow(["№", "Студент", "Тема (Каз)", "Тема (Рус)", "Тема (Англ)", "Супервайзер"])
+
+    count = 1
+    for team, members in (iter_approved_teams() if teams is None else teams):
+        supervisor = team.supervisor
+        thesis = team.thesis_topic
+        supervisor_text = f"{supervisor.last_name} {supervisor.first_name}, {supervisor.degree}" if supervisor else ""
+        for last_name, first_name in members:
+            writer.writerow([count, f"{last_name} {first_name}", thesis.title_kz, thesis.title_ru, thesis.title,
+                             supervisor_text])
+            count += 1
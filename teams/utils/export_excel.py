@@ -1,60 +1,116 @@
+import tempfile
+
 import openpyxl
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Font, Alignment
 from openpyxl.utils import get_column_letter
-from django.http import HttpResponse
+from openpyxl.worksheet.cell_range import CellRange
+from django.http import FileResponse
 
-def generate_excel_for_approved_teams(request):
-    from teams.models import Team
-    teams = Team.objects.filter(status="team_approved").prefetch_related("members", "thesis_topic", "supervisor")
+XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+ITERATOR_CHUNK_SIZE = 500
 
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Approved Teams"
 
-    ws.append(["№", "Студент", "Тема", "Супервайзер"])
+def iter_approved_teams():
+    """
+    Yields (team, [(last_name, first_name), ...]) for every approved team.
+
+    Teams and memberships are read with two server-side cursors ordered by team id
+    and merge-joined here, so memory stays flat however many teams there are.
+    """
+    from teams.models import Team, Membership
+    teams = Team.objects.filter(status="team_approved").select_related(
+        "thesis_topic", "supervisor"
+    ).order_by("id").iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+    memberships = Membership.objects.filter(team__status="team_approved").order_by(
+        "team_id", "joined_at", "id"
+    ).values_list(
+        "team_id", "student__last_name", "student__first_name"
+    ).iterator(chunk_size=ITERATOR_CHUNK_SIZE * 4)
+
+    pending = next(memberships, None)
+    for team in teams:
+        while pending is not None and pending[0] < team.id:
+            pending = next(memberships, None)
+        members = []
+        while pending is not None and pending[0] == team.id:
+            members.append(pending[1:])
+            pending = next(memberships, None)
+        yield team, members
+
+
+def write_approved_teams_xlsx(fileobj, teams=None):
+    """
+    Writes the approved teams sheet into `fileobj` using openpyxl's write-only mode.
+    `teams` is an iter_approved_teams() style iterable, read from the database when omitted.
+    """
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet("Approved Teams")
+
+    col_widths = [5, 35, 55, 40]
+    for i, width in enumerate(col_widths, start=1):
+        ws.column_dimensions[get_column_letter(i)].width = width
 
-    bold_font = Font(bold=True)
+    font = Font(name='Calibri')
     wrap = Alignment(wrap_text=True, vertical="top")
 
+    def styled(value):
+        cell = WriteOnlyCell(ws, value=value)
+        cell.font = font
+        cell.alignment = wrap
+        return cell
+
+    ws.append(["№", "Студент", "Тема", "Супервайзер"])
+
     row_num = 2
     count = 1
 
-    for team in teams:
+    for team, members in (iter_approved_teams() if teams is None else teams):
         supervisor = team.supervisor
         thesis = team.thesis_topic
-        members = list(team.members.all())
 
         topic_text = (
             f"Каз: {thesis.title_kz}\n"
             f"Рус: {thesis.title_ru}\n"
             f"Англ: {thesis.title}"
         )
-        supervisor_text = f"{supervisor.last_name} {supervisor.first_name}, {supervisor.degree}"
+        supervisor_text = f"{supervisor.last_name} {supervisor.first_name}, {supervisor.degree}" if supervisor else ""
 
-        for student in members:
-            ws.append([count, f"{student.last_name} {student.first_name}", "", ""])
+        if not members:
+            ws.append(["", "", styled(topic_text), styled(supervisor_text)])
+            row_num += 1
+            continue
+
+        start_merge = row_num
+        for index, (last_name, first_name) in enumerate(members):
+            if index == 0:
+                ws.append([count, f"{last_name} {first_name}", styled(topic_text), styled(supervisor_text)])
+            else:
+                ws.append([count, f"{last_name} {first_name}"])
             row_num += 1
             count += 1
 
-        start_merge = row_num - len(members)
-        end_merge = row_num - 1
-        ws.merge_cells(start_row=start_merge, end_row=end_merge, start_column=3, end_column=3)
-        ws.merge_cells(start_row=start_merge, end_row=end_merge, start_column=4, end_column=4)
+        if len(members) > 1:
+            end_merge = row_num - 1
+            ws.merged_cells.add(CellRange(min_col=3, max_col=3, min_row=start_merge, max_row=end_merge))
+            ws.merged_cells.add(CellRange(min_col=4, max_col=4, min_row=start_merge, max_row=end_merge))
 
-        topic_cell = ws.cell(row=start_merge, column=3, value=topic_text)
-        topic_cell.font = Font(name='Calibri')
-        topic_cell.alignment = wrap
+    wb.save(fileobj)
 
-        supervisor_cell = ws.cell(row=start_merge, column=4, value=supervisor_text)
-        supervisor_cell.font = Font(name='Calibri')
-        supervisor_cell.alignment = wrap
 
-    col_widths = [5, 35, 55, 40]
-    for i, width in enumerate(col_widths, start=1):
-        ws.column_dimensions[get_column_letter(i)].width = width
+def generate_excel_for_approved_teams(request):
+    """ Builds the sheet into a temporary file and streams it back in chunks """
+    tmp = tempfile.TemporaryFile()
+    try:
+        write_approved_teams_xlsx(tmp)
+    except Exception:
+        tmp.close()
+        raise
+    tmp.seek(0)
 
-    response = HttpResponse(content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
-    filename = f"diploma_projects_.xlsx"
-    response["Content-Disposition"] = f'attachment; filename="{filename}"'
-    wb.save(response)
-    return response
\ No newline at end of file
+    return FileResponse(
+        tmp,
+        as_attachment=True,
+        filename="diploma_projects_.xlsx",
+        content_type=XLSX_CONTENT_TYPE,
+    )
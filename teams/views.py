@@ -1,32 +1,44 @@
+from django.db import transaction
+from django.db.models import Count
 from django.shortcuts import get_object_or_404
 from rest_framework import generics, permissions, status
+from rest_framework.exceptions import ValidationError
 
 import teams
 from profiles.models import SupervisorProfile, StudentProfile, DeanOfficeProfile
 from topics.models import ThesisTopic
 from topics.serializers import ThesisTopicSerializer
-from .models import Team, JoinRequest, SupervisorRequest, Like, Membership
-from .serializers import TeamSerializer, JoinRequestSerializer, SupervisorRequestSerializer
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
-from notifications.models import Notification
+from .models import Team, JoinRequest, SupervisorRequest, Like, Membership, ExportJob, MAX_TEAM_MEMBERS
+from .serializers import TeamSerializer, JoinRequestSerializer, SupervisorRequestSerializer, ExportJobSerializer
+from .pagination import TeamCursorPagination
+from .recommendations import team_skill_index
+from notifications.services import send_notification, notify_many
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from users.actor import get_actor
+from users.permissions import IsStudent, IsSupervisor, IsDeanOffice, IsTeamOwner
+from users.throttling import JoinRequestRateThrottle, LikeRateThrottle
 from .utils.export_excel import generate_excel_for_approved_teams
+from .exports import EXPORT_FORMATS, request_export
 from datetime import datetime
-from django.http import HttpResponse
+from functools import wraps
+from django.http import HttpResponse, FileResponse
 
-def send_notification(user, message):
-    """ Sends a notification to a user (DB + WebSocket) """
-    Notification.objects.create(user=user, message=message)
 
-    # Send real-time notification via WebSocket
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(
-        f"user_{user.id}",
-        {"type": "send_notification", "message": message},
-    )
+def atomic_response(handler):
+    """
+    transaction.atomic for a view handler that also rolls back when the handler returns
+    an error response, so a 4xx sent after some writes never commits them
+    """
+    @wraps(handler)
+    def wrapper(*args, **kwargs):
+        with transaction.atomic():
+            response = handler(*args, **kwargs)
+            if response.status_code >= 400:
+                transaction.set_rollback(True)
+        return response
+    return wrapper
 
 
 class TeamCreateView(generics.CreateAPIView):
@@ -38,14 +50,117 @@ class TeamCreateView(generics.CreateAPIView):
 
 class TeamListView(generics.ListAPIView):
     """ Lists all teams. """
-    queryset = Team.objects.all()
+    queryset = Team.objects.for_listing()
+    serializer_class = TeamSerializer
+    permission_classes = [permissions.AllowAny]
+
+
+class TeamCatalogueView(generics.ListAPIView):
+    """
+    Cursor-paginated team list with server-side filters:
+    ?status=open, ?has_supervisor=true|false, ?free_slots=true,
+    ?specialization=<major>, ?skills=1,2,3 (topic requires all of them),
+    ?meets_skill_threshold=true (members cover at least MIN_COVERED_SKILLS required skills)
+    """
     serializer_class = TeamSerializer
+    pagination_class = TeamCursorPagination
     permission_classes = [permissions.AllowAny]
 
+    def get_queryset(self):
+        params = self.request.query_params
+        teams = Team.objects.all()
+
+        status_param = params.get("status")
+        if status_param:
+            teams = teams.filter(status=status_param)
+
+        has_supervisor = params.get("has_supervisor")
+        if has_supervisor is not None:
+            teams = teams.filter(supervisor__isnull=not self._parse_bool("has_supervisor", has_supervisor))
+
+        free_slots = params.get("free_slots")
+        if free_slots is not None and self._parse_bool("free_slots", free_slots):
+            teams = teams.annotate(member_count=Count("members", distinct=True)).filter(
+                member_count__lt=MAX_TEAM_MEMBERS
+            )
+
+        specialization = params.get("specialization")
+        if specialization:
+            teams = teams.filter(
+                id__in=Membership.objects.filter(student__specialization=specialization).values("team_id")
+            )
+
+        meets_skill_threshold = params.get("meets_skill_threshold")
+        if meets_skill_threshold is not None and self._parse_bool("meets_skill_threshold", meets_skill_threshold):
+            teams = teams.meeting_skill_threshold()
+
+        skills = params.get("skills")
+        if skills:
+            try:
+                skill_ids = {int(skill_id) for skill_id in skills.split(",") if skill_id.strip()}
+            except ValueError:
+                raise ValidationError({"skills": "Expected a comma-separated list of skill ids."})
+            for skill_id in skill_ids:
+                teams = teams.filter(thesis_topic__required_skills=skill_id)
+
+        return teams.for_listing()
+
+    @staticmethod
+    def _parse_bool(name, value):
+        value = value.lower()
+        if value in ("true", "1"):
+            return True
+        if value in ("false", "0"):
+            return False
+        raise ValidationError({name: "Expected true or false."})
+
+
+class RecommendedTeamsMixin:
+    """ Ranks teams by overlap between the given skills and the topics' required skills """
+    default_limit = 10
+    max_limit = 50
+
+    def recommend(self, request, skill_ids, for_supervisor):
+        try:
+            limit = min(int(request.query_params.get("limit", self.default_limit)), self.max_limit)
+        except ValueError:
+            return Response({"error": "limit must be an integer."}, status=400)
+
+        ranked = team_skill_index.top_teams(skill_ids, max(limit, 0), for_supervisor=for_supervisor)
+        teams = Team.objects.filter(id__in=[team_id for team_id, _ in ranked]).for_listing().in_bulk()
+
+        data = []
+        for team_id, score in ranked:
+            team = teams.get(team_id)
+            if team is None:
+                continue
+            item = TeamSerializer(team).data
+            item["match_score"] = score
+            data.append(item)
+        return Response(data)
+
+
+class StudentRecommendedTeamsView(RecommendedTeamsMixin, APIView):
+    """ Open teams with free slots, ranked by how many of the student's skills they require """
+    permission_classes = [IsStudent]
+
+    def get(self, request):
+        skill_ids = list(get_actor(request).student.skills.values_list("id", flat=True))
+        return self.recommend(request, skill_ids, for_supervisor=False)
+
+
+class SupervisorRecommendedTeamsView(RecommendedTeamsMixin, APIView):
+    """ Teams without a supervisor, ranked by how many of the supervisor's skills they require """
+    permission_classes = [IsSupervisor]
+
+    def get(self, request):
+        skill_ids = list(get_actor(request).supervisor.skills.values_list("id", flat=True))
+        return self.recommend(request, skill_ids, for_supervisor=True)
+
 
 class TeamDetailView(generics.RetrieveAPIView):
     """ Retrieves a single team. """
-    queryset = Team.objects.all()
+    queryset = Team.objects.for_listing()
     serializer_class = TeamSerializer
     permission_classes = [permissions.AllowAny]
 
@@ -55,21 +170,20 @@ class MyTeamView(APIView):
 
     def get(self, request):
         user = request.user
+        actor = get_actor(request)
 
         # 🧠 Если студент — верни команду, в которой он состоит
-        if hasattr(user, "student_profile"):
-            try:
-                team = Team.objects.get(members=user.student_profile)
-                serializer = TeamSerializer(team)
-                data = serializer.data
-                data['is_owner'] = team.owner == request.user
-                return Response(data)
-            except Team.DoesNotExist:
+        if actor.is_student:
+            team = actor.team
+            if team is None:
                 return Response({"detail": "No team found for student"}, status=404)
+            data = TeamSerializer(team).data
+            data['is_owner'] = actor.owns(team)
+            return Response(data)
 
         # 🧠 Если супервизор — верни все команды, где он является owner
-        elif hasattr(user, "supervisor_profile"):
-            teams = Team.objects.filter(owner=user)
+        elif actor.is_supervisor:
+            teams = Team.objects.filter(owner=user).for_listing()
             if teams.exists():
                 serializer = TeamSerializer(teams, many=True)
                 return Response(serializer.data)
@@ -81,20 +195,17 @@ class MyTeamView(APIView):
 
 class SupervisorProjectsView(APIView):
     """Returns all supervisor's projects"""
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsSupervisor]
 
     def get(self, request):
-        if not hasattr(request.user, "supervisor_profile"):
-            return Response({"error": "Only supervisors can access this."}, status=403)
-
-        supervisor = request.user.supervisor_profile
+        supervisor = get_actor(request).supervisor
 
         # 1. Темы, созданные супервизором
         created_topics = ThesisTopic.objects.filter(created_by_supervisor=supervisor)
         created_topics_data = ThesisTopicSerializer(created_topics, many=True).data
 
         # 2. Команды, где он назначен supervisor
-        supervised_teams = Team.objects.filter(supervisor=supervisor)
+        supervised_teams = Team.objects.filter(supervisor=supervisor).for_listing()
         supervised_teams_data = TeamSerializer(supervised_teams, many=True).data
 
         return Response({
@@ -106,14 +217,10 @@ class SupervisorProjectsView(APIView):
 
 class MyJoinRequestView(APIView):
     """Проверяет, есть ли активная заявка у текущего студента"""
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsStudent]
 
     def get(self, request):
-        user = request.user
-        if not hasattr(user, "student_profile"):
-            return Response({"error": "Only students can check join requests."}, status=403)
-
-        student_profile = user.student_profile
+        student_profile = get_actor(request).student
         join_request = JoinRequest.objects.filter(student=student_profile, status="pending").first()
 
         if join_request:
@@ -128,23 +235,17 @@ class MyJoinRequestView(APIView):
 
 class MyJoinRequestsView(APIView):
     """ Get all join requests of the current student """
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsStudent]
 
     def get(self, request):
-        if not hasattr(request.user, "student_profile"):
-            return Response({"error": "Only students can view this."}, status=403)
-
-        requests = JoinRequest.objects.filter(student=request.user.student_profile)
+        requests = JoinRequest.objects.filter(student=get_actor(request).student)
         serializer = JoinRequestSerializer(requests, many=True)
         return Response(serializer.data)
 
     def delete(self, request, pk):
         """ Cancel join request """
-        if not hasattr(request.user, "student_profile"):
-            return Response({"error": "Only students can cancel."}, status=403)
-
         try:
-            req = JoinRequest.objects.get(pk=pk, student=request.user.student_profile)
+            req = JoinRequest.objects.get(pk=pk, student=get_actor(request).student)
             if req.status != "pending":
                 return Response({"error": "Only pending requests can be canceled."}, status=400)
             req.delete()
@@ -155,19 +256,16 @@ class MyJoinRequestsView(APIView):
 
 class JoinTeamView(APIView):
     """ Позволяет студенту подать заявку и присоединиться к команде """
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsStudent]
+    throttle_classes = [JoinRequestRateThrottle]
 
+    @atomic_response
     def post(self, request, pk):
-        user = request.user
-
-        # Убедиться, что это студент
-        if not hasattr(user, "student_profile"):
-            return Response({"error": "Only students can join teams."}, status=status.HTTP_403_FORBIDDEN)
-
-        student_profile = user.student_profile
+        actor = get_actor(request)
+        student_profile = actor.student
 
         # ✅ 1. Проверка: уже состоит в команде
-        if Team.objects.filter(members=student_profile).exists():
+        if actor.team is not None:
             return Response({"error": "You are already in a team."}, status=status.HTTP_400_BAD_REQUEST)
 
         # ✅ 2. Проверка: есть ли уже PENDING заявка в ЛЮБУЮ команду
@@ -206,15 +304,11 @@ class MyTeamJoinRequestsView(APIView):
 
 
 class MySupervisorRequestView(APIView):
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsStudent]
 
     def get(self, request):
-        if not hasattr(request.user, "student_profile"):
-            return Response({"error": "Only students can view this."}, status=403)
-
-        try:
-            team = Team.objects.get(members=request.user.student_profile)
-        except Team.DoesNotExist:
+        team = get_actor(request).team
+        if team is None:
             return Response({"detail": "No team found."}, status=404)
 
         supervisor_request = SupervisorRequest.objects.filter(team=team).order_by("-created_at").first()
@@ -227,14 +321,14 @@ class MySupervisorRequestView(APIView):
 
 class AcceptJoinRequestView(APIView):
     """ Accept a student into the team """
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsTeamOwner]
 
+    @atomic_response
     def post(self, request, pk, student_id):
         try:
             team = Team.objects.get(pk=pk)
-            if team.owner != request.user:
-                return Response({"error": "Only the owner can accept requests."}, status=403)
-            if team.members.count() >= 4:
+            self.check_object_permissions(request, team)
+            if team.members.count() >= MAX_TEAM_MEMBERS:
                 return Response({"error": "Team is already full."}, status=400)
             join_request = JoinRequest.objects.get(team=team, student_id=student_id, status='pending')
             team.members.add(join_request.student)
@@ -248,13 +342,12 @@ class AcceptJoinRequestView(APIView):
             )
 
             # 💡 Если после добавления в команде уже 4 человека — удаляем все остальные pending заявки
-            if team.members.count() >= 4:
+            if team.members.count() >= MAX_TEAM_MEMBERS:
                 other_requests = JoinRequest.objects.filter(team=team, status="pending").exclude(student=student_id)
-                for req in other_requests:
-                    send_notification(
-                        req.student.user,
-                        f"Your request to join '{team.thesis_topic.title}' was automatically rejected because the team is now full."
-                    )
+                notify_many(
+                    [req.student.user for req in other_requests.select_related("student__user")],
+                    f"Your request to join '{team.thesis_topic.title}' was automatically rejected because the team is now full."
+                )
                 other_requests.delete()
 
             return Response({"message": "Student added to the team."}, status=200)
@@ -265,13 +358,13 @@ class AcceptJoinRequestView(APIView):
 
 class RejectJoinRequestView(APIView):
     """ Reject a student request """
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsTeamOwner]
 
+    @atomic_response
     def post(self, request, pk, student_id):
         try:
             team = Team.objects.get(pk=pk)
-            if team.owner != request.user:
-                return Response({"error": "Only the owner can reject requests."}, status=403)
+            self.check_object_permissions(request, team)
 
             join_request = JoinRequest.objects.get(team=team, student_id=student_id, status='pending')
             join_request.status = 'rejected'
@@ -286,17 +379,14 @@ class RejectJoinRequestView(APIView):
 
 
 class CreateSupervisorRequestView(APIView):
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsStudent]
 
+    @atomic_response
     def post(self, request, supervisor_id):
-        user = request.user
-
-        if not hasattr(user, "student_profile"):
-            return Response({"error": "Only students can send supervisor requests."}, status=403)
+        actor = get_actor(request)
 
-        try:
-            team = Team.objects.get(owner=user)
-        except Team.DoesNotExist:
+        team = actor.team
+        if team is None or not actor.owns(team):
             return Response({"error": "Only team owners can send requests."}, status=403)
 
         # Проверка: уже есть активная заявка?
@@ -311,37 +401,33 @@ class CreateSupervisorRequestView(APIView):
         SupervisorRequest.objects.create(team=team, supervisor=supervisor)
 
         # Уведомление
-        send_notification(supervisor.user, f"{user.student_profile.first_name} requests you as supervisor.")
+        send_notification(supervisor.user, f"{actor.student.first_name} requests you as supervisor.")
 
         return Response({"message": "Request sent."})
 
 
 class IncomingSupervisorRequestsView(APIView):
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsSupervisor]
 
     def get(self, request):
-        if not hasattr(request.user, "supervisor_profile"):
-            return Response({"error": "Only supervisors can see requests."}, status=403)
-
-        requests = SupervisorRequest.objects.filter(supervisor=request.user.supervisor_profile, status='pending')
+        requests = SupervisorRequest.objects.filter(supervisor=get_actor(request).supervisor, status='pending')
         serializer = SupervisorRequestSerializer(requests, many=True)
         return Response(serializer.data)
 
 
 class AcceptSupervisorRequestView(APIView):
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsSupervisor]
 
+    @atomic_response
     def post(self, request, request_id):
-        if not hasattr(request.user, "supervisor_profile"):
-            return Response({"error": "Only supervisors can accept."}, status=403)
-
+        supervisor = get_actor(request).supervisor
         try:
-            req = SupervisorRequest.objects.get(pk=request_id, supervisor=request.user.supervisor_profile)
+            req = SupervisorRequest.objects.get(pk=request_id, supervisor=supervisor)
         except SupervisorRequest.DoesNotExist:
             return Response({"error": "Request not found."}, status=404)
 
         team = req.team
-        team.supervisor = request.user.supervisor_profile
+        team.supervisor = supervisor
         team.owner = request.user
         team.status = 'accepted'
         team.save()
@@ -354,14 +440,12 @@ class AcceptSupervisorRequestView(APIView):
 
 
 class RejectSupervisorRequestView(APIView):
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsSupervisor]
 
+    @atomic_response
     def post(self, request, request_id):
-        if not hasattr(request.user, "supervisor_profile"):
-            return Response({"error": "Only supervisors can reject."}, status=403)
-
         try:
-            req = SupervisorRequest.objects.get(pk=request_id, supervisor=request.user.supervisor_profile)
+            req = SupervisorRequest.objects.get(pk=request_id, supervisor=get_actor(request).supervisor)
         except SupervisorRequest.DoesNotExist:
             return Response({"error": "Request not found."}, status=404)
 
@@ -387,6 +471,7 @@ class CancelSupervisorRequestView(APIView):
 
 class LikeToggleView(APIView):
     permission_classes = [IsAuthenticated]
+    throttle_classes = [LikeRateThrottle]
 
     def post(self, request, team_id):
         user = request.user
@@ -407,28 +492,24 @@ class LikedProjectsView(APIView):
 
     def get(self, request):
         liked_team_ids = Like.objects.filter(user=request.user).values_list("team_id", flat=True)
-        teams = Team.objects.filter(id__in=liked_team_ids)
+        teams = Team.objects.filter(id__in=liked_team_ids).for_listing()
         serializer = TeamSerializer(teams, many=True)
         return Response(serializer.data)
 
 
 class LeaveTeamView(APIView):
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsStudent]
 
+    @atomic_response
     def post(self, request):
-        user = request.user
-
-        if not hasattr(user, 'student_profile'):
-            return Response({"error": "Only students can leave teams."}, status=403)
-
-        student = user.student_profile
+        actor = get_actor(request)
+        student = actor.student
 
-        try:
-            team = Team.objects.get(members=student)
-        except Team.DoesNotExist:
+        team = actor.team
+        if team is None:
             return Response({"error": "You are not in a team."}, status=404)
 
-        was_owner = team.owner == user
+        was_owner = actor.owns(team)
 
         # Удаляем участника
         team.members.remove(student)
@@ -465,21 +546,15 @@ class LeaveTeamView(APIView):
 
 
 class SupervisorDeleteTeamView(APIView):
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsSupervisor]
 
     def delete(self, request, pk):
-        user = request.user
-
-        # Проверка: это точно супервизор?
-        if not hasattr(user, "supervisor_profile"):
-            return Response({"error": "Only supervisors can delete."}, status=403)
-
         try:
             team = Team.objects.get(pk=pk)
         except Team.DoesNotExist:
             return Response({"error": "Team not found."}, status=404)
 
-        if team.supervisor is None or team.supervisor.user != user:
+        if team.supervisor_id != get_actor(request).supervisor.pk:
             return Response({"error": "You are not the supervisor of this team."}, status=403)
 
         if team.members.exists():
@@ -496,6 +571,7 @@ class RemoveTeamMemberView(APIView):
     """ Позволяет owner'у, supervisor'у или сотруднику деканата удалить участника из команды """
     permission_classes = [IsAuthenticated]
 
+    @atomic_response
     def post(self, request, pk, student_id):
         user = request.user
 
@@ -504,9 +580,10 @@ class RemoveTeamMemberView(APIView):
         except Team.DoesNotExist:
             return Response({"error": "Team not found."}, status=404)
 
-        is_owner = team.owner == user
-        is_supervisor = team.supervisor and team.supervisor.user == user
-        is_dean_office = hasattr(user, 'dean_office_profile')  # 👈 добавили
+        actor = get_actor(request)
+        is_owner = actor.owns(team)
+        is_supervisor = actor.is_supervisor and team.supervisor_id == actor.supervisor.pk
+        is_dean_office = actor.dean_office is not None  # 👈 добавили
 
         if not (is_owner or is_supervisor or is_dean_office):  # 👈 обновили
             return Response({"error": "Only the owner, supervisor or dean office can remove members."}, status=403)
@@ -534,21 +611,17 @@ class RemoveTeamMemberView(APIView):
 
 
 class ApproveTeamView(APIView):
-    permission_classes = [permissions.IsAuthenticated]
+    permission_classes = [IsSupervisor]
 
     def post(self, request, pk):
-        user = request.user
-
-        if user.role != "Supervisor" or not hasattr(user, "supervisor_profile"):
-            return Response({"error": "Only supervisors can approve."}, status=403)
-
+        supervisor = get_actor(request).supervisor
         try:
             team = Team.objects.get(pk=pk)
         except Team.DoesNotExist:
             return Response({"error": "Team not found."}, status=404)
 
         try:
-            team.approve_by_supervisor_and_send_to_dean(user.supervisor_profile)
+            team.approve_by_supervisor_and_send_to_dean(supervisor)
             return Response({"success": "Team approved."})
         except Exception as e:
             return Response({"error": str(e)}, status=400)
@@ -562,31 +635,62 @@ class ApprovedTeamsForDeanView(generics.ListAPIView):
         user = self.request.user
         if user.role != "Dean Office":
             return Team.objects.none()
-        return Team.objects.filter(status="team_approved")
+        return Team.objects.filter(status="team_approved").for_listing()
 
 
 class ExportApprovedTeamsExcelView(APIView):
-    permission_classes = [IsAuthenticated]
+    # ✅ Разрешено только деканату
+    permission_classes = [IsDeanOffice]
 
     def get(self, request):
-        user = request.user
-
-        # ✅ Разрешено только деканату
-        if user.role != "Dean Office":
-            return Response({"error": "Only Dean Office can export."}, status=403)
-
         # ✅ Просто передаем request, teams уже внутри собираются
         excel_response = generate_excel_for_approved_teams(request)
         return excel_response
 
+class ExportJobCreateView(APIView):
+    """ Queues a background export of the approved teams, or reuses the file for unchanged data """
+    permission_classes = [IsDeanOffice]
+
+    def post(self, request):
+        export_format = request.data.get("format", "xlsx")
+        if export_format not in EXPORT_FORMATS:
+            return Response({"error": f"Unsupported format. Use one of: {', '.join(EXPORT_FORMATS)}."},
+                            status=400)
+
+        job = request_export(request.user, export_format)
+        return Response(ExportJobSerializer(job).data, status=200 if job.status == "done" else 202)
+
+
+class ExportJobDetailView(APIView):
+    permission_classes = [IsDeanOffice]
+
+    def get(self, request, pk):
+        job = get_object_or_404(ExportJob, pk=pk)
+        return Response(ExportJobSerializer(job).data)
+
+
+class ExportJobDownloadView(APIView):
+    permission_classes = [IsDeanOffice]
+
+    def get(self, request, pk):
+        job = get_object_or_404(ExportJob, pk=pk)
+        if job.status != "done":
+            return Response({"error": "Export is not ready yet.", "status": job.status}, status=409)
+
+        _, content_type = EXPORT_FORMATS[job.format]
+        return FileResponse(
+            job.file.open("rb"),
+            as_attachment=True,
+            filename=f"diploma_projects_.{job.format}",
+            content_type=content_type,
+        )
+
+
 class ReturnTeamWithCommentView(APIView):
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsDeanOffice]
 
+    @atomic_response
     def post(self, request, pk):
-        user = request.user
-        if user.role != "Dean Office":
-            return Response({"error": "Only Dean Office can return projects."}, status=403)
-
         comment = request.data.get("comment", "").strip()
         if not comment:
             return Response({"error": "Return reason is required."}, status=400)
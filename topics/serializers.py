@@ -3,6 +3,7 @@ from rest_framework import serializers
 from profiles.models import Skill
 from profiles.serializers_shared import SkillSerializer
 from teams.models import Team, JoinRequest
+from users.actor import get_actor
 from .models import ThesisTopic
 
 class ThesisTopicSerializer(serializers.ModelSerializer):
@@ -15,26 +16,26 @@ class ThesisTopicSerializer(serializers.ModelSerializer):
     def validate(self, data):
         if self.instance:
             return data
-        user = self.context['request'].user
+        actor = get_actor(self.context['request'])
 
         # ==== STUDENT ====
-        if hasattr(user, 'student_profile'):
+        if actor.is_student:
             #Студент уже создал проект
-            if ThesisTopic.objects.filter(created_by_student=user.student_profile).exists():
+            if ThesisTopic.objects.filter(created_by_student=actor.student).exists():
                 raise serializers.ValidationError("Students can create only one thesis topic.")
 
             #Студент уже в команде
-            if Team.objects.filter(members=user.student_profile).exists():
+            if actor.team is not None:
                 raise serializers.ValidationError("You are already part of a team and cannot create a new one.")
 
             #Студент уже подал заявку
-            if JoinRequest.objects.filter(student=user.student_profile, status='pending').exists():
+            if JoinRequest.objects.filter(student=actor.student, status='pending').exists():
                 raise serializers.ValidationError("You have a pending join request and cannot create a new team.")
 
         # ==== SUPERVISOR ====
-        elif hasattr(user, 'supervisor_profile'):
-            created_topics_count = ThesisTopic.objects.filter(created_by_supervisor=user.supervisor_profile).count()
-            supervised_teams_count = Team.objects.filter(supervisor=user.supervisor_profile).count()
+        elif actor.is_supervisor:
+            created_topics_count = ThesisTopic.objects.filter(created_by_supervisor=actor.supervisor).count()
+            supervised_teams_count = Team.objects.filter(supervisor=actor.supervisor).count()
 
             total = created_topics_count + supervised_teams_count
             if total >= 10:
@@ -47,11 +48,12 @@ class ThesisTopicSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         user = self.context['request'].user
+        actor = get_actor(self.context['request'])
 
-        if hasattr(user, 'student_profile'):
-            validated_data['created_by_student'] = user.student_profile
-        elif hasattr(user, 'supervisor_profile'):
-            validated_data['created_by_supervisor'] = user.supervisor_profile
+        if actor.is_student:
+            validated_data['created_by_student'] = actor.student
+        elif actor.is_supervisor:
+            validated_data['created_by_supervisor'] = actor.supervisor
 
         thesis_topic = super().create(validated_data)
 
@@ -62,11 +64,11 @@ class ThesisTopicSerializer(serializers.ModelSerializer):
             status="open"
         )
 
-        if hasattr(user, 'student_profile'):
-            team.members.add(user.student_profile)
+        if actor.is_student:
+            team.members.add(actor.student)
 
-        if hasattr(user, 'supervisor_profile'):
-            team.supervisor = user.supervisor_profile
+        if actor.is_supervisor:
+            team.supervisor = actor.supervisor
             team.save()
 
         return thesis_topic
\ No newline at end of file
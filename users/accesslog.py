@@ -0,0 +1,83 @@
+"""
+Buffered AccessLog writes, so a login or logout does not wait for its own INSERT.
+
+Entries are kept in memory and written with one bulk_create once MAX_BATCH have
+collected, or by a timer FLUSH_INTERVAL seconds after the first unwritten entry,
+so a quiet worker does not hold them. Whatever is still buffered at interpreter
+exit is written by an atexit hook; a hard kill loses at most FLUSH_INTERVAL of
+entries, which are an audit trail and not needed to serve requests.
+"""
+import atexit
+import logging
+import threading
+import time
+
+from django.db import close_old_connections
+from django.utils import timezone
+
+from users.models import AccessLog
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH = 100
+FLUSH_INTERVAL = 5  # seconds
+
+
+def get_client_ip(request):
+    x_forwarded_for = request.META.get("HTTP_X_FORWARDED_FOR")
+    return x_forwarded_for.split(",")[0] if x_forwarded_for else request.META.get("REMOTE_ADDR")
+
+
+class AccessLogBuffer:
+    def __init__(self, max_batch=MAX_BATCH, flush_interval=FLUSH_INTERVAL):
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self._pending = []
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._timer = None
+
+    def record(self, user, action, request):
+        entry = AccessLog(
+            user_id=user.pk,
+            action=action,
+            ip_address=get_client_ip(request),
+            user_agent=request.META.get("HTTP_USER_AGENT", ""),
+            timestamp=timezone.now(),
+        )
+        with self._lock:
+            self._pending.append(entry)
+            if self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self._flush_on_timer)
+                self._timer.daemon = True
+                self._timer.start()
+        self.flush(force=False)
+
+    def _flush_on_timer(self):
+        try:
+            self.flush()
+        finally:
+            close_old_connections()
+
+    def flush(self, force=True):
+        """ Writes buffered entries with one INSERT; returns how many were written """
+        with self._lock:
+            due = len(self._pending) >= self.max_batch or time.monotonic() - self._last_flush >= self.flush_interval
+            if not self._pending or not (force or due):
+                return 0
+            batch, self._pending = self._pending, []
+            self._last_flush = time.monotonic()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+        try:
+            AccessLog.objects.bulk_create(batch)
+        except Exception:
+            logger.exception("Lost %s access log entr(ies)", len(batch))
+            return 0
+        return len(batch)
+
+
+access_log = AccessLogBuffer()
+atexit.register(access_log.flush)
@@ -0,0 +1,85 @@
+"""
+Who is making the request, resolved once per request.
+
+ActorMiddleware puts a lazy request.actor on every request. It is built on first use,
+after DRF has authenticated the user, and exposes the role and the user's profile
+without the hasattr(user, "student_profile") lookups each view used to repeat. The
+role is a field on the user. The profiles come preloaded with a JWT-authenticated
+user (users.authentication), or are loaded with one select_related query on first
+access otherwise. The student's team is likewise looked up once and then kept for
+the rest of the request.
+"""
+from django.utils.functional import cached_property
+
+from users.authentication import PROFILE_FIELDS, get_cached_user
+from users.models import CustomUser
+
+
+def profiles_loaded(user):
+    """ True when every reverse profile relation is already cached on the instance """
+    return all(getattr(CustomUser, name).is_cached(user) for name in PROFILE_FIELDS)
+
+
+class Actor:
+    def __init__(self, user):
+        self.user = user
+        self.role = getattr(user, "role", None)
+
+    @cached_property
+    def _profiled_user(self):
+        if not self.user.is_authenticated:
+            return None
+        return self.user if profiles_loaded(self.user) else get_cached_user(self.user.pk)
+
+    def _profile(self, name):
+        # select_related caches a missing profile too, so this never queries
+        return getattr(self._profiled_user, name, None)
+
+    @property
+    def student(self):
+        return self._profile("student_profile")
+
+    @property
+    def supervisor(self):
+        return self._profile("supervisor_profile")
+
+    @property
+    def dean_office(self):
+        return self._profile("dean_office_profile")
+
+    @property
+    def is_student(self):
+        return self.student is not None
+
+    @property
+    def is_supervisor(self):
+        return self.supervisor is not None
+
+    @property
+    def is_dean_office(self):
+        return self.role == "Dean Office"
+
+    @property
+    def profile(self):
+        return self.student or self.supervisor or self.dean_office
+
+    @cached_property
+    def team(self):
+        """ The team the student is a member of, or None """
+        from teams.models import Team
+
+        if self.student is None:
+            return None
+        return Team.objects.filter(members=self.student).first()
+
+    def owns(self, team):
+        return team.owner_id == self.user.pk
+
+
+def get_actor(request):
+    """ request.actor, or a new Actor when ActorMiddleware did not run (e.g. APIRequestFactory) """
+    actor = getattr(request, "actor", None)
+    if actor is None:
+        actor = Actor(request.user)
+        request.actor = actor
+    return actor
@@ -0,0 +1,128 @@
+"""
+JWT authentication that resolves the user from the cache instead of the database.
+
+What is cached, keyed by user id for USER_CACHE_TIMEOUT seconds, is a small projection:
+the user fields authentication and the views read (USER_FIELDS), an MD5 of the password
+hash for the token revoke check, and the displayed fields of the role profile
+(PROFILE_FIELD_NAMES). The password hash and the login-state fields are never cached.
+The user is rebuilt from the projection as a model instance with every other field
+deferred, so reading one of those fields loads it from the database and save() writes
+only the loaded fields. users.signals drops the entry when the user or one of their
+profiles is saved or deleted, so a blocked or deactivated user is rejected on their
+next request; code that changes USER_FIELDS with queryset.update() must call
+invalidate_cached_user itself.
+"""
+import logging
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from users.models import CustomUser
+
+logger = logging.getLogger(__name__)
+
+USER_CACHE_TIMEOUT = 300
+PROFILE_FIELDS = ("student_profile", "supervisor_profile", "dean_office_profile")
+USER_FIELDS = ("id", "email", "role", "is_active", "is_staff", "is_superuser", "is_profile_completed")
+PROFILE_FIELD_NAMES = ("user_id", "first_name", "last_name", "photo")
+
+
+def user_cache_key(user_id):
+    return f"auth_user:{user_id}"
+
+
+def field_order(model, names):
+    """ names in the model's field order, which is the order from_db expects values in """
+    return tuple(field.attname for field in model._meta.concrete_fields if field.attname in names)
+
+
+def project_user(user):
+    """ The cacheable part of a user loaded with select_related(*PROFILE_FIELDS) """
+    profiles = {}
+    for name in PROFILE_FIELDS:
+        profile = getattr(user, name, None)
+        profiles[name] = None if profile is None else [
+            getattr(profile, field).name if field == "photo" else getattr(profile, field)
+            for field in field_order(type(profile), PROFILE_FIELD_NAMES)
+        ]
+    return {
+        "user": [getattr(user, field) for field in field_order(CustomUser, USER_FIELDS)],
+        "password_md5": get_md5_hash_password(user.password),
+        "profiles": profiles,
+    }
+
+
+def user_from_projection(projection):
+    """ A CustomUser with the projected fields loaded, everything else deferred """
+    db = CustomUser.objects.db
+    user = CustomUser.from_db(db, field_order(CustomUser, USER_FIELDS), projection["user"])
+    user.password_md5 = projection["password_md5"]
+    for name, values in projection["profiles"].items():
+        related = getattr(CustomUser, name).related
+        profile = None
+        if values is not None:
+            model = related.related_model
+            profile = model.from_db(db, field_order(model, PROFILE_FIELD_NAMES), values)
+            related.field.set_cached_value(profile, user)
+        related.set_cached_value(user, profile)
+    return user
+
+
+def get_cached_user(user_id):
+    """ The user with their profile preloaded; raises CustomUser.DoesNotExist """
+    key = user_cache_key(user_id)
+    try:
+        projection = cache.get(key)
+    except Exception:
+        logger.exception("Auth user cache unavailable")
+        projection = None
+    if projection is not None:
+        return user_from_projection(projection)
+
+    user = CustomUser.objects.select_related(*PROFILE_FIELDS).get(**{api_settings.USER_ID_FIELD: user_id})
+    user.password_md5 = get_md5_hash_password(user.password)
+    try:
+        cache.set(key, project_user(user), USER_CACHE_TIMEOUT)
+    except Exception:
+        logger.exception("Auth user cache unavailable")
+    return user
+
+
+def invalidate_cached_user(user_id):
+    """ Drops the entry now and again after commit, so a concurrent request cannot re-cache old data """
+    def drop():
+        try:
+            cache.delete(user_cache_key(user_id))
+        except Exception:
+            logger.exception("Auth user cache unavailable")
+    drop()
+    transaction.on_commit(drop)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """ JWTAuthentication with get_user served from the cache; used for HTTP and WebSocket """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        try:
+            user = get_cached_user(user_id)
+        except CustomUser.DoesNotExist:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != user.password_md5:
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        return user
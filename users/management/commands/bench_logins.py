@@ -0,0 +1,61 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory
+
+from users.accesslog import access_log
+from users.models import AccessLog, CustomUser
+from users.views import CustomTokenObtainPairView
+
+WRITES = ("INSERT", "UPDATE", "DELETE")
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures login throughput and the queries and writes each successful login makes. "
+        "Uses throwaway users that are deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--logins", type=int, default=500)
+        parser.add_argument("--users", type=int, default=20)
+
+    def handle(self, *args, **options):
+        tag = uuid.uuid4().hex[:8]
+        password = uuid.uuid4().hex
+        users = [
+            CustomUser.objects.create_user(email=f"bench-{tag}-{i}@example.com", password=password, role="Student")
+            for i in range(options["users"])
+        ]
+        factory = APIRequestFactory()
+        view = CustomTokenObtainPairView.as_view()
+        try:
+            failed = 0
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                for n in range(options["logins"]):
+                    request = factory.post(
+                        "/api/users/login/",
+                        {"email": users[n % len(users)].email, "password": password},
+                        format="json",
+                        REMOTE_ADDR=f"10.0.{n // 250 % 250}.{n % 250 + 1}",
+                    )
+                    if view(request).status_code != 200:
+                        failed += 1
+                elapsed = time.perf_counter() - started
+            access_log.flush()
+
+            logins = options["logins"]
+            statements = [query["sql"].lstrip().upper() for query in queries.captured_queries]
+            writes = sum(statement.startswith(WRITES) for statement in statements)
+            self.stdout.write(f"{logins} logins in {elapsed:.2f}s ({logins / elapsed:.0f}/s), {failed} failed")
+            self.stdout.write(
+                f"per login: {len(statements) / logins:.2f} queries, {writes / logins:.2f} writes "
+                f"(access log inserts are batched)"
+            )
+        finally:
+            AccessLog.objects.filter(user__in=users).delete()
+            CustomUser.objects.filter(id__in=[user.id for user in users]).delete()
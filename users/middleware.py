@@ -0,0 +1,17 @@
+from django.utils.functional import SimpleLazyObject
+
+from users.actor import Actor
+
+
+class ActorMiddleware:
+    """
+    Adds a lazy request.actor. It is evaluated on first access, by which time DRF has
+    authenticated the request and set the user on the underlying HttpRequest.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.actor = SimpleLazyObject(lambda: Actor(request.user))
+        return self.get_response(request)
@@ -3,6 +3,10 @@ from django.db import models
 from profiles.models import StudentProfile, SupervisorProfile, DeanOfficeProfile
 from django.utils import timezone
 
+# Written by a login attempt, always with save(update_fields=LOGIN_STATE_FIELDS)
+LOGIN_STATE_FIELDS = ["failed_login_attempts", "blocked_until", "block_duration", "last_failed_login", "last_login_ip"]
+
+
 class CustomUserManager(BaseUserManager):
     def create_user(self, email, password=None, **extra_fields):
         if not email:
@@ -46,6 +50,11 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
 
+        # A partial save that leaves the role alone cannot need a new profile
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "role" not in update_fields:
+            return
+
         if self.role == "Student" and not hasattr(self, "student_profile"):
             StudentProfile.objects.get_or_create(user=self)
         elif self.role == "Supervisor" and not hasattr(self, "supervisor_profile"):
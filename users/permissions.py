@@ -0,0 +1,45 @@
+"""
+Role and ownership checks for DRF views, read from request.actor (users.actor).
+
+Denials keep the {"error": ...} body the views return themselves.
+"""
+from rest_framework.permissions import BasePermission
+
+from users.actor import get_actor
+
+
+class IsStudent(BasePermission):
+    message = {"error": "Only students can do this."}
+
+    def has_permission(self, request, view):
+        return bool(request.user and request.user.is_authenticated and get_actor(request).is_student)
+
+
+class IsSupervisor(BasePermission):
+    """ The Supervisor role and a supervisor profile; the role is checked first and costs no query """
+    message = {"error": "Only supervisors can do this."}
+
+    def has_permission(self, request, view):
+        if not (request.user and request.user.is_authenticated):
+            return False
+        actor = get_actor(request)
+        return actor.role == "Supervisor" and actor.is_supervisor
+
+
+class IsDeanOffice(BasePermission):
+    message = {"error": "Only Dean Office can do this."}
+
+    def has_permission(self, request, view):
+        return bool(request.user and request.user.is_authenticated and get_actor(request).is_dean_office)
+
+
+class IsTeamOwner(BasePermission):
+    """ Object-level: the team (or the object's team) belongs to the user """
+    message = {"error": "Only the team owner can do this."}
+
+    def has_permission(self, request, view):
+        return bool(request.user and request.user.is_authenticated)
+
+    def has_object_permission(self, request, view, obj):
+        team = getattr(obj, "team", obj)
+        return get_actor(request).owns(team)
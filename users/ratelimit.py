@@ -0,0 +1,113 @@
+"""
+Sliding-window rate limiting on atomic counters.
+
+Each (scope, identity) pair has one counter per fixed window of `period` seconds.
+A hit increments the current window's counter atomically (add, then incr: SET NX
+and INCR on Redis) and reads the previous window's. The request rate is estimated
+as the previous count weighted by how much of it still overlaps the sliding window,
+plus the current count. That is two cache operations per hit whatever the limit,
+with no read-modify-write races between workers. Rejected hits are counted as
+well, so a client that keeps hammering stays limited.
+
+CacheBackend uses a Django cache (Redis in production); MemoryBackend keeps the
+counters in this process and is meant for tests. If the cache is unavailable the
+limiter lets requests through rather than taking the site down with it.
+"""
+import logging
+import re
+import threading
+import time
+
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {"s": 1, "m": 60, "h": 60 * 60, "d": 60 * 60 * 24}
+
+
+def parse_rate(rate):
+    """ "5/min" -> (5, 60); the same format as DRF's DEFAULT_THROTTLE_RATES """
+    match = re.fullmatch(r"\s*(\d+)\s*/\s*([smhd])[a-z]*\s*", rate or "")
+    if match is None:
+        raise ValueError(f"Invalid rate: {rate!r}")
+    return int(match.group(1)), PERIODS[match.group(2)]
+
+
+class CacheBackend:
+    def __init__(self, cache_alias="default"):
+        self.cache_alias = cache_alias
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def incr(self, key, ttl):
+        """ Atomically increments key, creating it with the ttl; returns the new value """
+        if self.cache.add(key, 1, timeout=ttl):
+            return 1
+        try:
+            return self.cache.incr(key)
+        except ValueError:
+            # Expired between add and incr
+            self.cache.set(key, 1, timeout=ttl)
+            return 1
+
+    def get(self, key):
+        return self.cache.get(key, 0)
+
+
+class MemoryBackend:
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def incr(self, key, ttl):
+        now = self.clock()
+        with self._lock:
+            value, expires_at = self._counters.get(key, (0, 0))
+            if expires_at <= now:
+                value, expires_at = 0, now + ttl
+            self._counters[key] = (value + 1, expires_at)
+            return value + 1
+
+    def get(self, key):
+        with self._lock:
+            value, expires_at = self._counters.get(key, (0, 0))
+            return value if expires_at > self.clock() else 0
+
+
+class SlidingWindowLimiter:
+    def __init__(self, backend=None, clock=time.time):
+        self.backend = backend or CacheBackend()
+        self.clock = clock
+
+    @staticmethod
+    def key(scope, ident, window):
+        return f"ratelimit:{scope}:{ident}:{window}"
+
+    def hit(self, scope, ident, limit, period):
+        """
+        Counts one request. Returns (allowed, retry_after), where retry_after is the number
+        of seconds until the current window ends (None when allowed).
+        """
+        now = self.clock()
+        window, into_window = divmod(now, period)
+        try:
+            current = self.backend.incr(self.key(scope, ident, int(window)), 2 * period)
+            previous = self.backend.get(self.key(scope, ident, int(window) - 1))
+        except Exception:
+            logger.exception("Rate limit backend unavailable, allowing %s for %s", scope, ident)
+            return True, None
+
+        estimated = previous * (1 - into_window / period) + current
+        if estimated <= limit:
+            return True, None
+        return False, period - into_window
+
+    def count(self, key, ttl):
+        """ A plain atomic counter with a TTL, e.g. for failed attempts """
+        return self.backend.incr(key, ttl)
+
+
+limiter = SlidingWindowLimiter()
@@ -7,7 +7,9 @@ from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from django.db import transaction
 from rest_framework.exceptions import AuthenticationFailed
 from django.utils import timezone
-from users.models import CustomUser
+from users.accesslog import get_client_ip
+from users.models import CustomUser, LOGIN_STATE_FIELDS
+from users.ratelimit import limiter
 from profiles.models import StudentProfile, SupervisorProfile, DeanOfficeProfile
 import logging
 
@@ -43,8 +45,7 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
             user = CustomUser.objects.get(email=email)
         except CustomUser.DoesNotExist:
             # Увеличиваем попытки по IP даже при неверном email
-            cache.incr(cache_key)
-            cache.expire(cache_key, 600)  # 10 мин
+            limiter.count(cache_key, 600)  # 10 мин
             raise AuthenticationFailed("Invalid credentials")
 
         # 3. Проверка блокировки пользователя
@@ -52,11 +53,10 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
             remaining = (user.blocked_until - now).seconds // 60
             raise AuthenticationFailed(f"Account is temporarily blocked. Try again in {remaining} minute(s).")
 
-        # 4. Сброс старых попыток (если больше 10 мин прошло)
+        # 4. Сброс старых попыток (если больше 10 мин прошло); сохраняется вместе с результатом ниже
         if user.last_failed_login and now - user.last_failed_login > timedelta(minutes=10):
             user.failed_login_attempts = 0
             user.block_duration = 5
-            user.save()
 
         # 5. Проверка пароля
         if not user.check_password(password):
@@ -64,9 +64,8 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
             if user.last_failed_login and (now - user.last_failed_login).total_seconds() < 1:
                 raise AuthenticationFailed("Too many login attempts. Please wait a moment.")
 
-            # IP-блокировка
-            ip_attempts = cache.get(cache_key, 0) + 1
-            cache.set(cache_key, ip_attempts, timeout=600)  # сброс через 10 минут
+            # IP-блокировка; счётчик атомарный, сброс через 10 минут после первой ошибки
+            ip_attempts = limiter.count(cache_key, 600)
 
             if ip_attempts >= 5:
                 cache.set(cache_block_key, True, timeout=900)  # блок IP на 15 минут
@@ -82,28 +81,33 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
                 user.block_duration = min(user.block_duration + 5, 30)
                 user.failed_login_attempts = 0
                 user.last_failed_login = None
-                user.save()
+                user.save(update_fields=LOGIN_STATE_FIELDS)
                 raise AuthenticationFailed({
                     "detail": "Account is temporarily blocked. Try again in a few minutes.",
                     "blocked": True,
                     "blocked_until": user.blocked_until,
                 })
 
-            user.save()
+            user.save(update_fields=LOGIN_STATE_FIELDS)
             attempts_left = 3 - user.failed_login_attempts
             raise AuthenticationFailed(f"Incorrect password. Attempts left: {attempts_left}")
 
-        # 6. Успешный вход — всё сбрасываем
-        cache.delete(cache_key)
-        cache.delete(cache_block_key)
+        data = super().validate(attrs)
 
+        # 6. Успешный вход — всё сбрасываем одним UPDATE
+        cache.delete_many([cache_key, cache_block_key])
+
+        client_ip = get_client_ip(request)
+        if user.last_login_ip != client_ip:
+            logger.warning(f"🕵️ New login IP detected: {client_ip} for {email}")
         user.failed_login_attempts = 0
         user.blocked_until = None
         user.block_duration = 5
         user.last_failed_login = None
-        user.save()
+        user.last_login_ip = client_ip
+        user.save(update_fields=LOGIN_STATE_FIELDS)
 
-        return super().validate(attrs)
+        return data
 
 
 class UserRegistrationSerializer(serializers.ModelSerializer):
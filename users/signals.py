@@ -1,7 +1,12 @@
 import logging
 from django.contrib.auth.signals import user_logged_in, user_logged_out
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
+from profiles.models import DeanOfficeProfile, StudentProfile, SupervisorProfile
+from users.authentication import invalidate_cached_user
+from users.models import CustomUser
+
 logger = logging.getLogger(__name__)
 
 @receiver(user_logged_in)
@@ -14,6 +19,19 @@ def log_logout(sender, request, user, **kwargs):
     ip = get_client_ip(request)
     logger.info(f"Выход: {user.username} (IP: {ip})")
 
+@receiver([post_save, post_delete], sender=CustomUser)
+def drop_cached_user(sender, instance, **kwargs):
+    """ Authentication serves users from the cache; any change must be seen on the next request """
+    invalidate_cached_user(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=StudentProfile)
+@receiver([post_save, post_delete], sender=SupervisorProfile)
+@receiver([post_save, post_delete], sender=DeanOfficeProfile)
+def drop_cached_profile_user(sender, instance, **kwargs):
+    invalidate_cached_user(instance.user_id)
+
+
 def get_client_ip(request):
     x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
     return x_forwarded_for.split(',')[0] if x_forwarded_for else request.META.get('REMOTE_ADDR')
@@ -1,3 +1,152 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test import RequestFactory, TestCase, SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from users.accesslog import AccessLogBuffer, access_log
+from users.authentication import user_cache_key, user_from_projection
+from users.models import AccessLog, CustomUser
+from users.ratelimit import MemoryBackend, SlidingWindowLimiter, parse_rate
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(email="student@example.com", password="pass12345", role="Student")
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+
+    def test_repeat_requests_resolve_the_user_without_queries(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get("/api/users/me/").status_code, 200)
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/users/me/")
+        self.assertEqual(response.data["email"], self.user.email)
+
+    def test_cache_holds_a_projection_without_the_password(self):
+        self.client.get("/api/users/me/")
+        projection = cache.get(user_cache_key(self.user.id))
+        self.assertNotIn(self.user.password, repr(projection))
+        self.assertNotIn("failed_login_attempts", repr(projection))
+
+        user = user_from_projection(projection)
+        self.assertEqual((user.email, user.role), (self.user.email, "Student"))
+        self.assertEqual(user.student_profile.user, user)
+        # Deferred fields are not written back
+        user.save()
+        user.refresh_from_db()
+        self.assertTrue(user.check_password("pass12345"))
+
+    def test_saving_the_user_or_profile_invalidates_the_entry(self):
+        self.client.get("/api/users/me/")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.student_profile.first_name = "Aruzhan"
+            self.user.student_profile.save()
+        with self.assertNumQueries(1):
+            self.client.get("/api/users/me/")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(self.client.get("/api/users/me/").status_code, 401)
+
+
+class LoginWriteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(email="student@example.com", password="pass12345", role="Student")
+
+    def setUp(self):
+        cache.clear()
+        access_log.flush()
+        # Write what the test leaves behind inside the test transaction, not from the timer thread
+        self.addCleanup(access_log.flush)
+
+    def login(self, password):
+        with CaptureQueriesContext(connection) as queries:
+            response = APIClient().post(
+                "/api/users/login/", {"email": self.user.email, "password": password}, REMOTE_ADDR="10.0.0.1"
+            )
+        writes = [q["sql"] for q in queries.captured_queries if q["sql"].startswith(("INSERT", "UPDATE", "DELETE"))]
+        return response, writes
+
+    def test_successful_login_is_one_update_and_a_buffered_log_entry(self):
+        with mock.patch.object(access_log, "flush_interval", 60 * 60):
+            response, writes = self.login("pass12345")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("access", response.data)
+        self.assertEqual(len(writes), 1)
+        self.assertTrue(writes[0].startswith("UPDATE"))
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.last_login_ip, "10.0.0.1")
+        self.assertFalse(AccessLog.objects.exists())
+        self.assertEqual(access_log.flush(), 1)
+        self.assertEqual(AccessLog.objects.get().action, "login")
+
+    def test_timer_flushes_a_quiet_buffer(self):
+        buffer = AccessLogBuffer(flush_interval=0.01)
+        with mock.patch.object(buffer, "flush") as flush:
+            buffer.record(self.user, "login", RequestFactory().get("/"))
+            buffer._timer.join(timeout=5)
+        flush.assert_called_with()
+
+    def test_failed_login_is_one_update(self):
+        response, writes = self.login("wrong")
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(len(writes), 1)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.failed_login_attempts, 1)
+
+
+class SlidingWindowLimiterTests(SimpleTestCase):
+    def test_window_slides_over_the_previous_period(self):
+        now = [1000.0]
+        limiter = SlidingWindowLimiter(MemoryBackend(clock=lambda: now[0]), clock=lambda: now[0])
+
+        self.assertEqual([limiter.hit("s", "a", 3, 10)[0] for _ in range(3)], [True, True, True])
+        self.assertEqual(limiter.hit("s", "a", 3, 10), (False, 10.0))
+        self.assertTrue(limiter.hit("s", "b", 3, 10)[0])
+
+        # Half-way into the next window 4 * 0.5 earlier hits still count
+        now[0] = 1015.0
+        self.assertEqual(limiter.hit("s", "a", 3, 10), (True, None))
+        self.assertFalse(limiter.hit("s", "a", 3, 10)[0])
+
+        now[0] = 1030.0
+        self.assertTrue(limiter.hit("s", "a", 3, 10)[0])
+
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate("5/min"), (5, 60))
+        self.assertEqual(parse_rate("100/hour"), (100, 3600))
+        with self.assertRaises(ValueError):
+            parse_rate("often")
+
+
+@override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, "DEFAULT_THROTTLE_RATES": {"login": "2/min"}})
+class LoginThrottleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def login(self, email):
+        return APIClient().post("/api/users/login/", {"email": email, "password": "x"}, REMOTE_ADDR="10.0.0.2")
+
+    def test_unknown_email_counts_failures_without_errors(self):
+        self.assertEqual(self.login("nobody@example.com").status_code, 401)
+        self.assertEqual(cache.get("login_attempts:10.0.0.2"), 1)
+
+    def test_rejected_before_any_query(self):
+        self.login("nobody@example.com")
+        self.login("nobody@example.com")
+        with self.assertNumQueries(0):
+            response = self.login("nobody@example.com")
+        self.assertEqual(response.status_code, 429)
+        self.assertIn("Retry-After", response)
@@ -0,0 +1,70 @@
+"""
+DRF throttles on the sliding-window limiter (users.ratelimit).
+
+Rates come from REST_FRAMEWORK["DEFAULT_THROTTLE_RATES"] under each throttle's scope.
+Throttles run before the view, so a rejected request costs two cache operations
+and no database or password-hash work. Anonymous clients are keyed by IP,
+authenticated users by id.
+"""
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from users.ratelimit import limiter, parse_rate
+
+
+class SlidingWindowThrottle(BaseThrottle):
+    scope = None
+    by_ip = False
+
+    def __init__(self):
+        self.retry_after = None
+
+    def get_rate(self):
+        return api_settings.DEFAULT_THROTTLE_RATES.get(self.scope)
+
+    @staticmethod
+    def user_ident(user_id):
+        return f"user:{user_id}"
+
+    def get_cache_ident(self, request):
+        if not self.by_ip and request.user and request.user.is_authenticated:
+            return self.user_ident(request.user.pk)
+        return f"ip:{self.get_ident(request)}"
+
+    def hit(self, ident):
+        """ Counts one request for ident; False when it is over the rate """
+        rate = self.get_rate()
+        if not rate:
+            return True
+        limit, period = parse_rate(rate)
+        allowed, self.retry_after = limiter.hit(self.scope, ident, limit, period)
+        return allowed
+
+    def allow_request(self, request, view):
+        return self.hit(self.get_cache_ident(request))
+
+    def wait(self):
+        return self.retry_after
+
+
+class LoginRateThrottle(SlidingWindowThrottle):
+    scope = "login"
+    by_ip = True
+
+
+class PasswordResetRateThrottle(SlidingWindowThrottle):
+    scope = "password_reset"
+    by_ip = True
+
+
+class JoinRequestRateThrottle(SlidingWindowThrottle):
+    scope = "join_request"
+
+
+class LikeRateThrottle(SlidingWindowThrottle):
+    scope = "like"
+
+
+class ChatMessageRateThrottle(SlidingWindowThrottle):
+    """ Also applied to messages sent over WebSockets (chat.consumers.message_retry_after) """
+    scope = "chat_message"
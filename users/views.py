@@ -4,13 +4,15 @@ from django.contrib.auth import get_user_model
 from django.contrib.auth.tokens import default_token_generator
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes
-from django.core.mail import send_mail
 from django.conf import settings
-from .models import AccessLog
+from notifications.mailqueue import queue_email
+from .accesslog import access_log, get_client_ip
+from .throttling import LoginRateThrottle, PasswordResetRateThrottle
 from rest_framework import generics, status
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.views import APIView
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
 from rest_framework_simplejwt.views import TokenObtainPairView
 from datetime import timedelta
 from django.utils import timezone
@@ -25,46 +27,28 @@ User = get_user_model()
 logger = logging.getLogger(__name__)
 
 
-def get_client_ip(request):
-    x_forwarded_for = request.META.get("HTTP_X_FORWARDED_FOR")
-    return x_forwarded_for.split(",")[0] if x_forwarded_for else request.META.get("REMOTE_ADDR")
-
-
 class CustomTokenObtainPairView(TokenObtainPairView):
     serializer_class = CustomTokenObtainPairSerializer
+    throttle_classes = [LoginRateThrottle]
 
     def post(self, request, *args, **kwargs):
         email = request.data.get("email", "")
         ip = get_client_ip(request)
 
+        serializer = self.get_serializer(data=request.data)
         try:
-            response = super().post(request, *args, **kwargs)
-
-            if response.status_code == 200:
-                user = User.objects.get(email=email)
-
-                # IP-логика
-                if user.last_login_ip != ip:
-                    logger.warning(f"🕵️ New login IP detected: {ip} for {email}")
-                user.last_login_ip = ip
-
-                # Сброс безопасный, но не обязателен — уже делается в validate()
-                user.save()
-
-                logger.info(f"✅ JWT Login: {email} (IP: {ip})")
-                AccessLog.objects.create(
-                    user=user,
-                    action="login",
-                    ip_address=ip,
-                    user_agent=request.META.get("HTTP_USER_AGENT", ""),
-                )
-
-            return response
-
+            serializer.is_valid(raise_exception=True)
+        except TokenError as e:
+            raise InvalidToken(e.args[0])
         except AuthenticationFailed as e:
             logger.warning(f"❌ Failed login: {email} (IP: {ip}) — {str(e)}")
             raise
 
+        # Login state, including the IP, is saved by the serializer; the log entry is buffered
+        logger.info(f"✅ JWT Login: {email} (IP: {ip})")
+        access_log.record(serializer.user, "login", request)
+        return Response(serializer.validated_data, status=status.HTTP_200_OK)
+
 
 class CustomTokenRefreshView(TokenRefreshView):
     def post(self, request, *args, **kwargs):
@@ -83,12 +67,7 @@ class ManualLogoutView(APIView):
         user = request.user
         ip = get_client_ip(request)
         logger.info(f"JWT-выход: {user.email} (IP: {ip})")
-        AccessLog.objects.create(
-            user=user,
-            action='logout',
-            ip_address=ip,
-            user_agent=request.META.get('HTTP_USER_AGENT', '')
-        )
+        access_log.record(user, "logout", request)
         return Response({"message": "Logout logged"})
 
 
@@ -124,6 +103,7 @@ class UserDetailView(generics.RetrieveAPIView):
 class PasswordResetRequestView(generics.GenericAPIView):
     serializer_class = PasswordResetRequestSerializer
     permission_classes = [AllowAny]
+    throttle_classes = [PasswordResetRateThrottle]
 
     def post(self, request):
         serializer = self.get_serializer(data=request.data)
@@ -139,24 +119,20 @@ class PasswordResetRequestView(generics.GenericAPIView):
         uid = urlsafe_base64_encode(force_bytes(user.pk))
         reset_url = f"{settings.FRONTEND_URL}/reset-password/{uid}/{token}/"
 
-        try:
-            send_mail(
-                subject="Password Reset Request",
-                message=f"Click the link to reset your password: {reset_url}",
-                from_email=settings.EMAIL_HOST_USER,
-                recipient_list=[email],
-                fail_silently=False,
-            )
-            logger.info(f"Отправлен email сброса пароля пользователю: {user.email}")
-            return Response({"message": "If your email is registered, you will receive a password reset link."})
-        except Exception as e:
-            logger.error("Ошибка при отправке письма для сброса пароля: %s", e)
-            return Response({"error": f"Failed to send email: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        # Sent by the send_queued_email worker, so the request does not wait on SMTP
+        queue_email(
+            subject="Password Reset Request",
+            body=f"Click the link to reset your password: {reset_url}",
+            to=[email],
+        )
+        logger.info(f"Email сброса пароля поставлен в очередь: {user.email}")
+        return Response({"message": "If your email is registered, you will receive a password reset link."})
 
 
 class PasswordResetConfirmView(generics.GenericAPIView):
     serializer_class = PasswordResetConfirmSerializer
     permission_classes = [AllowAny]
+    throttle_classes = [PasswordResetRateThrottle]
 
     def put(self, request, uidb64, token):
         try: